@@ -0,0 +1,450 @@
+"""
+Synthetic inputs for the benchmarks.
+
+Every fixture is generated from a seed, so two runs of the same scale read the same data.
+The files follow the layouts read by the pipeline: ERA5 monthly netCDF files, station key
+parquets, raw weather station parquets and GOES-16 channel files.
+"""
+
+import os
+from pathlib import Path
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+ERA5_PRESSURE_LEVELS = [1000, 700, 200]
+ERA5_PRESSURE_VARIABLES = ["r", "t", "u", "v", "w"]
+# month read by SpatioTemporalFeatures to get the grid
+ERA5_GRID_MONTH = (2009, 6)
+
+GOES16_CHANNELS = ["C07", "C08", "C09", "C11", "C13", "C14", "C15"]
+GOES16_MINUTES = [0, 10, 20, 30, 40, 50]
+
+
+def get_era5_grid(
+    grid_size: int, resolution: float = 0.25
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Latitudes (descending, as in the ERA5 files) and longitudes (ascending) around Rio de Janeiro
+    """
+    lats = np.round(-22.0 - resolution * np.arange(grid_size), 2)
+    lons = np.round(-44.0 + resolution * np.arange(grid_size), 2)
+    return lats, lons
+
+
+def _write_era5_month(
+    root: Path,
+    year: int,
+    month: int,
+    hours: pd.DatetimeIndex,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    rng: np.random.Generator,
+) -> None:
+    coords = {"valid_time": hours, "latitude": lats, "longitude": lons}
+    shape = (len(hours), len(lats), len(lons))
+
+    single_levels = xr.Dataset(
+        {
+            "tp": (
+                ("valid_time", "latitude", "longitude"),
+                rng.gamma(0.3, 0.002, size=shape).astype(np.float32),
+            )
+        },
+        coords=coords,
+    )
+    single_levels.to_netcdf(
+        root / "ERA5-single-levels" / "monthly_data" / f"RJ_{year}_{month}.nc"
+    )
+
+    pressure_shape = (len(hours), len(ERA5_PRESSURE_LEVELS), len(lats), len(lons))
+    pressure_levels = xr.Dataset(
+        {
+            variable: (
+                ("valid_time", "pressure_level", "latitude", "longitude"),
+                rng.normal(size=pressure_shape).astype(np.float32),
+            )
+            for variable in ERA5_PRESSURE_VARIABLES
+        },
+        coords={**coords, "pressure_level": ERA5_PRESSURE_LEVELS},
+    )
+    pressure_levels.to_netcdf(
+        root / "ERA5-pressure-levels" / "monthly_data" / f"RJ_{year}_{month}.nc"
+    )
+
+
+def write_era5(
+    root: Path,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    grid_size: int,
+    seed: int = 0,
+) -> tuple[Path, Path]:
+    """
+    Writes ERA5-single-levels/monthly_data/RJ_{year}_{month}.nc and the pressure levels
+    counterparts for every month between start_date and end_date (whole months), plus the
+    month used to read the grid.
+
+    Returns the single levels and pressure levels folders.
+    """
+    rng = np.random.default_rng(seed)
+    lats, lons = get_era5_grid(grid_size)
+    for folder in ("ERA5-single-levels", "ERA5-pressure-levels"):
+        (root / folder / "monthly_data").mkdir(parents=True, exist_ok=True)
+
+    months = {ERA5_GRID_MONTH}
+    months.update(
+        (timestamp.year, timestamp.month)
+        for timestamp in pd.date_range(start_date, end_date, freq="h")
+    )
+    for year, month in sorted(months):
+        first_hour = pd.Timestamp(year=year, month=month, day=1)
+        hours = pd.date_range(
+            first_hour, periods=first_hour.days_in_month * 24, freq="h"
+        )
+        _write_era5_month(root, year, month, hours, lats, lons, rng)
+
+    return root / "ERA5-single-levels", root / "ERA5-pressure-levels"
+
+
+def write_era5_nwp(
+    path: Path,
+    start_date: pd.Timestamp,
+    total_hours: int,
+    grid_size: int,
+    total_stations: int,
+    seed: int = 0,
+) -> dict[str, tuple[float, float]]:
+    """
+    Writes the single ERA5.nc file read by Era5ReanalisysDataSource, with the pressure level
+    variables as (time, level, latitude, longitude).
+
+    Returns the coordinates of total_stations stations inside the grid, by station id.
+    """
+    rng = np.random.default_rng(seed)
+    lats, lons = get_era5_grid(grid_size)
+    times = pd.date_range(start_date, periods=total_hours, freq="h")
+    levels = [200, 500, 700, 1000]
+    shape = (len(times), len(levels), len(lats), len(lons))
+    xr.Dataset(
+        {
+            variable: (
+                ("time", "level", "latitude", "longitude"),
+                rng.normal(size=shape).astype(np.float32),
+            )
+            for variable in ["z", "r", "t", "u", "v"]
+        },
+        coords={"time": times, "level": levels, "latitude": lats, "longitude": lons},
+    ).to_netcdf(path)
+    return {
+        f"A{600 + i}": coords
+        for i, coords in enumerate(_get_station_coords(lats, lons, total_stations, rng))
+    }
+
+
+def _get_station_coords(
+    lats: np.ndarray, lons: np.ndarray, total: int, rng: np.random.Generator
+) -> list[tuple[float, float]]:
+    # strictly inside the grid, so every station falls in a square
+    margin = 0.01
+    station_lats = rng.uniform(lats.min() + margin, lats.max() - margin, size=total)
+    station_lons = rng.uniform(lons.min() + margin, lons.max() - margin, size=total)
+    return list(zip(np.round(station_lats, 6), np.round(station_lons, 6)))
+
+
+def _get_15_minutes_precipitation(
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    rng: np.random.Generator,
+    missing_fraction: float = 0.02,
+) -> pd.DataFrame:
+    times = pd.date_range(
+        start_date - pd.Timedelta(hours=1),
+        end_date + pd.Timedelta(hours=1),
+        freq="15min",
+    )
+    m15 = rng.gamma(0.2, 1.0, size=len(times)).round(1)
+    m15[rng.random(len(times)) < missing_fraction] = np.nan
+    h01 = pd.Series(m15).rolling(4, min_periods=1).sum().to_numpy(copy=True)
+    h01[times.minute != 0] = np.nan
+    return pd.DataFrame({"datetime": times, "m15": m15, "h01": h01})
+
+
+def write_station_keys(
+    root: Path,
+    grid_size: int,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    total_websirenes: int,
+    total_inmet: int,
+    total_alertario: int,
+    seed: int = 0,
+) -> tuple[Path, Path, Path]:
+    """
+    Writes the "lat_lon.parquet" keys of each station system, in the layouts written by
+    WebSirenesKeys, INMETKeys and AlertarioKeys.
+
+    Returns the websirenes, inmet and alertario keys folders.
+    """
+    rng = np.random.default_rng(seed)
+    lats, lons = get_era5_grid(grid_size)
+
+    websirenes_keys_path = root / "websirenes_keys"
+    websirenes_keys_path.mkdir(parents=True, exist_ok=True)
+    for lat, lon in _get_station_coords(lats, lons, total_websirenes, rng):
+        df = _get_15_minutes_precipitation(start_date, end_date, rng)
+        df.set_index("datetime").to_parquet(
+            websirenes_keys_path / f"{lat}_{lon}.parquet"
+        )
+
+    inmet_keys_path = root / "inmet_keys"
+    inmet_keys_path.mkdir(parents=True, exist_ok=True)
+    hours = pd.date_range(start_date, end_date, freq="h")
+    for lat, lon in _get_station_coords(lats, lons, total_inmet, rng):
+        precipitation = rng.gamma(0.3, 1.0, size=len(hours)).round(1)
+        precipitation[rng.random(len(hours)) < 0.02] = np.nan
+        df = pd.DataFrame(
+            {"precipitation": precipitation}, index=pd.Index(hours, name="datetime")
+        )
+        df.to_parquet(inmet_keys_path / f"{lat}_{lon}.parquet")
+
+    alertario_keys_path = root / "alertario_keys"
+    alertario_keys_path.mkdir(parents=True, exist_ok=True)
+    for lat, lon in _get_station_coords(lats, lons, total_alertario, rng):
+        df = _get_15_minutes_precipitation(start_date, end_date, rng)
+        df.to_parquet(alertario_keys_path / f"{lat}_{lon}.parquet")
+
+    return websirenes_keys_path, inmet_keys_path, alertario_keys_path
+
+
+def write_websirenes_txt(
+    root: Path,
+    total_stations: int,
+    start_date: pd.Timestamp,
+    total_rows: int,
+    seed: int = 0,
+) -> tuple[Path, pd.DataFrame]:
+    """
+    Raw WebSirenes station files, one line per 15 minutes, in the layout read by
+    WebSirenesParser: station names with spaces, "null" values and decimal commas.
+
+    Returns the folder and the station coordinates, as returned by get_websirenes_coords.
+    """
+    rng = np.random.default_rng(seed)
+    folder = root / "websirenes_defesa_civil"
+    folder.mkdir(parents=True, exist_ok=True)
+    times = pd.date_range(start_date, periods=total_rows, freq="15min").strftime(
+        "%Y-%m-%d %H:%M:%S-03"
+    )
+    lats, lons = get_era5_grid(10)
+
+    coords = []
+    for station_id in range(total_stations):
+        name = f"ESTACAO DE TESTE {station_id}"
+        values = rng.gamma(0.3, 2.0, size=(total_rows, 8)).round(2).astype(str)
+        values[rng.random(values.shape) < 0.05] = "null"
+        commas = rng.random(values.shape) < 0.1
+        values[commas] = np.char.replace(values[commas], ".", ",")
+        lines = [
+            f"{name} {time} {' '.join(row)} {station_id}\n"
+            for time, row in zip(times, values)
+        ]
+        with open(folder / f"{station_id}.txt", "w", encoding="utf-8-sig") as f:
+            f.write("nome horaLeitura m15 m30 h01 h02 h03 h04 h24 h96 id\n")
+            f.writelines(lines)
+
+        lat, lon = _get_station_coords(lats, lons, 1, rng)[0]
+        coords.append(
+            {
+                "id_estacao": station_id,
+                "estacao": name,
+                "estacao_desc": name,
+                "latitude": str(lat),
+                "longitude": str(lon),
+            }
+        )
+
+    return folder, pd.DataFrame(coords)
+
+
+def write_alertario_months(
+    root: Path,
+    stations: list[str],
+    start_month: pd.Timestamp = pd.Timestamp("2013-01-01"),
+    end_month: pd.Timestamp = pd.Timestamp("2024-10-01"),
+    missing_fraction: float = 0.01,
+    seed: int = 0,
+) -> Path:
+    """
+    Raw Alertario monthly files, {station}_{YYYYMM}_Plv.txt with 5 header lines and one
+    line every 15 minutes, the columns aligned with spaces, as read by AlertarioParser.
+
+    Returns the folder.
+    """
+    rng = np.random.default_rng(seed)
+    folder = root / "alertario-from-source"
+    folder.mkdir(parents=True, exist_ok=True)
+
+    for station in stations:
+        for month in pd.date_range(start_month, end_month, freq="MS"):
+            times = pd.date_range(
+                month, month + pd.offsets.MonthBegin(1), freq="15min", inclusive="left"
+            )
+            values = rng.gamma(0.2, 1.0, size=(len(times), 5))
+            lines = [
+                f"{time.strftime('%d/%m/%Y')}  {time.strftime('%H:%M:%S')}   -  "
+                + "".join(f"{value:>9.1f}" for value in row)
+                for time, row in zip(times, values)
+            ]
+            # missing values, imputed by the parser
+            for i in np.flatnonzero(rng.random(len(lines)) < missing_fraction):
+                lines[i] = lines[i][:26] + "       ND" + lines[i][35:]
+            header = [
+                f"Estacao: {station}",
+                f"Mes/Ano: {month.strftime('%m/%Y')}",
+                "",
+                "Dia        Hora       HBV      15 min   01 h     04 h     24 h     96 h",
+                "-" * 72,
+            ]
+            with open(folder / f"{station}_{month.strftime('%Y%m')}_Plv.txt", "w") as f:
+                f.write("\n".join(header + lines) + "\n")
+
+    return folder
+
+
+def write_inmet_station(
+    filename: Path, start_date: pd.Timestamp, total_hours: int, seed: int = 0
+) -> Path:
+    """
+    Raw INMET station file, with the columns mapped by config/station_systems/inmet.json
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range(start_date, periods=total_hours, freq="h")
+    hour_of_day = hours.hour.to_numpy()
+
+    df = pd.DataFrame(
+        {
+            "DT_MEDICAO": hours.strftime("%Y-%m-%d"),
+            "HR_MEDICAO": hours.strftime("%H%M"),
+            "TEM_MAX": 24
+            + 6 * np.sin(2 * np.pi * hour_of_day / 24)
+            + rng.normal(0, 1, total_hours),
+            "UMD_MAX": rng.uniform(40, 100, total_hours),
+            "PRE_MAX": rng.normal(1012, 4, total_hours),
+            "VEN_VEL": rng.gamma(2.0, 1.5, total_hours),
+            "VEN_DIR": rng.uniform(0, 360, total_hours),
+            "CHUVA": rng.gamma(0.2, 2.0, total_hours).round(1),
+        }
+    )
+    # a few gaps in the predictors and in the target
+    for column in ("TEM_MAX", "UMD_MAX", "PRE_MAX", "VEN_VEL", "VEN_DIR", "CHUVA"):
+        df.loc[rng.random(total_hours) < 0.03, column] = np.nan
+
+    df.to_parquet(filename)
+    return filename
+
+
+def write_goes16_channels(
+    root: Path,
+    start_date: pd.Timestamp,
+    total_hours: int,
+    shape: tuple[int, int],
+    seed: int = 0,
+) -> Path:
+    """
+    Writes CMI/{year}/{channel}/{channel}_{timestamp}.nc files, one per hour and channel,
+    each with one CMI_{timestamp} variable per 10 minutes, as read by goes16.features.
+
+    Returns the year folder.
+    """
+    rng = np.random.default_rng(seed)
+    pasta_ano = root / "CMI" / str(start_date.year)
+    lats = np.linspace(-22.0, -23.5, shape[0])
+    lons = np.linspace(-44.0, -42.5, shape[1])
+
+    for canal in GOES16_CHANNELS:
+        pasta_canal = pasta_ano / canal
+        os.makedirs(pasta_canal, exist_ok=True)
+        # brightness temperatures in K
+        base = rng.uniform(200.0, 300.0)
+        for hora in pd.date_range(start_date, periods=total_hours, freq="h"):
+            timestamp = hora.strftime("%Y_%m_%d_%H_%M")
+            with nc.Dataset(pasta_canal / f"{canal}_{timestamp}.nc", "w") as ds:
+                ds.createDimension("lat", shape[0])
+                ds.createDimension("lon", shape[1])
+                ds.createVariable("lat", "f8", ("lat",))[:] = lats
+                ds.createVariable("lon", "f8", ("lon",))[:] = lons
+                for minuto in GOES16_MINUTES:
+                    instante = hora + pd.Timedelta(minutes=minuto)
+                    var = ds.createVariable(
+                        f"CMI_{instante.strftime('%Y_%m_%d_%H_%M')}",
+                        "f4",
+                        ("lat", "lon"),
+                        fill_value=nc.default_fillvals["f4"],
+                    )
+                    var.units = "K"
+                    dados = base + rng.normal(0.0, 10.0, size=shape)
+                    # a few masked pixels, as in the cropped files
+                    dados[rng.random(shape) < 0.01] = nc.default_fillvals["f4"]
+                    var[:] = np.ma.masked_equal(dados.astype("f4"), var._FillValue)
+
+    return pasta_ano
+
+
+def get_station_timeseries(
+    total_hours: int,
+    total_features: int,
+    start_date: pd.Timestamp = pd.Timestamp("2020-01-01"),
+    gap_every: int = 500,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Hourly series with a gap every gap_every hours, the input of apply_sliding_window
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range(start_date, periods=total_hours, freq="h")
+    hours = hours.delete(np.arange(gap_every, total_hours, gap_every))
+    return pd.DataFrame(
+        rng.normal(size=(len(hours), total_features)),
+        index=hours,
+        columns=[f"feature_{i}" for i in range(total_features)],
+    )
+
+
+def get_rain_gauge_series(
+    total_rows: int,
+    start_date: pd.Timestamp = pd.Timestamp("2013-01-01"),
+    missing_fraction: float = 0.02,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    15 minutes m15 and h01 series of a rain gauge, as concatenated by
+    AlertarioParser.process_station, with gaps of 1 to 3 days of missing values
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start_date, periods=total_rows, freq="15min")
+    m15 = rng.gamma(0.2, 1.0, size=total_rows).round(1)
+    h01 = pd.Series(m15).rolling(4, min_periods=1).sum().to_numpy(copy=True)
+    missing = np.zeros(total_rows, dtype=bool)
+    # mostly single readings, a few longer outages
+    missing[rng.random(total_rows) < missing_fraction * 0.75] = True
+    for start in rng.integers(0, total_rows, size=max(total_rows // 40_000, 1)):
+        missing[start : start + rng.integers(96, 288)] = True
+    m15[missing] = np.nan
+    h01[missing] = np.nan
+    return pd.DataFrame({"datetime": times, "m15": m15, "h01": h01})
+
+
+def get_windowed_arrays(
+    total_samples: int, window_size: int, total_features: int, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    X with shape (samples, window_size, features) and y with shape (samples, 1), as written
+    by build_datasets
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(total_samples, window_size, total_features)).astype(np.float32)
+    y = (rng.random((total_samples, 1)) < 0.1).astype(np.float32)
+    return X, y
@@ -0,0 +1,713 @@
+"""
+Offline benchmarks of the hot stages of the pipeline, on synthetic inputs (see fixtures.py).
+
+Each stage is timed over a few repeats and then run once more under tracemalloc to get its
+peak of traced memory, so the tracing overhead doesn't leak into the timings. Inputs are
+generated before the timed section, in a fresh folder for each run.
+
+The results are written as JSON with the machine, the library versions and the git commit,
+so two result files can be compared with --compare.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.run [--scale small|medium] [--only NAME ...]
+    PYTHONPATH=src python -m benchmarks.run --compare baseline.json candidate.json
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = PROJECT_ROOT / "src"
+for path in (SRC_DIR, PROJECT_ROOT):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+# build_datasets imports era5_data_source as a top-level module
+if str(SRC_DIR / "era5") not in sys.path:
+    sys.path.append(str(SRC_DIR / "era5"))
+
+from benchmarks import fixtures  # noqa: E402
+
+log = logging.getLogger("benchmarks")
+
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+SCHEMA_VERSION = 1
+
+SCALES = {
+    "small": {
+        "grid_size": 10,
+        "start_date": "2020-01-30 00:00",
+        "end_date": "2020-02-01 23:00",
+        "websirenes_stations": 20,
+        "inmet_stations": 5,
+        "alertario_stations": 10,
+        "websirenes_txt_stations": 8,
+        "websirenes_txt_rows": 20_000,
+        "alertario_txt_stations": 2,
+        "rain_gauge_rows": 100_000,
+        "era5_nwp_hours": 2_160,
+        # KNNImputer over the whole series is quadratic, the reference is kept small
+        "rain_gauge_knn_rows": 15_000,
+        "window_rows": 50_000,
+        "window_features": 12,
+        "window_size": 6,
+        "subsampling_samples": 20_000,
+        "station_hours": 2_000,
+        "goes16_hours": 12,
+        "goes16_shape": (60, 60),
+        "fit_samples": 4_096,
+        "fit_epochs": 3,
+        "fit_batch_size": 256,
+    },
+    "medium": {
+        "grid_size": 24,
+        "start_date": "2020-01-20 00:00",
+        "end_date": "2020-02-09 23:00",
+        "websirenes_stations": 80,
+        "inmet_stations": 20,
+        "alertario_stations": 30,
+        "websirenes_txt_stations": 32,
+        "websirenes_txt_rows": 100_000,
+        "alertario_txt_stations": 6,
+        "rain_gauge_rows": 400_000,
+        "era5_nwp_hours": 8_760,
+        # KNNImputer over the whole series is quadratic, the reference is kept small
+        "rain_gauge_knn_rows": 30_000,
+        "window_rows": 500_000,
+        "window_features": 12,
+        "window_size": 6,
+        "subsampling_samples": 100_000,
+        "station_hours": 8_760,
+        "goes16_hours": 48,
+        "goes16_shape": (200, 200),
+        "fit_samples": 32_768,
+        "fit_epochs": 3,
+        "fit_batch_size": 256,
+    },
+}
+
+
+class MissingDependency(Exception):
+    """
+    Raised by a setup when the stage can't run in this environment, the stage is skipped
+    """
+
+
+class Benchmark(NamedTuple):
+    # setup(workdir, params) generates the inputs and returns the callable to be measured
+    setup: Callable[[Path, dict], Callable[[], object]]
+    description: str
+
+
+def _import(module: str, attribute: str | None = None):
+    try:
+        imported = importlib.import_module(module)
+    except ImportError as e:
+        raise MissingDependency(f"{module}: {e}") from e
+    return imported if attribute is None else getattr(imported, attribute)
+
+
+def _get_dates(params: dict) -> tuple[pd.Timestamp, pd.Timestamp]:
+    return pd.Timestamp(params["start_date"]), pd.Timestamp(params["end_date"])
+
+
+def _get_spatiotemporal_features(workdir: Path, params: dict):
+    """
+    SpatioTemporalFeatures reading ERA5 files and station keys generated in workdir
+    """
+    WebSirenesKeys = _import("spatiotemporal_builder.WebSirenesKeys", "WebSirenesKeys")
+    INMETKeys = _import("spatiotemporal_builder.INMETKeys", "INMETKeys")
+    AlertarioKeys = _import("spatiotemporal_builder.AlertarioKeys", "AlertarioKeys")
+    WebSirenesSquare = _import(
+        "spatiotemporal_builder.WebSirenesSquare", "WebSirenesSquare"
+    )
+    INMETSquare = _import("spatiotemporal_builder.INMETSquare", "INMETSquare")
+    AlertarioSquare = _import(
+        "spatiotemporal_builder.AlertarioSquare", "AlertarioSquare"
+    )
+    SpatioTemporalFeatures = _import(
+        "spatiotemporal_builder.WebsirenesTarget", "SpatioTemporalFeatures"
+    )
+    settings = _import("spatiotemporal_builder.settings", "settings")
+    settings.only_ERA5 = False
+
+    start_date, end_date = _get_dates(params)
+    era5_single_levels_path, era5_pressure_levels_path = fixtures.write_era5(
+        workdir, start_date, end_date, params["grid_size"]
+    )
+    websirenes_keys_path, inmet_keys_path, alertario_keys_path = (
+        fixtures.write_station_keys(
+            workdir,
+            params["grid_size"],
+            start_date,
+            end_date,
+            params["websirenes_stations"],
+            params["inmet_stations"],
+            params["alertario_stations"],
+        )
+    )
+
+    return SpatioTemporalFeatures(
+        WebSirenesSquare(WebSirenesKeys(None, None, websirenes_keys_path)),
+        INMETSquare(INMETKeys(None, None, inmet_keys_path)),
+        AlertarioSquare(AlertarioKeys(None, None, alertario_keys_path)),
+        features_path=workdir / "features",
+        era5_single_levels_path=era5_single_levels_path,
+        era5_pressure_levels_path=era5_pressure_levels_path,
+    )
+
+
+def setup_build_timestamps_hourly(workdir: Path, params: dict):
+    spatio_temporal_features = _get_spatiotemporal_features(workdir, params)
+    start_date, end_date = _get_dates(params)
+    return lambda: spatio_temporal_features.build_timestamps_hourly(
+        start_date, end_date, [], use_cache=False
+    )
+
+
+def _setup_build_netcdf(layout: str):
+    def setup(workdir: Path, params: dict):
+        WebsirenesDataset = _import(
+            "spatiotemporal_builder.WebsirenesDataset", "WebsirenesDataset"
+        )
+        spatio_temporal_features = _get_spatiotemporal_features(workdir, params)
+        start_date, end_date = _get_dates(params)
+        spatio_temporal_features.build_timestamps_hourly(start_date, end_date, [])
+        dataset = WebsirenesDataset(
+            spatio_temporal_features, dataset_path=workdir / "output_dataset.nc"
+        )
+        # the samples need TIMESTEPS hours of features before and after them
+        min_timestamp = start_date + pd.Timedelta(hours=dataset.TIMESTEPS)
+        max_timestamp = end_date - pd.Timedelta(hours=dataset.TIMESTEPS)
+        return lambda: dataset.build_netcdf(
+            min_timestamp, max_timestamp, [], use_cache=False, layout=layout
+        )
+
+    return setup
+
+
+def setup_build_websirenes_keys(workdir: Path, params: dict):
+    WebSirenesKeys = _import("spatiotemporal_builder.WebSirenesKeys", "WebSirenesKeys")
+    WebSirenesParser = _import(
+        "spatiotemporal_builder.WebSirenesParser", "WebSirenesParser"
+    )
+    folder, coords = fixtures.write_websirenes_txt(
+        workdir,
+        params["websirenes_txt_stations"],
+        pd.Timestamp(params["start_date"]),
+        params["websirenes_txt_rows"],
+    )
+    websirenes_keys = WebSirenesKeys(
+        WebSirenesParser(folder), coords, workdir / "websirenes_keys"
+    )
+    return lambda: websirenes_keys.build_keys(use_cache=False)
+
+
+def _setup_process_alertario_stations(cached: bool):
+    def setup(workdir: Path, params: dict):
+        AlertarioParser = _import(
+            "spatiotemporal_builder.AlertarioParser", "AlertarioParser"
+        )
+        stations = [f"station_{i}" for i in range(params["alertario_txt_stations"])]
+        # without missing values, so the imputation doesn't run and only the reading is measured
+        folder = fixtures.write_alertario_months(
+            workdir, stations, missing_fraction=0.0
+        )
+        parser = AlertarioParser(folder, workdir / "alertario_parsed")
+        if cached:
+            for station in stations:
+                parser.process_station(station)
+        return lambda: [parser.process_station(station) for station in stations]
+
+    return setup
+
+
+def _setup_impute_rain_gauge_series(imputation_config: dict | None, rows_param: str):
+    def setup(workdir: Path, params: dict):
+        AlertarioParser = _import(
+            "spatiotemporal_builder.AlertarioParser", "AlertarioParser"
+        )
+        parser = AlertarioParser(imputation_config=imputation_config)
+        df = fixtures.get_rain_gauge_series(params[rows_param])
+
+        def impute():
+            imputed = parser._impute_missing_values(df.copy(), "m15")
+            return parser._impute_missing_values(imputed, "h01")
+
+        return impute
+
+    return setup
+
+
+def _setup_era5_station_series(cached: bool):
+    def setup(workdir: Path, params: dict):
+        Era5StationSeriesCache = _import(
+            "era5_station_series", "Era5StationSeriesCache"
+        )
+        era5_path = workdir / "ERA5.nc"
+        stations = fixtures.write_era5_nwp(
+            era5_path,
+            pd.Timestamp(params["start_date"]),
+            params["era5_nwp_hours"],
+            params["grid_size"],
+            params["inmet_stations"],
+        )
+        cache_dir = workdir / "ERA5_station_series"
+        series_cache = Era5StationSeriesCache(era5_path, cache_dir)
+        if cached:
+            series_cache.get_many(stations)
+            return lambda: series_cache.get_many(stations)
+
+        def extract():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            return series_cache.get_many(stations)
+
+        return extract
+
+    return setup
+
+
+def setup_apply_sliding_window(workdir: Path, params: dict):
+    apply_sliding_window = _import("utils.windowing", "apply_sliding_window")
+    df = fixtures.get_station_timeseries(
+        params["window_rows"], params["window_features"]
+    )
+    return lambda: apply_sliding_window(df, 0, params["window_size"])
+
+
+def setup_windowed_batches(workdir: Path, params: dict):
+    windowing = _import("utils.windowing")
+    df = fixtures.get_station_timeseries(
+        params["window_rows"], params["window_features"]
+    )
+    arr = df.to_numpy()
+    block_starts, block_ends = windowing.find_contiguous_block_bounds(df.index.values)
+    batch_size = params["fit_batch_size"]
+
+    def run():
+        X, _ = windowing.apply_lazy_block_windowing(
+            arr, block_starts, block_ends, params["window_size"], 0
+        )
+        # an epoch of the batches of a shuffled WindowedDataset
+        order = np.random.default_rng(0).permutation(len(X))
+        for start in range(0, len(order), batch_size):
+            X.take(order[start : start + batch_size])
+
+    return run
+
+
+def _setup_negative_subsampling(pilot_model: str):
+    def setup(workdir: Path, params: dict):
+        apply_subsampling = _import("surface_stations.subsampling", "apply_subsampling")
+        X, y = fixtures.get_windowed_arrays(
+            params["subsampling_samples"],
+            params["window_size"],
+            params["window_features"],
+        )
+        return lambda: apply_subsampling(X, y, "NEGATIVE", pilot_model=pilot_model)
+
+    return setup
+
+
+def setup_preprocess_ws(workdir: Path, params: dict):
+    preprocess_ws = _import("surface_stations.preprocess", "preprocess_ws")
+    ws_filename = fixtures.write_inmet_station(
+        workdir / "A601.parquet",
+        pd.Timestamp(params["start_date"]),
+        params["station_hours"],
+    )
+    return lambda: preprocess_ws(
+        ws_id="A601",
+        ws_filename=str(ws_filename),
+        output_folder=str(workdir) + os.sep,
+        station_system="inmet",
+    )
+
+
+def setup_goes16_features(workdir: Path, params: dict):
+    FEATURES = _import("goes16.features.engine", "FEATURES")
+    extrair_features = _import("goes16.features.engine", "extrair_features")
+    pasta_ano = fixtures.write_goes16_channels(
+        workdir,
+        pd.Timestamp(params["start_date"]),
+        params["goes16_hours"],
+        params["goes16_shape"],
+    )
+    return lambda: extrair_features(
+        str(pasta_ano), list(FEATURES), str(workdir / "features")
+    )
+
+
+def setup_base_neural_net_fit(workdir: Path, params: dict):
+    torch = _import("torch")
+    Conv1DNeuralNet = _import("train.conv1d_neural_net", "Conv1DNeuralNet")
+    globals = _import("config.globals")
+    # the checkpoints of EarlyStopping go to the run's folder
+    globals.MODELS_DIR = str(workdir) + os.sep
+
+    window_size = params["window_size"]
+    total_features = params["window_features"]
+    X, y = fixtures.get_windowed_arrays(
+        params["fit_samples"], window_size, total_features
+    )
+    X_val, y_val = fixtures.get_windowed_arrays(
+        params["fit_samples"] // 4, window_size, total_features, seed=1
+    )
+
+    torch.manual_seed(0)
+    model = Conv1DNeuralNet(
+        seq_length=window_size, input_size=total_features, output_size=1
+    )
+    train_loader = model.create_dataloader(
+        X, y, params["fit_batch_size"], weights=torch.ones(len(y), 1)
+    )
+    val_loader = model.create_dataloader(
+        X_val, y_val, params["fit_batch_size"], weights=torch.ones(len(y_val), 1)
+    )
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = torch.nn.BCELoss(reduction="none")
+
+    return lambda: model.fit(
+        n_epochs=params["fit_epochs"],
+        optimizer=optimizer,
+        train_loader=train_loader,
+        val_loader=val_loader,
+        patience=params["fit_epochs"],
+        criterion=criterion,
+        pipeline_id="benchmark",
+    )
+
+
+BENCHMARKS = {
+    "build_timestamps_hourly": Benchmark(
+        setup_build_timestamps_hourly,
+        "SpatioTemporalFeatures.build_timestamps_hourly with ERA5 files and station keys",
+    ),
+    "build_netcdf_samples": Benchmark(
+        _setup_build_netcdf("samples"),
+        'WebsirenesDataset.build_netcdf with layout="samples"',
+    ),
+    "build_netcdf_time_axis": Benchmark(
+        _setup_build_netcdf("time_axis"),
+        'WebsirenesDataset.build_netcdf with layout="time_axis"',
+    ),
+    "build_websirenes_keys": Benchmark(
+        setup_build_websirenes_keys,
+        "WebSirenesKeys.build_keys from raw WebSirenes text files",
+    ),
+    "process_alertario_stations": Benchmark(
+        _setup_process_alertario_stations(cached=False),
+        "AlertarioParser.process_station of every month of a few stations, parsing the text files",
+    ),
+    "process_alertario_stations_cached": Benchmark(
+        _setup_process_alertario_stations(cached=True),
+        "AlertarioParser.process_station with the months already parsed to parquet",
+    ),
+    "impute_rain_gauge_series": Benchmark(
+        _setup_impute_rain_gauge_series(None, "rain_gauge_rows"),
+        "AlertarioParser imputation of a 15 minutes series with the configured time-local strategies",
+    ),
+    "impute_rain_gauge_series_knn": Benchmark(
+        _setup_impute_rain_gauge_series({"strategy": "knn"}, "rain_gauge_knn_rows"),
+        "Reference measurement of the previous imputation, KNNImputer over the whole series, on a shorter 15 minutes series",
+    ),
+    "era5_station_series": Benchmark(
+        _setup_era5_station_series(cached=False),
+        "Era5StationSeriesCache.get_many extracting the ERA5.nc series of a few stations",
+    ),
+    "era5_station_series_cached": Benchmark(
+        _setup_era5_station_series(cached=True),
+        "Era5StationSeriesCache.get_many with the series already cached",
+    ),
+    "apply_sliding_window": Benchmark(
+        setup_apply_sliding_window,
+        "windowing.apply_sliding_window on an hourly series with gaps",
+    ),
+    "windowed_batches": Benchmark(
+        setup_windowed_batches,
+        "Lazy windowing of the same series and an epoch of shuffled batches of windows",
+    ),
+    "negative_subsampling": Benchmark(
+        _setup_negative_subsampling("HIST"),
+        "NEGATIVE subsampling of windowed arrays with the histogram pilot model",
+    ),
+    "negative_subsampling_gb": Benchmark(
+        _setup_negative_subsampling("GB"),
+        "NEGATIVE subsampling of windowed arrays with the exact GradientBoostingClassifier",
+    ),
+    "preprocess_ws": Benchmark(
+        setup_preprocess_ws,
+        "surface_stations.preprocess.preprocess_ws of an INMET station",
+    ),
+    "goes16_features": Benchmark(
+        setup_goes16_features,
+        "All GOES-16 features of goes16.features, single pass over the channel files",
+    ),
+    "base_neural_net_fit": Benchmark(
+        setup_base_neural_net_fit,
+        "BaseNeuralNet.fit of a Conv1DNeuralNet on windowed arrays",
+    ),
+}
+
+
+def _get_git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _get_versions() -> dict:
+    versions = {}
+    for module in ("numpy", "pandas", "xarray", "netCDF4", "scipy", "sklearn", "torch"):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return versions
+
+
+def _get_machine() -> dict:
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "versions": _get_versions(),
+    }
+
+
+def _get_max_rss_bytes() -> dict:
+    try:
+        import resource
+    except ImportError:
+        return {}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    factor = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * factor,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * factor,
+    }
+
+
+def _measure(
+    benchmark: Benchmark, params: dict, workroot: Path, run: int, traced: bool
+) -> tuple[float, int | None]:
+    workdir = workroot / f"run_{run}"
+    workdir.mkdir()
+    try:
+        stage = benchmark.setup(workdir, params)
+        gc.collect()
+        if traced:
+            tracemalloc.start()
+        start = time.perf_counter()
+        stage()
+        elapsed = time.perf_counter() - start
+        peak = None
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return elapsed, peak
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmark(name: str, params: dict, repeat: int, workroot: Path) -> dict:
+    benchmark = BENCHMARKS[name]
+    result = {"name": name, "description": benchmark.description}
+    log.info(f"Running {name}...")
+    try:
+        timings = [
+            _measure(benchmark, params, workroot, run, traced=False)[0]
+            for run in range(repeat)
+        ]
+        _, peak = _measure(benchmark, params, workroot, repeat, traced=True)
+    except MissingDependency as e:
+        log.warning(f"Skipping {name}: {e}")
+        return {**result, "status": "skipped", "reason": str(e)}
+    except Exception as e:
+        log.exception(f"Error running {name}")
+        return {**result, "status": "error", "reason": repr(e)}
+
+    result.update(
+        {
+            "status": "ok",
+            "wall_time_s": timings,
+            "wall_time_min_s": min(timings),
+            "wall_time_median_s": statistics.median(timings),
+            "peak_traced_memory_bytes": peak,
+            "max_rss_bytes": _get_max_rss_bytes(),
+        }
+    )
+    log.info(
+        f"{name}: median {result['wall_time_median_s']:.3f}s, peak traced memory {peak / 2**20:.1f} MiB"
+    )
+    return result
+
+
+def _quiet_spatiotemporal_logger() -> None:
+    # the spatiotemporal builder logger sets its own level and handlers
+    try:
+        from spatiotemporal_builder.Logger import logger as spatiotemporal_logger
+    except ImportError:
+        return
+    spatiotemporal_logger.logger.setLevel(logging.WARNING)
+
+
+def run_benchmarks(
+    names: list[str], scale: str, repeat: int, verbose: bool = False
+) -> dict:
+    params = SCALES[scale]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="atmoseer_benchmarks_") as workroot:
+        # the log files the stages create in the working directory go to workroot
+        os.chdir(workroot)
+        try:
+            if not verbose:
+                _quiet_spatiotemporal_logger()
+            results = []
+            for name in names:
+                benchmark_root = Path(workroot) / name
+                benchmark_root.mkdir()
+                results.append(run_benchmark(name, params, repeat, benchmark_root))
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _get_git_commit(),
+        "machine": _get_machine(),
+        "scale": scale,
+        "params": params,
+        "repeat": repeat,
+        "benchmarks": results,
+    }
+
+
+def compare_results(baseline: dict, candidate: dict) -> list[dict]:
+    """
+    Ratios candidate / baseline of the median wall time and of the peak traced memory of
+    the stages that ran in both files (< 1 means the candidate is faster / uses less memory)
+    """
+    if baseline.get("scale") != candidate.get("scale"):
+        log.warning(
+            f"Comparing different scales: {baseline.get('scale')} and {candidate.get('scale')}"
+        )
+    baseline_results = {
+        result["name"]: result
+        for result in baseline["benchmarks"]
+        if result["status"] == "ok"
+    }
+    comparison = []
+    for result in candidate["benchmarks"]:
+        before = baseline_results.get(result["name"])
+        if before is None or result["status"] != "ok":
+            continue
+        comparison.append(
+            {
+                "name": result["name"],
+                "wall_time_ratio": result["wall_time_median_s"]
+                / before["wall_time_median_s"],
+                "memory_ratio": result["peak_traced_memory_bytes"]
+                / max(before["peak_traced_memory_bytes"], 1),
+            }
+        )
+    return comparison
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the hot stages of the pipeline on synthetic data."
+    )
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Benchmarks to run (default: all).",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Timed runs of each benchmark."
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help=f"Results file (default: {RESULTS_DIR}/<date>_<commit>_<scale>.json).",
+    )
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        type=Path,
+        metavar=("BASELINE", "CANDIDATE"),
+        help="Compares two results files instead of running the benchmarks.",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Shows the logs of the stages."
+    )
+    args = parser.parse_args(argv[1:])
+
+    fmt = "[%(levelname)s] %(funcName)s():%(lineno)i: %(message)s"
+    # the logs of the stages are only shown with --verbose
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.WARNING, format=fmt
+    )
+    log.setLevel(logging.INFO)
+
+    if args.compare:
+        baseline, candidate = (json.loads(path.read_text()) for path in args.compare)
+        for row in compare_results(baseline, candidate):
+            print(
+                f"{row['name']:<28} time x{row['wall_time_ratio']:.2f}  memory x{row['memory_ratio']:.2f}"
+            )
+        return
+
+    results = run_benchmarks(args.only, args.scale, args.repeat, args.verbose)
+
+    output = args.output
+    if output is None:
+        commit = (results["git_commit"] or "nogit")[:8]
+        date = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = RESULTS_DIR / f"{date}_{commit}_{args.scale}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=4, default=_to_json))
+    log.info(f"Results saved to {output}")
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return list(value)
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
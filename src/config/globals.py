@@ -26,6 +26,9 @@ GOES16_DATA_DIR = _get_env("GOES16_DATA_DIR", "./data/goes16/CMI/")
 # Directory to store the extracted features from GOES-16 data
 GOES16_FEATURES_DIR = _get_env("GOES16_FEATURES_DIR", "./data/goes16/features/")
 
+# Directory to store the source pixel to lat/lon grid mappings used to crop GOES-16 full disk files
+GOES16_WARP_GEOMETRY_DIR = _get_env("GOES16_WARP_GEOMETRY_DIR", "./data/goes16/warp_geometry/")
+
 # Atmospheric sounding datasource directory
 NWP_DATA_DIR = _get_env("NWP_DATA_DIR", "./data/NWP/")
 
@@ -41,6 +44,12 @@ TPW_DATA_DIR = _get_env("TPW_DATA_DIR", "./data/goes16/wsoi")
 # Directory to store the train/val/test datasets for each weather station of interest
 DATASETS_DIR = _get_env("DATASETS_DIR", "./data/datasets/")
 
+# Directory to store the fusion sources aligned to the time axis of each weather station of interest
+FUSION_SOURCES_DIR = _get_env("FUSION_SOURCES_DIR", "./data/fusion_sources/")
+
+# Directory to store the scores of the pilot models of negative subsampling
+PILOT_SCORES_DIR = _get_env("PILOT_SCORES_DIR", "./data/pilot_scores/")
+
 # Directory to store the generated models and their corresponding reports
 MODELS_DIR = _get_env("MODELS_DIR", "./models/")
 
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+import xarray as xr
+
+from utils.file_fingerprint import get_file_fingerprint
+
+LEVELS = (200, 700, 1000)
+
+# ERA5 short names and the prefixes of their columns, e.g. Geopotential_200
+VARIABLES = {
+    "z": "Geopotential",
+    "r": "Humidity",
+    "t": "Temperature",
+    "u": "WindU",
+    "v": "WindV",
+}
+
+
+def get_column_names() -> list[str]:
+    return [f"{name}_{level}" for level in LEVELS for name in VARIABLES.values()]
+
+
+class Era5StationSeriesCache:
+    """
+    ERA5 time series at the grid point nearest to each weather station, with every variable
+    of VARIABLES at every level of LEVELS as a column.
+
+    The series of a station is extracted once and kept as {station_id}_{fingerprint}.parquet,
+    where the fingerprint covers the size and modification time of the ERA5 file and the
+    coordinates of the station. Later calls read the parquet file, without opening the
+    ERA5 file, until it changes.
+    """
+
+    def __init__(self, era5_path: Path, cache_dir: Path) -> None:
+        self.era5_path = Path(era5_path)
+        self.cache_dir = Path(cache_dir)
+
+    def _get_fingerprint(self, latitude: float, longitude: float) -> str:
+        inputs = {
+            "era5": [str(self.era5_path), get_file_fingerprint(self.era5_path)],
+            "latitude": float(latitude),
+            "longitude": float(longitude),
+            "levels": list(LEVELS),
+            "variables": list(VARIABLES),
+        }
+        digest = hashlib.sha1(json.dumps(inputs, sort_keys=True).encode())
+        return digest.hexdigest()[:16]
+
+    def _get_cache_path(self, station_id: str, fingerprint: str) -> Path:
+        return self.cache_dir / f"{station_id}_{fingerprint}.parquet"
+
+    def _remove_stale(self, station_id: str, current_path: Path) -> None:
+        for path in self.cache_dir.glob(f"{station_id}_*.parquet"):
+            # the stem of another station may start with this one's, e.g. sao_cristovao
+            if path != current_path and path.stem.rsplit("_", 1)[0] == station_id:
+                path.unlink()
+
+    def _extract(self, ds: xr.Dataset, latitude: float, longitude: float):
+        point = (
+            ds[list(VARIABLES)]
+            .sel(
+                level=list(LEVELS),
+                latitude=latitude,
+                longitude=longitude,
+                method="nearest",
+            )
+            .load()
+        )
+        columns = {}
+        for level, requested_level in zip(point.level.values, LEVELS):
+            at_level = point.sel(level=level)
+            for variable, name in VARIABLES.items():
+                columns[f"{name}_{requested_level}"] = at_level[variable].values
+        df = pd.DataFrame(
+            columns, index=pd.DatetimeIndex(point.time.values, name="Datetime")
+        )
+        return df.dropna(how="any")
+
+    def get_many(self, stations: dict) -> dict[str, pd.DataFrame]:
+        """
+        Series of each station of stations, {station_id: (latitude, longitude)}. The ERA5
+        file is opened at most once, for the stations whose series aren't cached yet.
+        """
+        series = {}
+        pending = {}
+        for station_id, (latitude, longitude) in stations.items():
+            cache_path = self._get_cache_path(
+                station_id, self._get_fingerprint(latitude, longitude)
+            )
+            if cache_path.exists():
+                series[station_id] = pd.read_parquet(cache_path)
+            else:
+                pending[station_id] = (latitude, longitude, cache_path)
+
+        if not pending:
+            return series
+
+        logging.info(
+            f"Extracting the ERA5 series of {len(pending)} stations from {self.era5_path}..."
+        )
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with xr.open_dataset(self.era5_path) as ds:
+            for station_id, (latitude, longitude, cache_path) in pending.items():
+                df = self._extract(ds, latitude, longitude)
+                tmp_path = cache_path.with_suffix(".tmp.parquet")
+                df.to_parquet(tmp_path)
+                os.replace(tmp_path, cache_path)
+                self._remove_stale(station_id, cache_path)
+                series[station_id] = df
+        return series
+
+    def get_series(
+        self, station_id: str, latitude: float, longitude: float
+    ) -> pd.DataFrame:
+        return self.get_many({station_id: (latitude, longitude)})[station_id]
@@ -1,18 +1,23 @@
 # src/goes16/features/__init__.py
+from .engine import FEATURES, extrair_features
 from .fa import derivada_temporal_fluxo_ascendente
 from .gtn import glaciacao_topo_nuvem
 from .li_proxy import proxy_estabilidade
 from .pn import profundidade_nuvens
 from .pn_std import textura_local_profundidade
 from .toct import temperatura_topo_nuvem
+from .tp import tamanho_particulas
 from .wv_grad import gradiente_vapor_agua
 
 __all__ = [
+    "FEATURES",
+    "extrair_features",
     "derivada_temporal_fluxo_ascendente",
     "glaciacao_topo_nuvem",
     "proxy_estabilidade",
     "profundidade_nuvens",
     "textura_local_profundidade",
     "temperatura_topo_nuvem",
+    "tamanho_particulas",
     "gradiente_vapor_agua",
 ]
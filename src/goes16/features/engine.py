@@ -0,0 +1,357 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple
+
+import netCDF4 as nc
+import numpy as np
+from scipy.ndimage import generic_filter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+if not logger.handlers:
+    file_handler = logging.FileHandler("engine.log")
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+
+FA_INTERVALO_TEMPORAL = 10
+PN_STD_TAMANHO_JANELA = 3
+
+
+class ChannelCache:
+    """
+    Channel files of a single timestamp, opened at most once and only when a feature needs
+    them. Variables (and values derived from them, like PN) are read once and shared by all
+    the features computed for the timestamp.
+    """
+
+    def __init__(self, paths: dict[str, str]) -> None:
+        self.paths = paths
+        self.datasets: dict[str, nc.Dataset] = {}
+        self.arrays: dict[tuple, np.ndarray] = {}
+
+    def dataset(self, canal: str) -> nc.Dataset:
+        if canal not in self.datasets:
+            self.datasets[canal] = nc.Dataset(self.paths[canal], "r")
+        return self.datasets[canal]
+
+    def variables(self, canal: str):
+        return self.dataset(canal).variables
+
+    def read(self, canal: str, nome_var: str) -> np.ndarray:
+        key = (canal, nome_var)
+        if key not in self.arrays:
+            self.arrays[key] = self.variables(canal)[nome_var][:]
+        return self.arrays[key]
+
+    def derived(self, key: tuple, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        if key not in self.arrays:
+            self.arrays[key] = compute()
+        return self.arrays[key]
+
+    def close(self) -> None:
+        for dataset in self.datasets.values():
+            dataset.close()
+        self.datasets = {}
+        self.arrays = {}
+
+
+class OutputVariable(NamedTuple):
+    nome_var: str
+    datatype: object
+    dimensions: tuple
+    dados: np.ndarray
+    atributos: dict
+
+
+class Feature(NamedTuple):
+    prefix: str
+    canais: tuple[str, ...]
+    compute: Callable[[ChannelCache], Iterator[OutputVariable]]
+    description: str
+
+
+def _common_variables(cache: ChannelCache, canais: tuple[str, ...]) -> list[str]:
+    first, *others = canais
+    return [
+        nome_var
+        for nome_var in cache.variables(first)
+        if all(nome_var in cache.variables(canal) for canal in others)
+    ]
+
+
+def _difference(canal_a: str, canal_b: str, description: str):
+    def compute(cache: ChannelCache) -> Iterator[OutputVariable]:
+        for nome_var in _common_variables(cache, (canal_a, canal_b)):
+            dados = cache.derived(
+                ("diff", canal_a, canal_b, nome_var),
+                lambda: cache.read(canal_a, nome_var) - cache.read(canal_b, nome_var),
+            )
+            yield OutputVariable(
+                nome_var,
+                "f4",
+                cache.variables(canal_a)[nome_var].dimensions,
+                dados,
+                {"description": description},
+            )
+
+    return compute
+
+
+def _glaciacao_topo_nuvem(cache: ChannelCache) -> Iterator[OutputVariable]:
+    for nome_var in _common_variables(cache, ("C11", "C14", "C15")):
+        dados = (cache.read("C11", nome_var) - cache.read("C14", nome_var)) - (
+            cache.read("C14", nome_var) - cache.read("C15", nome_var)
+        )
+        yield OutputVariable(
+            nome_var,
+            "f4",
+            cache.variables("C11")[nome_var].dimensions,
+            dados,
+            {"description": "GTN: glaciação topo da nuvem (tri-espectral)"},
+        )
+
+
+def _derivada_temporal_fluxo_ascendente(
+    cache: ChannelCache,
+) -> Iterator[OutputVariable]:
+    variables = cache.variables("C13")
+    for nome_var in variables:
+        partes = nome_var.split("_")[1:]
+        try:
+            year, mes, dia, hora, minuto = map(int, partes)
+            hora_adiante = datetime(year, mes, dia, hora, minuto) + timedelta(
+                minutes=FA_INTERVALO_TEMPORAL
+            )
+        except ValueError:
+            continue
+        nome_adiante = f"CMI_{hora_adiante.year:04}_{hora_adiante.month:02}_{hora_adiante.day:02}_{hora_adiante.hour:02}_{hora_adiante.minute:02}"
+        if nome_adiante in variables:
+            derivada = (
+                cache.read("C13", nome_adiante) - cache.read("C13", nome_var)
+            ) / FA_INTERVALO_TEMPORAL
+            yield OutputVariable(
+                nome_var,
+                "f4",
+                variables[nome_var].dimensions,
+                derivada,
+                {"description": f"Derivada temporal de {nome_var}"},
+            )
+
+
+def _temperatura_topo_nuvem(cache: ChannelCache) -> Iterator[OutputVariable]:
+    for nome_var, var_in in cache.variables("C13").items():
+        yield OutputVariable(
+            nome_var,
+            "f4",
+            var_in.dimensions,
+            cache.read("C13", nome_var),
+            {
+                "description": "Temperatura do topo da nuvem (TOCT) diretamente do canal 13"
+            },
+        )
+
+
+def _tamanho_particulas(cache: ChannelCache) -> Iterator[OutputVariable]:
+    for nome_var, var_in in cache.variables("C07").items():
+        yield OutputVariable(
+            nome_var,
+            var_in.datatype,
+            var_in.dimensions,
+            cache.read("C07", nome_var),
+            {k: var_in.getncattr(k) for k in var_in.ncattrs()},
+        )
+
+
+def _textura_local_profundidade(cache: ChannelCache) -> Iterator[OutputVariable]:
+    for pn in _difference("C09", "C13", "")(cache):
+        # same values textura_local_profundidade reads back from the f4 PN files
+        dados = np.ma.filled(pn.dados, nc.default_fillvals["f4"]).astype("f4")
+        std_local = generic_filter(
+            dados, np.std, size=PN_STD_TAMANHO_JANELA, mode="nearest"
+        )
+        yield OutputVariable(
+            pn.nome_var,
+            "f4",
+            pn.dimensions,
+            std_local,
+            {
+                "description": "Desvio padrão espacial local (textura) da profundidade da nuvem"
+            },
+        )
+
+
+FEATURES = {
+    "pn": Feature(
+        "PN",
+        ("C09", "C13"),
+        _difference("C09", "C13", "PN: profundidade da nuvem (C09 - C13)"),
+        "Diferença entre canais para profundidade da nuvem",
+    ),
+    "gtn": Feature(
+        "GTN",
+        ("C11", "C14", "C15"),
+        _glaciacao_topo_nuvem,
+        "Glaciação topo da nuvem (GTN)",
+    ),
+    "fa": Feature(
+        "FA",
+        ("C13",),
+        _derivada_temporal_fluxo_ascendente,
+        "Derivada temporal do fluxo ascendente",
+    ),
+    "wv_grad": Feature(
+        "WV_grad",
+        ("C09", "C08"),
+        _difference("C09", "C08", "Diferença C09 - C08 (vapor d’água)"),
+        "Gradiente espectral do vapor d’água",
+    ),
+    "li_proxy": Feature(
+        "LI_proxy",
+        ("C14", "C13"),
+        _difference("C14", "C13", "C14 - C13 as a proxy for stability"),
+        "Atmospheric stability proxy from C14 and C13",
+    ),
+    "toct": Feature(
+        "TOCT",
+        ("C13",),
+        _temperatura_topo_nuvem,
+        "TOCT a partir do canal C13",
+    ),
+    "pn_std": Feature(
+        "PNstd",
+        ("C09", "C13"),
+        _textura_local_profundidade,
+        "Textura espacial (desvio padrão local) da feature PN",
+    ),
+    "tp": Feature(
+        "TP",
+        ("C07",),
+        _tamanho_particulas,
+        "TP: tamanho das partículas a partir do canal C07",
+    ),
+}
+
+
+def _list_channel(pasta_canal: Path) -> tuple[str, list[str]]:
+    """
+    Prefix of the channel files and their timestamps, e.g. ("C13", ["2020_01_01_00_00.nc", ...])
+    """
+    if not pasta_canal.is_dir():
+        return "", []
+    arquivos = sorted(os.listdir(pasta_canal))
+    if not arquivos:
+        return "", []
+    prefix = arquivos[0].split("_", 1)[0]
+    return prefix, [f.split("_", 1)[1] for f in arquivos if "_" in f]
+
+
+def _write_feature(
+    feature: Feature, cache: ChannelCache, arq_out: str, timestamp: str
+) -> None:
+    primary = cache.dataset(feature.canais[0])
+    with nc.Dataset(arq_out, "w") as out:
+        for nome_dim, dim in primary.dimensions.items():
+            out.createDimension(nome_dim, len(dim) if not dim.isunlimited() else None)
+        vars_salvas = 0
+        for variable in feature.compute(cache):
+            atributos = dict(variable.atributos)
+            var_out = out.createVariable(
+                variable.nome_var,
+                variable.datatype,
+                variable.dimensions,
+                fill_value=atributos.pop("_FillValue", None),
+            )
+            var_out.setncatts(atributos)
+            var_out[:] = variable.dados
+            vars_salvas += 1
+        if vars_salvas == 0:
+            logger.warning(
+                f"Nenhuma variável processada para {feature.prefix}_{timestamp}, possível incompatibilidade"
+            )
+        out.description = feature.description
+
+
+def extrair_features(pasta_ano: str, features: list[str], pasta_saida: str) -> int:
+    """
+    Computes the requested features of a year in a single pass over its timestamps.
+
+    Each channel directory is listed once and, for each timestamp, each channel file is opened
+    once and its variables are read once, no matter how many features use them. The outputs
+    are the same files written by the per-feature functions of this package.
+
+    Args:
+        pasta_ano (str): Path to the year directory with one subdirectory per channel (e.g. CMI/2020).
+        features (list[str]): Keys of FEATURES to compute (e.g. ["pn", "toct"]).
+        pasta_saida (str): Root output directory, files are written to {pasta_saida}/{feature}/{year}.
+
+    Returns:
+        int: Number of feature files written.
+    """
+    pasta_ano = Path(pasta_ano)
+    year = pasta_ano.name
+
+    canais = sorted({canal for nome in features for canal in FEATURES[nome].canais})
+    listagens = {canal: _list_channel(pasta_ano / canal) for canal in canais}
+    arquivos_canais = {
+        canal: set(timestamps) for canal, (_, timestamps) in listagens.items()
+    }
+
+    selecionadas = []
+    for nome in features:
+        feature = FEATURES[nome]
+        ausentes = [canal for canal in feature.canais if not listagens[canal][1]]
+        if ausentes:
+            logger.warning(f"Canais ausentes para {nome} em {pasta_ano}: {ausentes}")
+            continue
+        pasta_feature = os.path.join(pasta_saida, nome, year)
+        os.makedirs(pasta_feature, exist_ok=True)
+        selecionadas.append((nome, feature, pasta_feature))
+
+    timestamps = sorted(
+        {
+            timestamp
+            for _, feature, _ in selecionadas
+            for timestamp in listagens[feature.canais[0]][1]
+        }
+    )
+
+    escritos = 0
+    for timestamp in timestamps:
+        cache = ChannelCache(
+            {
+                canal: os.path.join(pasta_ano, canal, f"{prefix}_{timestamp}")
+                for canal, (prefix, _) in listagens.items()
+            }
+        )
+        try:
+            for nome, feature, pasta_feature in selecionadas:
+                if timestamp not in arquivos_canais[feature.canais[0]]:
+                    continue
+                arq_out = os.path.join(pasta_feature, f"{feature.prefix}_{timestamp}")
+                if os.path.exists(arq_out):
+                    continue
+                ausentes = [
+                    cache.paths[canal]
+                    for canal in feature.canais
+                    if timestamp not in arquivos_canais[canal]
+                ]
+                if ausentes:
+                    for arquivo in ausentes:
+                        logger.warning(f"Arquivo ausente: {arquivo}")
+                    continue
+
+                try:
+                    _write_feature(feature, cache, arq_out, timestamp)
+                    escritos += 1
+                except Exception:
+                    logger.exception(f"Erro ao processar {nome} de {timestamp}")
+                    if os.path.exists(arq_out):
+                        os.remove(arq_out)
+        finally:
+            cache.close()
+
+    return escritos
@@ -1,4 +1,5 @@
 import argparse
+import hashlib
 import logging
 import os
 import threading
@@ -7,10 +8,16 @@ from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import netCDF4 as nc
+import numpy as np
 import s3fs
 from osgeo import gdal, osr
 
 from config import globals
+from goes16.warp_geometry import (
+    apply_warp_geometry,
+    get_cell_centers,
+    map_pixels_to_cells,
+)
 
 # Lock to synchronize access to shared resources
 download_lock = threading.Lock()
@@ -19,6 +26,18 @@ download_lock = threading.Lock()
 cropped_dict = {}
 cropped_dict_lock = threading.Lock()  # Initialize the lock
 
+# How full disk files are cropped: "cached" (reuses the pixel to grid mapping of each band
+# geometry) or "warp" (gdal.Warp of the whole disk for every file)
+crop_method = "cached"
+
+# Version of the pixel to grid mapping, part of the geometry key so that the mappings saved
+# by previous versions are built again (2: cells without pixel centers are filled)
+WARP_GEOMETRY_VERSION = 2
+
+# Pixel to grid mappings already loaded, by geometry key
+warp_geometries = {}
+warp_geometries_lock = threading.Lock()
+
 ########################################################################
 ### DOWNLOADER
 ########################################################################
@@ -180,6 +199,137 @@ def extract_middle_part(file_path):
     return middle_part
 
 
+def get_warp_geometry_key(fd_dataset, spatial_resolution, extent):
+    """
+    Identifies the geometry of a band: scans of the same band and resolution share it.
+    """
+    geometry = (
+        WARP_GEOMETRY_VERSION,
+        fd_dataset.GetProjectionRef(),
+        tuple(fd_dataset.GetGeoTransform()),
+        fd_dataset.RasterXSize,
+        fd_dataset.RasterYSize,
+        tuple(extent),
+        spatial_resolution,
+    )
+    return hashlib.sha1(repr(geometry).encode()).hexdigest()[:16]
+
+
+def _get_source_window(fd_dataset, to_source, extent):
+    """
+    Smallest block of source pixels (xoff, yoff, xsize, ysize) that covers the extent,
+    found by projecting points along the border of the extent to the source grid.
+    """
+    lons = np.linspace(extent[0], extent[2], 101)
+    lats = np.linspace(extent[1], extent[3], 101)
+    border = np.concatenate(
+        [
+            np.column_stack([lons, np.full_like(lons, extent[1])]),
+            np.column_stack([lons, np.full_like(lons, extent[3])]),
+            np.column_stack([np.full_like(lats, extent[0]), lats]),
+            np.column_stack([np.full_like(lats, extent[2]), lats]),
+        ]
+    )
+    points = np.array(to_source.TransformPoints(border.tolist()))[:, :2]
+    points = points[np.isfinite(points).all(axis=1)]
+
+    x_size, y_size = fd_dataset.RasterXSize, fd_dataset.RasterYSize
+    if len(points) == 0:
+        return 0, 0, x_size, y_size
+
+    x0, dx, _, y0, _, dy = fd_dataset.GetGeoTransform()
+    cols = (points[:, 0] - x0) / dx
+    rows = (points[:, 1] - y0) / dy
+    # a margin of a few pixels for the curvature of the border between the points
+    xoff = max(int(np.floor(cols.min())) - 2, 0)
+    yoff = max(int(np.floor(rows.min())) - 2, 0)
+    x_end = min(int(np.ceil(cols.max())) + 2, x_size)
+    y_end = min(int(np.ceil(rows.max())) + 2, y_size)
+    return xoff, yoff, x_end - xoff, y_end - yoff
+
+
+def build_warp_geometry(fd_dataset, spatial_resolution, extent):
+    """
+    Maps the source pixels inside the extent to the cells of the lat/lon grid (see
+    warp_geometry.map_pixels_to_cells), and returns the mapping with the source window.
+    """
+    source_prj = osr.SpatialReference()
+    source_prj.ImportFromProj4(fd_dataset.GetProjectionRef())
+    source_prj.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    target_prj = osr.SpatialReference()
+    target_prj.ImportFromProj4("+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs")
+    target_prj.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    to_source = osr.CoordinateTransformation(target_prj, source_prj)
+    to_target = osr.CoordinateTransformation(source_prj, target_prj)
+
+    xoff, yoff, xsize, ysize = _get_source_window(fd_dataset, to_source, extent)
+
+    x0, dx, rx, y0, ry, dy = fd_dataset.GetGeoTransform()
+    cols, rows = np.meshgrid(
+        np.arange(xoff, xoff + xsize) + 0.5, np.arange(yoff, yoff + ysize) + 0.5
+    )
+    x = x0 + cols * dx + rows * rx
+    y = y0 + cols * ry + rows * dy
+    lon_lat = np.array(
+        to_target.TransformPoints(np.column_stack([x.ravel(), y.ravel()]).tolist())
+    )[:, :2]
+
+    # The pixel of the window that covers the center of each cell
+    center_lon, center_lat = get_cell_centers(spatial_resolution, extent)
+    center_xy = np.array(
+        to_source.TransformPoints(np.column_stack([center_lon, center_lat]).tolist())
+    )[:, :2]
+    with np.errstate(invalid="ignore"):
+        center_cols = np.floor((center_xy[:, 0] - x0) / dx) - xoff
+        center_rows = np.floor((center_xy[:, 1] - y0) / dy) - yoff
+    covered = (
+        np.isfinite(center_xy).all(axis=1)
+        & (center_cols >= 0)
+        & (center_cols < xsize)
+        & (center_rows >= 0)
+        & (center_rows < ysize)
+    )
+    center_pixels = np.full(len(center_xy), -1, dtype=np.int64)
+    center_pixels[covered] = (
+        center_rows[covered] * xsize + center_cols[covered]
+    ).astype(np.int64)
+
+    warp_geometry = map_pixels_to_cells(
+        lon_lat, center_pixels, spatial_resolution, extent
+    )
+    warp_geometry["window"] = np.array([xoff, yoff, xsize, ysize], dtype=np.int64)
+    return warp_geometry
+
+
+def get_warp_geometry(fd_dataset, spatial_resolution, extent):
+    """
+    Pixel to grid mapping of the band geometry, built once and saved in GOES16_WARP_GEOMETRY_DIR.
+    """
+    key = get_warp_geometry_key(fd_dataset, spatial_resolution, extent)
+    with warp_geometries_lock:
+        if key in warp_geometries:
+            return warp_geometries[key]
+
+        filename = os.path.join(globals.GOES16_WARP_GEOMETRY_DIR, f"{key}.npz")
+        if os.path.exists(filename):
+            with np.load(filename) as geometry:
+                warp_geometry = dict(geometry)
+        else:
+            logging.info(f"Building warp geometry {key}...")
+            warp_geometry = build_warp_geometry(fd_dataset, spatial_resolution, extent)
+            os.makedirs(globals.GOES16_WARP_GEOMETRY_DIR, exist_ok=True)
+            tmp_filename = os.path.join(
+                globals.GOES16_WARP_GEOMETRY_DIR, f"{key}.tmp.npz"
+            )
+            np.savez(tmp_filename, **warp_geometry)
+            os.replace(tmp_filename, filename)
+
+        warp_geometries[key] = warp_geometry
+        return warp_geometry
+
+
 def crop_full_disk(full_disk_filename, spatial_resolution, variable_names, extent):
     # Explicitly choose to use exceptions
     # gdal.UseExceptions()
@@ -202,6 +352,20 @@ def crop_full_disk(full_disk_filename, spatial_resolution, variable_names, exten
         dtime = metadata.get("NC_GLOBAL#time_coverage_start")
         dtime = datetime.strptime(dtime, "%Y-%m-%dT%H:%M:%S.%fZ")
         yyyymmddhhmn = dtime.strftime("%Y_%m_%d_%H_%M")
+        key = f"{var}_{yyyymmddhhmn}"
+
+        if crop_method == "cached":
+            warp_geometry = get_warp_geometry(fd_dataset, spatial_resolution, extent)
+
+            # Read only the source pixels that can fall inside the extent
+            xoff, yoff, xsize, ysize = (int(v) for v in warp_geometry["window"])
+            ds = fd_dataset.ReadAsArray(xoff, yoff, xsize, ysize).astype(float)
+            ds[ds == undef] = np.nan
+            ds = ds * scale + offset
+
+            cropped_content_dict[key] = apply_warp_geometry(ds, warp_geometry)
+            fd_dataset = None
+            continue
 
         # Read the full disk data into a NumPy array
         ds = fd_dataset.ReadAsArray(
@@ -253,7 +417,6 @@ def crop_full_disk(full_disk_filename, spatial_resolution, variable_names, exten
         mem_band = mem_dataset.GetRasterBand(1)
         warped_data = mem_band.ReadAsArray()
 
-        key = f"{var}_{yyyymmddhhmn}"
         cropped_content_dict[key] = warped_data
 
         # Clean up
@@ -348,6 +511,13 @@ if __name__ == "__main__":
         default=[6, 7, 8],
         help="Months to ignore (e.g., --ignored_months 6 7 8)",
     )
+    parser.add_argument(
+        "--crop_method",
+        type=str,
+        choices=["cached", "warp"],
+        default="cached",
+        help="cached: reuse the pixel to grid mapping of the band (built once and saved), warp: gdal.Warp each full disk",
+    )
     parser.add_argument(
         "--vars",
         nargs="+",
@@ -370,6 +540,7 @@ if __name__ == "__main__":
     spatial_resolution = args.spatial_resolution
     ignored_months = args.ignored_months
     variable_names = args.vars
+    crop_method = args.crop_method
 
     start_time = time.time()  # Record the start time
     download_dir = "./downloads"
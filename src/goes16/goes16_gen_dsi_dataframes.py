@@ -1,23 +1,135 @@
+import argparse
 import logging
 import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from netCDF4 import Dataset
 
 from utils.util import split_filename
 
 
+def get_timestamp(filename):
+    # The timestamp is a substring of the filename!
+    dir_path, base_name, file_ext = split_filename(filename)
+    return base_name.partition("_")[0]
+
+
+def get_feature_names(variable_name, shape):
+    return [f"{variable_name}{y}{x}" for y in range(shape[0]) for x in range(shape[1])]
+
+
+def read_dsi_files(filenames, variable_name):
+    """
+    Reads the Band1 grids of a batch of files of a DSI variable into a DataFrame with one
+    row per file (indexed by its timestamp) and one column per pixel, in row-major order.
+    Masked pixels are NaN.
+    """
+    timestamps = []
+    rows = []
+    shape = None
+    for filename in filenames:
+        try:
+            with Dataset(filename) as file:
+                # Get the pixel values
+                data = file.variables["Band1"][:]
+        except Exception as e:
+            logging.error(f"Error reading file {filename}: {e}")
+            continue
+
+        if shape is None:
+            shape = data.shape
+        elif data.shape != shape:
+            logging.error(
+                f"File {filename} has shape {data.shape}, expected {shape}. Skipping it."
+            )
+            continue
+
+        timestamps.append(get_timestamp(filename))
+        rows.append(np.ma.filled(data.astype(np.float32), np.nan).ravel())
+
+    if not rows:
+        return None
+
+    df = pd.DataFrame(
+        np.stack(rows),
+        columns=get_feature_names(variable_name, shape),
+        index=pd.DatetimeIndex(pd.to_datetime(timestamps), name="timestamp"),
+    )
+    return df
+
+
+def build_dsi_dataframe(
+    variable_name, filenames, df_filename, batch_size=1000, max_workers=None
+):
+    """
+    Writes the DSI dataframe of a variable to a parquet file, one row group per batch of files.
+
+    The batches are read in parallel worker processes. The files are sorted by timestamp
+    before being split in batches, so the resulting file is sorted by its index.
+    """
+    filenames = sorted(filenames, key=get_timestamp)
+    batches = [
+        filenames[i : i + batch_size] for i in range(0, len(filenames), batch_size)
+    ]
+
+    writer = None
+    shape = (0, 0)
+    counter = 0
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for df in executor.map(read_dsi_files, batches, repeat(variable_name)):
+                if df is None:
+                    continue
+                table = pa.Table.from_pandas(df, preserve_index=True)
+                if writer is None:
+                    writer = pq.ParquetWriter(df_filename, table.schema)
+                elif not table.schema.equals(writer.schema):
+                    logging.error(
+                        f"Batch with columns {df.columns[:3].tolist()}... doesn't match the first batch. Skipping it."
+                    )
+                    continue
+                writer.write_table(table)
+                counter += len(df)
+                shape = (counter, df.shape[1])
+                logging.info(f"Number of processed files: {counter}")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return shape
+
+
 def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Builds one dataframe (parquet file) per DSI variable, with one row per timestamp and one column per pixel."
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1000,
+        help="Number of files read by each worker at a time.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPUs).",
+    )
+    args = parser.parse_args(argv[1:])
+
     # Set the folder containing the DSI files
     input_folder_path = "./data/goes16/DSI"
 
     dsi_variable_names = ["CAPE", "LI", "TT", "SI", "KI"]
 
     for variable_name in dsi_variable_names:
-        df = None
-
         # Create a list to store all the variable's timestamped files in the folder and subfolders
         filenames = []
         for root, dirs, files in os.walk(input_folder_path):
@@ -28,52 +140,16 @@ def main(argv):
 
         logging.info(f"Total number of files: {len(filenames)}")
 
-        # Loop through the selected timestamped files
-        counter = 0
-        for filename in filenames:
-            if (counter > 0) and (counter % 5000 == 0):
-                logging.info(f"Number of processed files: {counter}")
-            counter += 1
-
-            file = Dataset(f"{filename}")
-
-            # The timestamp is a substring of the filename!
-            dir_path, base_name, file_ext = split_filename(filename)
-            yyyymmddhhmn = base_name.partition("_")[0]
-
-            # Get the pixel values
-            data = file.variables["Band1"][:]
-
-            if df is None:
-                feature_names = []
-                for y in range(data.shape[0]):
-                    for x in range(data.shape[1]):
-                        feature_names += [f"{variable_name}{y}{x}"]
-                df = pd.DataFrame(columns=["timestamp", *feature_names])
-
-            feature_values = []
-            for y in range(data.shape[0]):
-                for x in range(data.shape[1]):
-                    feature_values += [data[y, x]]
-
-            # See https://stackoverflow.com/questions/70837397/good-alternative-to-pandas-append-method-now-that-it-is-being-deprecated
-            df.loc[len(df), df.columns] = [yyyymmddhhmn] + feature_values
-
-        logging.info("Creating index in dataframe...")
-
-        # Set the index to 'timestamp'
-        timestamp = pd.to_datetime(df.timestamp)
-        df = df.set_index(pd.DatetimeIndex(timestamp))
-
-        # Sort the DataFrame by the 'timestamp' column
-        df.sort_index(inplace=True)
-
-        logging.info("Done!")
-
         df_filename = f"{variable_name}.parquet"
-        df.to_parquet(df_filename)
+        shape = build_dsi_dataframe(
+            variable_name,
+            filenames,
+            df_filename,
+            batch_size=args.batch_size,
+            max_workers=args.workers,
+        )
         logging.info(
-            f"A Pandas dataframe with shape {df.shape} was created and saved in the file {df_filename}."
+            f"A Pandas dataframe with shape {shape} was created and saved in the file {df_filename}."
         )
 
 
@@ -8,6 +8,7 @@ from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import netCDF4 as nc
+import numpy as np
 import numpy.ma as ma
 import s3fs
 from netCDF4 import Dataset
@@ -36,47 +37,79 @@ def clear_directory(directory):
     create_directory(directory)
 
 
-def create_grid_spatial_resolution(
-    lon_min, lon_max, lat_min, lat_max, flash_lat, flash_lon, spatial_resolution
-):
+def get_grid_shape(lon_min, lon_max, lat_min, lat_max, spatial_resolution):
     n_lat = round((lat_max - lat_min) / spatial_resolution)
     n_lon = round((lon_max - lon_min) / spatial_resolution)
+    return (n_lat, n_lon)
+
+
+def accumulate_flashes(grid, lon_min, lon_max, lat_min, lat_max, flash_lat, flash_lon):
+    """
+    Adds to each cell of the grid (in place) the number of flashes inside it.
 
-    shape = (n_lat, n_lon)
+    The flashes are binned with a single np.bincount over the flattened cell indexes;
+    masked flashes and flashes out of the bounds are skipped.
+    """
+    n_lat, n_lon = grid.shape
 
     # Interval size
     intervalo_lat = (lat_max - lat_min) / n_lat
     intervalo_lon = (lon_max - lon_min) / n_lon
-    # Initialize grid with zeroes
-    grid = ma.zeros(shape, dtype=int)
-    # Iterating over (lat, lon) list
-    for lat, lon in zip(flash_lat, flash_lon):
-        if not (lat_min <= lat <= lat_max and lon_min <= lon <= lon_max):
-            continue  # Skipping (lat, lon) out of the bound
-        # Intervals idx
-        idx_lat = int((lat - lat_min) / intervalo_lat)
-        idx_lon = int((lon - lon_min) / intervalo_lon)
-        # Idx on range
-        idx_lat = max(0, min(idx_lat, n_lat - 1))
-        idx_lon = max(0, min(idx_lon, n_lon - 1))
-        # Adding one to the corresponding pair matched on the grid
-        grid[idx_lat, idx_lon] += 1
 
+    valid = ~(ma.getmaskarray(flash_lat) | ma.getmaskarray(flash_lon))
+    flash_lat = ma.getdata(flash_lat)[valid]
+    flash_lon = ma.getdata(flash_lon)[valid]
+
+    # Skipping (lat, lon) out of the bound
+    inside = (
+        (lat_min <= flash_lat)
+        & (flash_lat <= lat_max)
+        & (lon_min <= flash_lon)
+        & (flash_lon <= lon_max)
+    )
+    flash_lat = flash_lat[inside]
+    flash_lon = flash_lon[inside]
+
+    # Intervals idx, on range
+    idx_lat = ((flash_lat - lat_min) / intervalo_lat).astype(int).clip(0, n_lat - 1)
+    idx_lon = ((flash_lon - lon_min) / intervalo_lon).astype(int).clip(0, n_lon - 1)
+
+    counts = np.bincount(idx_lat * n_lon + idx_lon, minlength=n_lat * n_lon)
+    grid += counts.reshape(grid.shape)
     return grid
 
 
-def generate_structure(year, month, day):
+def create_grid_spatial_resolution(
+    lon_min, lon_max, lat_min, lat_max, flash_lat, flash_lon, spatial_resolution
+):
+    shape = get_grid_shape(lon_min, lon_max, lat_min, lat_max, spatial_resolution)
+
+    # Initialize grid with zeroes
+    grid = ma.zeros(shape, dtype=int)
+    return accumulate_flashes(
+        grid,
+        lon_min,
+        lon_max,
+        lat_min,
+        lat_max,
+        ma.asarray(flash_lat),
+        ma.asarray(flash_lon),
+    )
+
+
+def generate_structure(year, month, day, shape):
     # Define the fixed start of the day.
     base_date = datetime(year, month, day, 0, 0)  # yyyy-mm-dd hh:mm
 
     # Creating an empty dictionary
     data = {}
 
-    # Generating 48 timestamps starting from 00:00, with intervals of 30 minutes
+    # Generating 48 timestamps starting from 00:00, with intervals of 30 minutes,
+    # each one with its grid of flash counts
     for i in range(48):
         timestamp = base_date + timedelta(minutes=30 * i)
         timestamp_key = timestamp.strftime("%Y_%m_%d_%H_%M")  # Format: yyyy_mm_dd_hh_mm
-        data[timestamp_key] = {"latitude": [], "longitude": []}
+        data[timestamp_key] = ma.zeros(shape, dtype=int)
 
     return data
 
@@ -139,8 +172,9 @@ def aggregate_daily_files(
         f"Aggregating {len(files)} files from {day_directory} into {output_file}."
     )
 
-    # Initialization of a structure to store the latitudes and longitudes for the 48 timestamps
-    data = generate_structure(year, month, day)
+    # Initialization of a structure to store the grids of the 48 timestamps
+    shape = get_grid_shape(lon_min, lon_max, lat_min, lat_max, spatial_resolution)
+    data = generate_structure(year, month, day, shape)
 
     for file in files:
         try:
@@ -153,9 +187,16 @@ def aggregate_daily_files(
                 # Adjusting timestamp with the expected format
                 formatted_time = adjust_to_previous_interval(dt, interval_minutes=30)
 
-                # Update lat lon
-                data[formatted_time]["latitude"].extend(latitudes)
-                data[formatted_time]["longitude"].extend(longitudes)
+                # Add the flashes of the file to the grid of its timestamp
+                accumulate_flashes(
+                    data[formatted_time],
+                    lon_min,
+                    lon_max,
+                    lat_min,
+                    lat_max,
+                    latitudes,
+                    longitudes,
+                )
 
         except Exception as e:
             logging.error(f"Error reading file {file}: {e}")
@@ -163,19 +204,7 @@ def aggregate_daily_files(
     # Create a new netCDF file
     with nc.Dataset(output_file, "w", format="NETCDF4") as dataset:
         # Loop through the dictionary and add data to the netCDF file
-        for key in data:
-            latitude = data[key]["latitude"]
-            longitude = data[key]["longitude"]
-            grid = create_grid_spatial_resolution(
-                lon_min,
-                lon_max,
-                lat_min,
-                lat_max,
-                latitude,
-                longitude,
-                spatial_resolution,
-            )
-
+        for key, grid in data.items():
             # Create dimensions based on the shape of the numpy array
             for i, dim_size in enumerate(grid.shape):
                 dim_name = f"dim_{i}_{key}"
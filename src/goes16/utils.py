@@ -6,6 +6,13 @@ DATA_ROOT = Path(globals.GOES16_DATA_DIR)
 FEATURES_ROOT = Path(globals.GOES16_FEATURES_DIR)
 
 
+def build_year_paths():
+    """
+    Retorna uma lista de caminhos para cada ano com dados de canais.
+    """
+    return [year for year in sorted(DATA_ROOT.iterdir()) if year.is_dir()]
+
+
 def build_channel_paths_by_year(channel: str):
     """
     Retorna uma lista de caminhos para cada ano contendo dados do canal especificado.
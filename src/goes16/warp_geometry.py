@@ -0,0 +1,85 @@
+"""
+Mapping of the pixels of a full disk window to the cells of a lat/lon grid, and the crop
+of a scan through it. The mapping is built by goes16_download_crop.build_warp_geometry.
+"""
+
+import numpy as np
+
+
+def get_target_grid_shape(spatial_resolution, extent):
+    """
+    Number of rows and columns of the lat/lon grid, rounded the same way gdal.Warp does.
+    """
+    n_cols = int((extent[2] - extent[0] + spatial_resolution / 2) / spatial_resolution)
+    n_rows = int((extent[3] - extent[1] + spatial_resolution / 2) / spatial_resolution)
+    return n_rows, n_cols
+
+
+def get_cell_centers(spatial_resolution, extent):
+    """
+    Longitudes and latitudes of the centers of the cells of the grid, row by row from the
+    north-west corner of extent.
+    """
+    n_rows, n_cols = get_target_grid_shape(spatial_resolution, extent)
+    lons = extent[0] + (np.arange(n_cols) + 0.5) * spatial_resolution
+    lats = extent[3] - (np.arange(n_rows) + 0.5) * spatial_resolution
+    lon, lat = np.meshgrid(lons, lats)
+    return lon.ravel(), lat.ravel()
+
+
+def map_pixels_to_cells(pixel_lon_lat, center_pixels, spatial_resolution, extent):
+    """
+    Each pixel goes to the cell that contains its center, given by pixel_lon_lat, the
+    longitude and latitude of the center of each pixel of the window. A cell that contains
+    no pixel center (a grid finer than the pixels) gets the pixel that covers the center
+    of the cell, center_pixels[cell], or none if it is -1.
+
+    Returns the positions of the pixels (sorted by cell), the cells and the start of each
+    cell in the pixels, so a crop is a gather of the window followed by a max per cell.
+    """
+    n_rows, n_cols = get_target_grid_shape(spatial_resolution, extent)
+    with np.errstate(invalid="ignore"):
+        cell_cols = np.floor((pixel_lon_lat[:, 0] - extent[0]) / spatial_resolution)
+        cell_rows = np.floor((extent[3] - pixel_lon_lat[:, 1]) / spatial_resolution)
+    inside = (
+        np.isfinite(pixel_lon_lat).all(axis=1)
+        & (cell_cols >= 0)
+        & (cell_cols < n_cols)
+        & (cell_rows >= 0)
+        & (cell_rows < n_rows)
+    )
+
+    pixels = np.flatnonzero(inside)
+    cells = (cell_rows[inside] * n_cols + cell_cols[inside]).astype(np.int64)
+
+    center_pixels = np.asarray(center_pixels, dtype=np.int64)
+    empty = np.ones(n_rows * n_cols, dtype=bool)
+    empty[cells] = False
+    empty &= center_pixels >= 0
+    pixels = np.concatenate([pixels, center_pixels[empty]])
+    cells = np.concatenate([cells, np.flatnonzero(empty)])
+
+    order = np.argsort(cells, kind="stable")
+    pixels, cells = pixels[order], cells[order]
+    cell_starts = np.flatnonzero(np.diff(cells, prepend=-1))
+
+    return {
+        "shape": np.array([n_rows, n_cols], dtype=np.int64),
+        "pixels": pixels,
+        "cells": cells[cell_starts],
+        "cell_starts": cell_starts,
+    }
+
+
+def apply_warp_geometry(values, warp_geometry):
+    """
+    Max of the values of the pixels of each cell (NaN values ignored), NaN for cells without pixels.
+    """
+    n_rows, n_cols = warp_geometry["shape"]
+    cropped = np.full(n_rows * n_cols, np.nan, dtype=np.float32)
+    if len(warp_geometry["pixels"]) > 0:
+        gathered = values.ravel()[warp_geometry["pixels"]]
+        cropped[warp_geometry["cells"]] = np.fmax.reduceat(
+            gathered, warp_geometry["cell_starts"]
+        )
+    return cropped.reshape(n_rows, n_cols)
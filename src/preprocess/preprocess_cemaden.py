@@ -4,11 +4,10 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
-from metpy.calc import wind_components
-from metpy.units import units
 from sklearn.impute import KNNImputer
 
 from config import globals
+from utils.util import get_wind_components
 
 
 def add_hour_related_features(df):
@@ -19,20 +18,10 @@ def add_hour_related_features(df):
     return df
 
 
-def transform_wind(wind_speed, wind_direction, comp_idx):
-    assert comp_idx in [0, 1]
-    return wind_components(wind_speed * units("m/s"), wind_direction * units.deg)[
-        comp_idx
-    ].magnitude
-
-
 def add_wind_related_features(df):
-    df["wind_direction_u"] = df.apply(
-        lambda x: transform_wind(x.wind_speed, x.wind_dir, 0), axis=1
-    )
-    df["wind_direction_v"] = df.apply(
-        lambda x: transform_wind(x.wind_speed, x.wind_dir, 1), axis=1
-    )
+    u, v = get_wind_components(df["wind_speed"], df["wind_dir"])
+    df["wind_direction_u"] = u
+    df["wind_direction_v"] = v
     return df
 
 
@@ -2,6 +2,8 @@ import argparse
 import glob
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 import numpy as np
 import pandas as pd
@@ -16,6 +18,12 @@ station_ids_for_goes16 = {
     "A627": {"latitude": -22.86749999, "longitude": -43.10194444},
 }
 
+# Radius (in kilometers) around each station for filtering
+RADIUS_KM = 10
+EARTH_RADIUS_KM = 6371
+
+EVENT_VARIABLES = ["event_time_offset", "event_lat", "event_lon", "event_energy"]
+
 
 def haversine(lat1, lon1, lat2, lon2):
     """
@@ -35,7 +43,7 @@ def haversine(lat1, lon1, lat2, lon2):
     Note:
     The radius of the Earth is assumed to be 6371 kilometers.
     """
-    R = 6371  # Earth radius in kilometers
+    R = EARTH_RADIUS_KM  # Earth radius in kilometers
     dLat = np.radians(lat2 - lat1)
     dLon = np.radians(lon2 - lon1)
     a = np.sin(dLat / 2) * np.sin(dLat / 2) + np.cos(np.radians(lat1)) * np.cos(
@@ -46,67 +54,119 @@ def haversine(lat1, lon1, lat2, lon2):
     return distance
 
 
-def read_and_process_files(files, station_id, g16_pre_process_data_file):
+def get_bounding_box(station_ids, radius_km):
     """
-    Read and process a batch of NetCDF files containing TPW data.
+    Smallest lat/lon box that contains the circles of radius_km around all the stations,
+    with a margin, so the events outside of it can be discarded without computing distances.
+    """
+    lats = np.array([station_ids_for_goes16[s]["latitude"] for s in station_ids])
+    lons = np.array([station_ids_for_goes16[s]["longitude"] for s in station_ids])
+    # 10% margin over the degrees spanned by radius_km along a meridian
+    delta_lat = 1.1 * np.degrees(radius_km / EARTH_RADIUS_KM)
+    lat_min, lat_max = lats.min() - delta_lat, lats.max() + delta_lat
+    max_abs_lat = min(max(abs(lat_min), abs(lat_max)), 89.0)
+    delta_lon = delta_lat / np.cos(np.radians(max_abs_lat))
+    return lat_min, lat_max, lons.min() - delta_lon, lons.max() + delta_lon
+
+
+def filter_events_by_station(df, station_ids, radius_km):
+    """
+    Splits the events of df by station, keeping the events within radius_km of each station.
+
+    The distances of all the events inside the bounding box of the stations to all the
+    stations are computed with a single call to haversine over a (events, stations) grid.
+
+    Returns:
+        dict: station id -> rows of df within radius_km of the station
+    """
+    lat_min, lat_max, lon_min, lon_max = get_bounding_box(station_ids, radius_km)
+    event_lat = df["event_lat"].to_numpy(dtype=np.float64)
+    event_lon = df["event_lon"].to_numpy(dtype=np.float64)
+    in_box = (
+        (event_lat >= lat_min)
+        & (event_lat <= lat_max)
+        & (event_lon >= lon_min)
+        & (event_lon <= lon_max)
+    )
+    df = df[in_box]
+
+    station_lat = np.array([station_ids_for_goes16[s]["latitude"] for s in station_ids])
+    station_lon = np.array(
+        [station_ids_for_goes16[s]["longitude"] for s in station_ids]
+    )
+    distances = haversine(
+        station_lat[np.newaxis, :],
+        station_lon[np.newaxis, :],
+        event_lat[in_box, np.newaxis],
+        event_lon[in_box, np.newaxis],
+    )
+    within = distances <= radius_km
+
+    return {station_id: df[within[:, j]] for j, station_id in enumerate(station_ids)}
+
+
+def read_and_process_files(files, station_ids, radius_km=RADIUS_KM):
+    """
+    Read and process a batch of NetCDF files containing GLM events.
 
     Args:
         files (list of str): A list of file paths to NetCDF files.
-        station_id (str): The station ID for processing data.
+        station_ids (list of str): The station IDs to extract the events for.
+        radius_km (float): Radius (in kilometers) around each station for filtering.
 
     Returns:
-        g16_pre_process_data_file (list): list with file pre processed
+        dict: station id -> DataFrame with the Datetime and event_energy of the events of the batch
     """
-    g16_data_file = []
-    station_lat = station_ids_for_goes16[station_id]["latitude"]
-    station_lon = station_ids_for_goes16[station_id]["longitude"]
-    # Define a radius (in kilometers) for filtering
-    radius_km = 10
-    for i in range(0, len(files)):
+    station_frames = {station_id: [] for station_id in station_ids}
+    for g16_data in files:
         try:
-            nc_indx = i
-            g16_data = files[nc_indx]
-            g16_data_file.append(g16_data)
-            ds = xr.open_dataset(
-                g16_data_file[i],
-                cache=False,
-            )
-            df = ds.to_dataframe()
-            df = df[
-                df.apply(
-                    lambda row: haversine(
-                        station_lat, station_lon, row["event_lat"], row["event_lon"]
+            with xr.open_dataset(g16_data, cache=False) as ds:
+                # only the event variables, all of them along the events dimension
+                df = ds[EVENT_VARIABLES].to_dataframe()
+            for station_id, df_station in filter_events_by_station(
+                df, station_ids, radius_km
+            ).items():
+                station_frames[station_id].append(
+                    pd.DataFrame(
+                        {
+                            "Datetime": df_station["event_time_offset"]
+                            .astype("datetime64[us]")
+                            .to_numpy(),
+                            "event_energy": df_station["event_energy"].to_numpy(
+                                dtype=np.float64
+                            ),
+                        }
                     )
-                    <= radius_km,
-                    axis=1,
                 )
-            ]
-            df["event_time_offset"] = df["event_time_offset"].astype("datetime64[us]")
-            g16_pre_process_data_file["Datetime"].extend(df["event_time_offset"])
-            g16_pre_process_data_file["event_energy"].extend(df["event_energy"])
-            ds.close()
         except Exception as e:
             print(f"Error processing file {g16_data}: {e}")
 
-    return g16_pre_process_data_file
+    return {
+        station_id: (
+            pd.concat(frames, ignore_index=True)
+            if frames
+            else pd.DataFrame({"Datetime": [], "event_energy": []})
+        )
+        for station_id, frames in station_frames.items()
+    }
 
 
-def pre_process_tpw_product(path, station_id):
+def pre_process_tpw_product(path, station_ids, max_workers=None):
     """
-    Preprocess Total Precipitable Water (TPW) data from NetCDF files and save it to a Parquet file.
+    Preprocess GLM events from NetCDF files and save them to one Parquet file per station.
 
     Args:
         path (str): The path to the directory containing NetCDF data files.
-        station_id (str): The station ID for processing data.
+        station_ids (list of str): The station IDs for processing data.
+        max_workers (int): Number of worker processes (default: number of CPUs).
 
     Returns:
         None
 
-    This function reads TPW data from a batch of NetCDF files, processes it, and saves it to a Parquet file.
-    The function navigates to the specified directory, collects TPW files, and processes them in batches of
-    1000 files to optimize memory usage. Processed data is stored in a Pandas DataFrame and then appended
-    to an existing Parquet file or a new one is created if it doesn't exist. Finally, the function returns
-    None after completing the preprocessing and saving.
+    This function reads GLM data from batches of 1000 NetCDF files, processed in parallel worker
+    processes. Each file is read once and its events are split among all the stations. The events
+    of each station are stored in a Pandas DataFrame and then appended to its existing Parquet file
+    or a new one is created if it doesn't exist.
     """
     # navigate to directory with .nc data files
     os.chdir(str(path))
@@ -118,40 +178,51 @@ def pre_process_tpw_product(path, station_id):
     if not os.path.exists(parquet_dir):
         os.makedirs(parquet_dir)
 
-    parquet_path = f"data/parquet_files/glm_{station_id}_preprocessed_file.parquet"
-
     batch_size = 1000
     total_files = len(nc_files)
-
-    g16_pre_process_data_file = {"Datetime": [], "event_energy": []}
+    batches = [nc_files[i : i + batch_size] for i in range(0, total_files, batch_size)]
 
     print(f"You have {total_files} to be processed")
 
-    for i in range(0, total_files, batch_size):
-        batch_files = nc_files[i : i + batch_size]
-        read_and_process_files(batch_files, station_id, g16_pre_process_data_file)
-        print(f"{len(g16_pre_process_data_file)} Files was pre processed")
+    station_frames = {station_id: [] for station_id in station_ids}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # map keeps the order of the batches, so the events stay sorted by file
+        for i, batch_frames in enumerate(
+            executor.map(read_and_process_files, batches, repeat(station_ids))
+        ):
+            for station_id, df in batch_frames.items():
+                station_frames[station_id].append(df)
+            print(
+                f"{min((i + 1) * batch_size, total_files)} of {total_files} files pre processed"
+            )
+
+    for station_id in station_ids:
+        frames = station_frames[station_id]
+        df = (
+            pd.concat(frames, ignore_index=True)
+            if frames
+            else pd.DataFrame({"Datetime": [], "event_energy": []})
+        )
 
-    # Create a DataFrame from the list of dictionaries
-    df = pd.DataFrame(g16_pre_process_data_file)
+        # Set the 'Datetime' column as the DatetimeIndex
+        df["Datetime"] = pd.to_datetime(df["Datetime"])
+        df = df.set_index(pd.DatetimeIndex(df["Datetime"]))
 
-    # Set the 'Datetime' column as the DatetimeIndex
-    df["Datetime"] = pd.to_datetime(df["Datetime"])
-    df = df.set_index(pd.DatetimeIndex(df["Datetime"]))
+        # Remove time-related columns since now this information is in the index.
+        df = df.drop(["Datetime"], axis=1)
 
-    # Remove time-related columns since now this information is in the index.
-    df = df.drop(["Datetime"], axis=1)
+        parquet_path = f"data/parquet_files/glm_{station_id}_preprocessed_file.parquet"
 
-    # Append to the existing Parquet file or create a new one
-    if os.path.exists(parquet_path):
-        table = pq.read_table(parquet_path)
-        df_existing = table.to_pandas()
-        df_combined = pd.concat([df_existing, df])
-    else:
-        df_combined = df
+        # Append to the existing Parquet file or create a new one
+        if os.path.exists(parquet_path):
+            table = pq.read_table(parquet_path)
+            df_existing = table.to_pandas()
+            df_combined = pd.concat([df_existing, df])
+        else:
+            df_combined = df
 
-    # Save the combined DataFrame to a Parquet file
-    df_combined.to_parquet(parquet_path, compression="gzip")
+        # Save the combined DataFrame to a Parquet file
+        df_combined.to_parquet(parquet_path, compression="gzip")
 
     return
 
@@ -163,17 +234,26 @@ def main(argv):
     parser.add_argument(
         "-s",
         "--station_id",
-        required=True,
-        help="ID of the weather station to preprocess data for.",
+        nargs="+",
+        choices=list(station_ids_for_goes16),
+        default=list(station_ids_for_goes16),
+        help="IDs of the weather stations to preprocess data for (default: all of them).",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPUs).",
     )
     args = parser.parse_args(argv[1:])
 
     directory = "data/goes16/glm_files"
 
-    station_id = args.station_id
+    station_ids = args.station_id
 
     print("\n***Preprocessing GLM Files***")
-    pre_process_tpw_product(directory, station_id)
+    pre_process_tpw_product(directory, station_ids, max_workers=args.workers)
     print("Done!")
 
 
@@ -8,11 +8,11 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
-from sklearn.impute import KNNImputer
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
 
 from config import globals
 from utils import utils
+from utils.imputation import DEFAULT_STRATEGY, apply_imputation
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 SRC_DIR = PROJECT_ROOT / "src"
@@ -116,40 +116,6 @@ def apply_scaling(df: pd.DataFrame, scaler_config: dict) -> pd.DataFrame:
     return scaled_df
 
 
-def apply_imputation(df: pd.DataFrame, imputation_config: dict) -> pd.DataFrame:
-    if df.empty:
-        return df
-    imputation_config = imputation_config or {}
-    strategy = imputation_config.get("strategy", "knn")
-    if not isinstance(strategy, str):
-        logging.warning(
-            f"Invalid imputation strategy '{strategy}'. Skipping imputation."
-        )
-        return df
-    strategy = strategy.lower()
-    params = imputation_config.get("params", {}) or {}
-
-    if strategy == "knn":
-        n_neighbors = params.get("n_neighbors", 2)
-        weights = params.get("weights", "uniform")
-        imputer = KNNImputer(n_neighbors=n_neighbors, weights=weights)
-        imputed = imputer.fit_transform(df)
-        return pd.DataFrame(imputed, columns=df.columns, index=df.index)
-    if strategy in {"ffill_then_zero", "forward_then_zero"}:
-        return df.ffill().fillna(0.0)
-    if strategy in {"ffill", "forward"}:
-        return df.ffill()
-    if strategy in {"bfill", "backward"}:
-        return df.bfill()
-    if strategy in {"zero", "zeros"}:
-        return df.fillna(0.0)
-    if strategy in {"none", "skip"}:
-        return df
-
-    logging.warning(f"Unknown imputation strategy '{strategy}'. Skipping imputation.")
-    return df
-
-
 def apply_quality_checks(
     df: pd.DataFrame,
     quality_config: dict,
@@ -590,9 +556,9 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system, raw_format=
     # Imput missing values on some features.
     if impute_missing_values:
         strategy = (
-            (imputation_config.get("strategy") or "knn")
+            (imputation_config.get("strategy") or DEFAULT_STRATEGY)
             if isinstance(imputation_config, dict)
-            else "knn"
+            else DEFAULT_STRATEGY
         )
         logging.info(f"Applying '{strategy}' imputation...")
         percentage_missing = (
@@ -609,7 +575,7 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system, raw_format=
     strategy_value = None
     strategy_flag = True
     if isinstance(imputation_config, dict):
-        strategy_value = imputation_config.get("strategy", "knn")
+        strategy_value = imputation_config.get("strategy", DEFAULT_STRATEGY)
         if isinstance(strategy_value, str):
             strategy_flag = strategy_value.lower() not in {"none", "skip"}
     imputation_applied = bool(impute_missing_values and strategy_flag)
@@ -1,5 +1,7 @@
 import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Optional
 
 import pandas as pd
 from tqdm import tqdm
@@ -18,9 +20,14 @@ log = logger.get_logger(__name__)
 
 class AlertarioKeys:
     def __init__(
-        self, alertario_parser: AlertarioParser, alertario_coords: pd.DataFrame
+        self,
+        alertario_parser: AlertarioParser,
+        alertario_coords: pd.DataFrame,
+        alertario_keys_path: Optional[Path] = None,
     ) -> None:
-        self.alertario_keys_path = Path(__file__).parent / "alertario_keys"
+        self.alertario_keys_path = (
+            alertario_keys_path or Path(__file__).parent / "alertario_keys"
+        )
         if not self.alertario_keys_path.exists():
             self.alertario_keys_path.mkdir()
         self.alertario_describe_path = self.alertario_keys_path / "describe"
@@ -47,21 +54,58 @@ class AlertarioKeys:
     def load_key(self, key: str) -> pd.DataFrame:
         return pd.read_parquet(f"{self.alertario_keys_path}/{key}.parquet")
 
-    def _merge_coords_by_estacao_desc(
-        self, df: pd.DataFrame, estacao_desc: str
-    ) -> pd.DataFrame:
+    def _get_station_coords(self, estacao_desc: str) -> tuple[str, str]:
         station = self.alertario_coords[
             self.alertario_coords["estacao_desc"] == estacao_desc
         ]
-        lat = station["latitude"].values[0]
-        lon = station["longitude"].values[0]
+        return station["latitude"].values[0], station["longitude"].values[0]
+
+    def _merge_coords_by_estacao_desc(
+        self, df: pd.DataFrame, estacao_desc: str
+    ) -> pd.DataFrame:
+        lat, lon = self._get_station_coords(estacao_desc)
         df["estacao_desc"] = estacao_desc
         df["latitude"] = lat
         df["longitude"] = lon
         AlertarioKeySchema.validate(df)
         return df
 
-    def build_keys(self, use_cache: bool = True) -> None:
+    def _check_region_of_interest(self, station: str, region_of_interest: dict):
+        lat, lon = map(float, self._get_station_coords(station))
+        if not (
+            lat <= region_of_interest["north"]
+            and lat >= region_of_interest["south"]
+            and lon <= region_of_interest["east"]
+            and lon >= region_of_interest["west"]
+        ):
+            log.error(
+                f"""
+                Station {station} is not in the region of interest:
+                Station lat: {lat}
+                Station lon: {lon}
+                Region of interest: {region_of_interest}
+            """
+            )
+            exit(1)
+
+    def _build_station_key(self, station: str) -> tuple[pd.Timestamp, pd.Timestamp]:
+        """
+        Parses and writes the key of a station in a worker process.
+        Returns the minimum and maximum dates of the station.
+        """
+        data = self.alertario_parser.process_station(station)
+        data = self._merge_coords_by_estacao_desc(data, station)
+        self._write_key(data)
+        self._serialize_describe(data, self.alertario_describe_path)
+        return data["datetime"].min(), data["datetime"].max()
+
+    def build_keys(
+        self, use_cache: bool = True, max_workers: Optional[int] = None
+    ) -> None:
+        """
+        The stations are checked against the region of interest before any file is parsed,
+        then parsed in max_workers processes (default: number of CPUs), one task per station.
+        """
         total_files = len(list(self.alertario_keys_path.glob("*.parquet")))
         if use_cache and total_files > 0:
             log.warning(
@@ -74,36 +118,15 @@ class AlertarioKeys:
         stations = self.alertario_parser.list_rain_gauge_stations()
         log.info(f"Processing {len(stations)} files to build keys")
         region_of_interest = self.alertario_parser.get_region_of_interest()
-        for station in tqdm(stations):
-            data = self.alertario_parser.process_station(station)
-            data = self._merge_coords_by_estacao_desc(data, station)
-
-            lat = float(data["latitude"].iloc[0])
-            lon = float(data["longitude"].iloc[0])
-            if not (
-                lat <= region_of_interest["north"]
-                and lat >= region_of_interest["south"]
-                and lon <= region_of_interest["east"]
-                and lon >= region_of_interest["west"]
+        for station in stations:
+            self._check_region_of_interest(station, region_of_interest)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for station_minimum_date, station_maximum_date in tqdm(
+                executor.map(self._build_station_key, stations), total=len(stations)
             ):
-                log.error(
-                    f"""
-                    Station {station} is not in the region of interest:
-                    Station lat: {lat}
-                    Station lon: {lon}
-                    Region of interest: {region_of_interest}
-                """
-                )
-                exit(1)
-
-            if data["datetime"].min() < minimum_date:
-                minimum_date = data["datetime"].min()
-            if data["datetime"].max() > maximum_date:
-                maximum_date = data["datetime"].max()
-
-            self._write_key(data)
-
-            self._serialize_describe(data, self.alertario_describe_path)
+                minimum_date = min(minimum_date, station_minimum_date)
+                maximum_date = max(maximum_date, station_maximum_date)
 
         minimum_maximum_dates_path = (
             self.alertario_keys_path / "minimum_maximum_dates_alertario.json"
@@ -1,15 +1,35 @@
+import csv
+import io
+import json
+import os
 import re
 from pathlib import Path
+from typing import Optional
 
 import pandas as pd
 import pandera as pa
 import xarray as xr
-from sklearn.impute import KNNImputer
 
 from .Logger import logger
 
+try:
+    from ..utils import imputation
+    from ..utils.file_fingerprint import get_file_fingerprint
+except ImportError:
+    # imported as a top-level package, with src in the path
+    from utils import imputation
+    from utils.file_fingerprint import get_file_fingerprint
+
 log = logger.get_logger(__name__)
 
+# the columns are aligned with 2 or more spaces, a single space is part of a value
+COLUMN_SEPARATORS = re.compile(r"\s{2,}")
+# not expected in the files, read_csv splits the columns on it
+SEPARATOR = "\x1f"
+STATION_SYSTEM_CONFIG_PATH = (
+    Path(__file__).parents[2] / "config" / "station_systems" / "alertario.json"
+)
+
 
 class AlertarioSchema(pa.DataFrameModel):
     datetime: pd.Timestamp
@@ -19,6 +39,36 @@ class AlertarioSchema(pa.DataFrameModel):
 
 class AlertarioParser:
     rain_gauge_path = Path(__file__).parent / "alertario-from-source"
+    parsed_path = Path(__file__).parent / "alertario_parsed"
+
+    def __init__(
+        self,
+        rain_gauge_path: Optional[Path] = None,
+        parsed_path: Optional[Path] = None,
+        imputation_config: Optional[dict] = None,
+    ) -> None:
+        if rain_gauge_path is not None:
+            self.rain_gauge_path = rain_gauge_path
+        if parsed_path is not None:
+            self.parsed_path = parsed_path
+        self.imputation_config = (
+            imputation_config
+            if imputation_config is not None
+            else self._load_imputation_config()
+        )
+
+    def _load_imputation_config(self) -> dict:
+        """
+        The "rain_gauges" imputation of the AlertaRio station-system JSON
+        """
+        try:
+            with open(STATION_SYSTEM_CONFIG_PATH, encoding="utf-8") as f:
+                return json.load(f)["rain_gauges"]["imputation"]
+        except (FileNotFoundError, KeyError) as e:
+            log.warning(
+                f"No rain gauge imputation in {STATION_SYSTEM_CONFIG_PATH} ({e}), using {imputation.DEFAULT_STRATEGY}"
+            )
+            return dict(imputation.DEFAULT_IMPUTATION)
 
     def get_region_of_interest(self) -> dict:
         ds = xr.open_dataset(
@@ -52,50 +102,119 @@ class AlertarioParser:
                 f"Missing values for {column}: {percentage_missing:.2f}% ({missing_values}/{total_values})"
             )
 
-        imputer = KNNImputer(n_neighbors=2)
-        df[column] = imputer.fit_transform(df[[column]])
+        # time-local strategies, the station series span more than a decade of 15 minutes
+        df[column] = imputation.apply_imputation(
+            df[[column]].set_index(df["datetime"]), self.imputation_config
+        )[column].to_numpy()
         assert (
             df[column].isna().sum() == 0
         ), "Missing values after imputation should be zero"
         return df
 
+    def _parse_unique(self, values: pd.Series, format: str) -> pd.DatetimeIndex:
+        codes, uniques = pd.factorize(values)
+        return pd.to_datetime(uniques, format=format).take(
+            codes, allow_fill=True, fill_value=pd.NaT
+        )
+
     def _get_df(self, file_path: Path) -> pd.DataFrame:
+        """
+        Reads a monthly file with the C parser of read_csv. As the python engine did with
+        sep=r"\s{2,}", each line is stripped and split on 2 or more spaces, the separators
+        are replaced before the whole file is handed to read_csv.
+        """
+        with open(file_path, encoding="utf-8") as f:
+            text = "\n".join(
+                COLUMN_SEPARATORS.sub(SEPARATOR, line.strip()) for line in f
+            )
         df = pd.read_csv(
-            file_path,
-            sep=r"\s{2,}",
-            engine="python",
+            io.StringIO(text),
+            sep=SEPARATOR,
             skiprows=5,
             names=["Dia", "Hora", "HBV", "m15", "h01", "h04", "h24", "h96"],
+            dtype={"Dia": str, "Hora": str},
+            # the python engine with a regex separator has no quoting
+            quoting=csv.QUOTE_NONE,
         )
-        df["datetime"] = pd.to_datetime(
-            df["Dia"] + " " + df["Hora"], format="%d/%m/%Y %H:%M:%S"
-        )
+        # a month has a few distinct days and times, each one is parsed once
+        days = self._parse_unique(df["Dia"], "%d/%m/%Y")
+        times = self._parse_unique(df["Hora"], "%H:%M:%S") - pd.Timestamp("1900-01-01")
+        df["datetime"] = days + times
 
         df["m15"] = pd.to_numeric(df["m15"], errors="coerce")
         df["h01"] = pd.to_numeric(df["h01"], errors="coerce")
         df = df.drop(columns=["Dia", "Hora", "HBV", "h04", "h24", "h96"])
         return df
 
-    def process_station(self, station: str):
+    def _read_fingerprints(self, station_parsed_path: Path) -> dict:
+        fingerprints_path = station_parsed_path / "fingerprints.json"
+        if not fingerprints_path.exists():
+            return {}
+        with open(fingerprints_path) as f:
+            return json.load(f)
+
+    def _write_fingerprints(self, station_parsed_path: Path, fingerprints: dict):
+        fingerprints_path = station_parsed_path / "fingerprints.json"
+        tmp_path = fingerprints_path.with_suffix(".tmp.json")
+        with open(tmp_path, "w") as f:
+            json.dump(fingerprints, f, indent=4, sort_keys=True)
+        os.replace(tmp_path, fingerprints_path)
+
+    def _get_month_df(
+        self, file_path: Path, station_parsed_path: Path, fingerprints: dict
+    ) -> pd.DataFrame:
+        """
+        The parsed month from its parquet file, unless the text file changed since it was parsed
+        """
+        parsed_file_path = station_parsed_path / f"{file_path.stem}.parquet"
+        fingerprint = get_file_fingerprint(file_path)
+        if (
+            fingerprints.get(file_path.name) == fingerprint
+            and parsed_file_path.exists()
+        ):
+            return pd.read_parquet(parsed_file_path)
+
+        df = self._get_df(file_path)
+        df.to_parquet(parsed_file_path)
+        fingerprints[file_path.name] = fingerprint
+        return df
+
+    def process_station(self, station: str, use_cache: bool = True):
+        """
+        Parses the monthly files of a station. With use_cache, each month is parsed once
+        and kept as a parquet file in parsed_path/station, next to the fingerprints of the
+        text files it was parsed from.
+        """
         station_dfs = []
         months = pd.date_range(
             pd.Timestamp("2013-01-01"), pd.Timestamp("2024-10-01"), freq="MS"
         )
-        for month in months:
-            current_year = month.year
-            current_month = month.month
-            try:
-                file_name = f"{station}_{current_year:04d}{current_month:02d}_Plv.txt"
-                file_path = self.rain_gauge_path / file_name
-                if not file_path.exists():
-                    raise FileNotFoundError(f"File {file_path} not found")
-                df = self._get_df(file_path)
-                station_dfs.append(df)
-            except Exception as e:
-                print(
-                    f"Error processing station {station} at {current_year}-{current_month}: {e}"
-                )
-                raise e
+        station_parsed_path = self.parsed_path / station
+        station_parsed_path.mkdir(parents=True, exist_ok=True)
+        fingerprints = self._read_fingerprints(station_parsed_path) if use_cache else {}
+        try:
+            for month in months:
+                current_year = month.year
+                current_month = month.month
+                try:
+                    file_name = (
+                        f"{station}_{current_year:04d}{current_month:02d}_Plv.txt"
+                    )
+                    file_path = self.rain_gauge_path / file_name
+                    if not file_path.exists():
+                        raise FileNotFoundError(f"File {file_path} not found")
+                    df = self._get_month_df(
+                        file_path, station_parsed_path, fingerprints
+                    )
+                    station_dfs.append(df)
+                except Exception as e:
+                    print(
+                        f"Error processing station {station} at {current_year}-{current_month}: {e}"
+                    )
+                    raise e
+        finally:
+            # the months parsed before an error are kept
+            self._write_fingerprints(station_parsed_path, fingerprints)
         assert len(station_dfs) == len(months)
         df = pd.concat(station_dfs).sort_values(by="datetime").reset_index(drop=True)
         df = self._impute_missing_values(df, AlertarioSchema.m15)
@@ -1,5 +1,5 @@
 from datetime import timedelta
-from pathlib import Path
+from typing import Optional
 
 import numpy as np
 import pandas as pd
@@ -9,6 +9,14 @@ from .AlertarioKeys import AlertarioKeys
 from .ERA5Square import ERA5Square
 from .Logger import logger
 from .square import Square
+from .StationsIndex import StationsIndex
+from .StationsPrecipitationCube import StationsPrecipitationCube, get_hourly_windows
+
+try:
+    from ..utils.file_fingerprint import get_file_fingerprint
+except ImportError:
+    # imported as a top-level package, with src in the path
+    from utils.file_fingerprint import get_file_fingerprint
 
 log = logger.get_logger(__name__)
 
@@ -16,25 +24,61 @@ log = logger.get_logger(__name__)
 class AlertarioSquare(ERA5Square):
     def __init__(self, alertario_keys: AlertarioKeys) -> None:
         self.alertario_keys = alertario_keys
+        self.stations_index: Optional[StationsIndex] = None
+        self.precipitation_cube: Optional[StationsPrecipitationCube] = None
+
+    def build_stations_index(self) -> StationsIndex:
+        """
+        Lists the keys folder once, must be called after the keys are built
+        """
+        self.stations_index = StationsIndex(self.alertario_keys.alertario_keys_path)
+        return self.stations_index
+
+    def _get_hourly_precipitation(
+        self, key: str, hours: pd.DatetimeIndex
+    ) -> dict[str, np.ndarray]:
+        df_alertario = self.alertario_keys.load_key(key)
+        return get_hourly_windows(
+            pd.DatetimeIndex(df_alertario.datetime),
+            df_alertario["m15"],
+            df_alertario["h01"],
+            hours,
+        )
+
+    def build_precipitation_cube(
+        self, start_date: pd.Timestamp, end_date: pd.Timestamp
+    ) -> StationsPrecipitationCube:
+        if self.stations_index is None:
+            self.build_stations_index()
+        self.precipitation_cube = StationsPrecipitationCube(
+            self.alertario_keys.alertario_keys_path / "precipitation_cube"
+        )
+        keys = self.stations_index.keys.tolist()
+        self.precipitation_cube.build(
+            keys,
+            self._get_hourly_precipitation,
+            start_date,
+            end_date,
+            fingerprints={
+                key: get_file_fingerprint(
+                    self.alertario_keys.alertario_keys_path / f"{key}.parquet"
+                )
+                for key in keys
+            },
+        )
+        return self.precipitation_cube
 
     def get_keys_in_square(
         self, square: Square, stations_alertario: set, verbose: bool = False
     ) -> list[str]:
-        keys = [
-            x.stem
-            for x in Path(self.alertario_keys.alertario_keys_path).glob("*.parquet")
-        ]
-        alertario_keys = []
-        for key in keys:
-            key_lat, key_lon = map(float, key.split("_"))
-
-            if (
-                verbose
-                and not (
-                    key_lat < square.bottom_left[0] or key_lat > square.top_left[0]
-                )
-                and not (key_lon < square.top_left[1] or key_lon > square.top_right[1])
-            ):
+        if self.stations_index is None:
+            self.build_stations_index()
+
+        alertario_keys = self.stations_index.get_keys_in_square(square)
+
+        if verbose:
+            for key in alertario_keys:
+                key_lat, key_lon = map(float, key.split("_"))
                 log.success(
                     f"""
                     Lat and Lon Square:
@@ -44,13 +88,6 @@ class AlertarioSquare(ERA5Square):
                 """
                 )
 
-            if key_lat < square.bottom_left[0] or key_lat > square.top_left[0]:
-                continue
-            if key_lon < square.top_left[1] or key_lon > square.top_right[1]:
-                continue
-
-            alertario_keys.append(key)
-
         if len(alertario_keys) > 0:
             stations_alertario.update(alertario_keys)
 
@@ -70,6 +107,24 @@ class AlertarioSquare(ERA5Square):
 
         precipitations_15_min_aggregated: list[float] = []
         for key in alertario_keys:
+            window = (
+                self.precipitation_cube.get(key, timestamp)
+                if self.precipitation_cube is not None
+                else None
+            )
+            if window is not None:
+                m15 = window["m15_sum"]
+                if not window["m15_complete"]:
+                    # Please see WebSirenesSquare:get_precipitation_in_square for more information
+                    m15_era5 = super().get_era5_single_levels_precipitation_in_square(
+                        square, ds_time
+                    )
+                    m15 = np.array([m15, m15_era5]).max()
+                precipitations_15_min_aggregated.append(
+                    np.array([m15, window["h01_sum"]]).max().item()
+                )
+                continue
+
             df_alertario = self.alertario_keys.load_key(key)
 
             time_upper_bound = timestamp
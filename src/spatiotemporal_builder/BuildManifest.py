@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas as pd
+
+from .Logger import logger
+
+log = logger.get_logger(__name__)
+
+
+def get_fingerprint(inputs: Any) -> str:
+    """
+    Digest of the JSON serializable description of the inputs of an output
+    """
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+class BuildManifest:
+    """
+    Fingerprints of the inputs each hourly features file was built from
+
+    One YYYY_MM.json file per month, {"YYYY_MM_DD_HH": fingerprint}, so a rerun can tell
+    the hours whose inputs changed since they were built from the ones that are up to date.
+    Only the main process reads and writes the manifest, the workers don't touch it.
+    """
+
+    def __init__(self, manifest_path: Path) -> None:
+        self.manifest_path = manifest_path
+        self.months: dict[str, dict[str, str]] = {}
+        self.dirty_months: set[str] = set()
+
+        if not self.manifest_path.exists():
+            self.manifest_path.mkdir(parents=True)
+
+    def _month_name(self, timestamp: pd.Timestamp) -> str:
+        return f"{timestamp.year:04}_{timestamp.month:02}"
+
+    def _hour_name(self, timestamp: pd.Timestamp) -> str:
+        return timestamp.strftime("%Y_%m_%d_%H")
+
+    def _month_path(self, month_name: str) -> Path:
+        return self.manifest_path / f"{month_name}.json"
+
+    def _get_month(self, timestamp: pd.Timestamp) -> dict[str, str]:
+        month_name = self._month_name(timestamp)
+        if month_name not in self.months:
+            month_path = self._month_path(month_name)
+            if month_path.exists():
+                with open(month_path) as f:
+                    self.months[month_name] = json.load(f)
+            else:
+                self.months[month_name] = {}
+        return self.months[month_name]
+
+    def get(self, timestamp: pd.Timestamp) -> Optional[str]:
+        return self._get_month(timestamp).get(self._hour_name(timestamp))
+
+    def record(self, timestamp: pd.Timestamp, fingerprint: str) -> None:
+        self._get_month(timestamp)[self._hour_name(timestamp)] = fingerprint
+        self.dirty_months.add(self._month_name(timestamp))
+
+    def save(self) -> None:
+        """
+        Writes the months with new records, each one replaced at once
+        """
+        for month_name in sorted(self.dirty_months):
+            month_path = self._month_path(month_name)
+            tmp_path = month_path.with_suffix(".tmp.json")
+            with open(tmp_path, "w") as f:
+                json.dump(self.months[month_name], f, indent=4, sort_keys=True)
+            os.replace(tmp_path, month_path)
+        self.dirty_months.clear()
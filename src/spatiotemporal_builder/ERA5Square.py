@@ -10,6 +10,9 @@ from .Logger import logger
 
 log = logger.get_logger(__name__)
 
+PRESSURE_LEVELS = [200, 700, 1000]
+PRESSURE_LEVELS_VARS = ["r", "t", "u", "v", "w"]
+
 
 class Square(BaseModel):
     top_left: tuple[float, float]
@@ -307,6 +310,142 @@ class ERA5Square:
             square, ds_time, verbose=True
         )
 
+    def _get_grid_values(
+        self,
+        ds_time: xr.Dataset,
+        data_var: str,
+        top_down_lats: npt.NDArray[np.float32],
+        left_right_lons: npt.NDArray[np.float32],
+    ) -> npt.NDArray[np.float64]:
+        """
+        Returns the values of data_var as a (level, lat, lon) array in the grid order
+        used by the features, single levels variables have a single level
+        """
+        da = ds_time[data_var]
+        if "pressure_level" in da.dims:
+            da = da.sel(pressure_level=PRESSURE_LEVELS)
+        else:
+            da = da.expand_dims("pressure_level")
+        da = da.sel(latitude=top_down_lats, longitude=left_right_lons)
+        return da.transpose("pressure_level", "latitude", "longitude").values.astype(
+            np.float64
+        )
+
+    def _get_grid_corners(
+        self, values: npt.NDArray[np.float64]
+    ) -> npt.NDArray[np.float64]:
+        """
+        Stacks the four corners of every square of the grid, in top_left, bottom_left, bottom_right, top_right order
+        values: (level, lat, lon) -> (corner, level, lat - 1, lon - 1)
+        """
+        return np.stack(
+            [
+                values[:, :-1, :-1],
+                values[:, 1:, :-1],
+                values[:, 1:, 1:],
+                values[:, :-1, 1:],
+            ]
+        )
+
+    def get_era5_features_in_grid(
+        self,
+        ds_single_levels: xr.Dataset,
+        ds_pressure_levels: xr.Dataset,
+        sorted_latitudes_ascending: npt.NDArray[np.float32],
+        sorted_longitudes_ascending: npt.NDArray[np.float32],
+    ) -> npt.NDArray[np.float64]:
+        """
+        Grid-level version of the get_*_in_square functions, returns a (lat, lon, channel) array
+        with the same channel order of SpatioTemporalFeatures.features_tuple:
+        tp, r200, r700, r1000, t200, ..., speed200, speed700, speed1000, w200, w700, w1000
+
+        Each square (i, j) uses the same corners selection of the square functions:
+        - tp is the maximum between the four corners (m to mm)
+        - pressure levels variables come from the corner with the largest sum over the levels
+        The last row and the last column don't have a square, they get the values of the grid point itself.
+
+        Squares with NaN in any corner fall back to the square functions,
+        so _find_nearest_non_null keeps the same behavior.
+        """
+        top_down_lats = sorted_latitudes_ascending[::-1]
+        left_right_lons = sorted_longitudes_ascending
+        m_to_mm = 1000
+
+        grid_values = {
+            data_var: self._get_grid_values(
+                ds_pressure_levels, data_var, top_down_lats, left_right_lons
+            )
+            for data_var in PRESSURE_LEVELS_VARS
+        }
+        grid_values["tp"] = (
+            self._get_grid_values(
+                ds_single_levels, "tp", top_down_lats, left_right_lons
+            )
+            * m_to_mm
+        )
+
+        # the last row and the last column are the grid points themselves
+        squares_values = {
+            data_var: values.copy() for data_var, values in grid_values.items()
+        }
+        has_nan = np.zeros(
+            (len(top_down_lats) - 1, len(left_right_lons) - 1), dtype=bool
+        )
+
+        tp_corners = self._get_grid_corners(grid_values["tp"])
+        squares_values["tp"][:, :-1, :-1] = tp_corners.max(axis=0)
+        has_nan |= np.isnan(tp_corners).any(axis=(0, 1))
+
+        for data_var in PRESSURE_LEVELS_VARS:
+            corners = self._get_grid_corners(grid_values[data_var])
+            # np.argmax returns the first maximum, as in the square functions
+            best_corner = np.argmax(corners.sum(axis=1), axis=0)
+            squares_values[data_var][:, :-1, :-1] = np.take_along_axis(
+                corners, best_corner[np.newaxis, np.newaxis], axis=0
+            )[0]
+            has_nan |= np.isnan(corners).any(axis=(0, 1))
+
+        getters = {
+            "r": self.get_relative_humidity_in_square,
+            "t": self.get_temperature_in_square,
+            "u": self.get_u_component_in_square,
+            "v": self.get_v_component_in_square,
+            "w": self.get_w_component_in_square,
+        }
+        # the square functions return the levels in the dataset order
+        levels = ds_pressure_levels["pressure_level"].values.tolist()
+        for i, j in zip(*np.nonzero(has_nan)):
+            square = self.get_square(
+                top_down_lats[i],
+                left_right_lons[j],
+                sorted_latitudes_ascending,
+                sorted_longitudes_ascending,
+            )
+            squares_values["tp"][0, i, j] = (
+                self.get_era5_single_levels_precipitation_in_square(
+                    square, ds_single_levels
+                )
+            )
+            for data_var, getter in getters.items():
+                values = getter(square, ds_pressure_levels)
+                squares_values[data_var][:, i, j] = [
+                    values[levels.index(level)] for level in PRESSURE_LEVELS
+                ]
+
+        speed = np.sqrt(squares_values["u"] ** 2 + squares_values["v"] ** 2)
+
+        return np.concatenate(
+            [
+                squares_values["tp"],
+                squares_values["r"],
+                squares_values["t"],
+                squares_values["u"],
+                squares_values["v"],
+                speed,
+                squares_values["w"],
+            ]
+        ).transpose(1, 2, 0)
+
     def get_square(
         self,
         lat: float,
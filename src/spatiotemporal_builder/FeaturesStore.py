@@ -0,0 +1,193 @@
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from .Logger import logger
+
+log = logger.get_logger(__name__)
+
+
+class FeaturesStore:
+    """
+    Hourly features stored as a single (time, lat, lon, channel) array split in month chunks
+
+    Each month has:
+        YYYY_MM_features.npy: (hours of the month, lat, lon, channel) memory-mapped array, while the month is being written
+        YYYY_MM_features.npz: the same array compressed, after compress() is called
+        YYYY_MM_done.npy: one flag per hour of the month, set after the hour is written
+
+    Writers of different hours touch different bytes of the month arrays, so worker
+    processes can write disjoint hours in parallel without locks. The chunks must be
+    created (or decompressed) by a single process with prepare() before the workers start.
+    Knowing which hours are done only needs the small done arrays, one per month.
+    """
+
+    def __init__(
+        self,
+        store_path: Path,
+        shape: tuple[int, int, int],
+        dtype: npt.DTypeLike = np.float32,
+    ) -> None:
+        self.store_path = store_path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.metadata_path = store_path / "metadata.json"
+        self._cached_chunk: Optional[tuple[str, npt.NDArray]] = None
+
+        if not self.store_path.exists():
+            self.store_path.mkdir(parents=True)
+
+        metadata = {"shape": list(self.shape), "dtype": self.dtype.name}
+        if self.metadata_path.exists():
+            with open(self.metadata_path) as f:
+                existing_metadata = json.load(f)
+            if existing_metadata != metadata:
+                raise ValueError(
+                    f"Features store in {store_path} has {existing_metadata}, expected {metadata}. Delete the folder to rebuild it"
+                )
+        else:
+            with open(self.metadata_path, "w") as f:
+                json.dump(metadata, f, indent=4)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_cached_chunk"] = None
+        return state
+
+    def _chunk_name(self, timestamp: pd.Timestamp) -> str:
+        return f"{timestamp.year:04}_{timestamp.month:02}"
+
+    def _features_path(self, chunk_name: str) -> Path:
+        return self.store_path / f"{chunk_name}_features.npy"
+
+    def _compressed_path(self, chunk_name: str) -> Path:
+        return self.store_path / f"{chunk_name}_features.npz"
+
+    def _done_path(self, chunk_name: str) -> Path:
+        return self.store_path / f"{chunk_name}_done.npy"
+
+    def _hour_index(self, timestamp: pd.Timestamp) -> int:
+        return (timestamp.day - 1) * 24 + timestamp.hour
+
+    def _hours_in_month(self, timestamp: pd.Timestamp) -> int:
+        return timestamp.days_in_month * 24
+
+    def prepare(self, timestamps: Iterable[pd.Timestamp]) -> None:
+        """
+        Creates the month chunks of the timestamps, decompressing the ones that were compressed
+        """
+        self._cached_chunk = None
+        chunks = {self._chunk_name(timestamp): timestamp for timestamp in timestamps}
+        for chunk_name, timestamp in chunks.items():
+            features_path = self._features_path(chunk_name)
+            compressed_path = self._compressed_path(chunk_name)
+            done_path = self._done_path(chunk_name)
+
+            if features_path.exists():
+                continue
+
+            chunk_shape = (self._hours_in_month(timestamp), *self.shape)
+            features = np.lib.format.open_memmap(
+                features_path, mode="w+", dtype=self.dtype, shape=chunk_shape
+            )
+            if compressed_path.exists():
+                with np.load(compressed_path) as compressed:
+                    features[:] = compressed["features"]
+            features.flush()
+            del features
+
+            if compressed_path.exists():
+                compressed_path.unlink()
+
+            if not done_path.exists():
+                done = np.lib.format.open_memmap(
+                    done_path,
+                    mode="w+",
+                    dtype=np.bool_,
+                    shape=(self._hours_in_month(timestamp),),
+                )
+                done.flush()
+                del done
+
+    def write(self, timestamp: pd.Timestamp, features: npt.NDArray) -> None:
+        chunk_name = self._chunk_name(timestamp)
+        features_path = self._features_path(chunk_name)
+        if not features_path.exists():
+            raise FileNotFoundError(
+                f"Chunk {features_path} not found, call prepare() before writing"
+            )
+
+        hour_index = self._hour_index(timestamp)
+
+        chunk = np.load(features_path, mmap_mode="r+")
+        chunk[hour_index] = features
+        chunk.flush()
+        del chunk
+
+        done = np.load(self._done_path(chunk_name), mmap_mode="r+")
+        done[hour_index] = True
+        done.flush()
+        del done
+
+    def is_done(self, timestamp: pd.Timestamp) -> bool:
+        done_path = self._done_path(self._chunk_name(timestamp))
+        if not done_path.exists():
+            return False
+        done = np.load(done_path, mmap_mode="r")
+        return bool(done[self._hour_index(timestamp)])
+
+    def done_timestamps(self) -> list[pd.Timestamp]:
+        timestamps = []
+        for done_path in sorted(self.store_path.glob("*_done.npy")):
+            year, month = map(int, done_path.name.split("_")[:2])
+            done = np.load(done_path)
+            month_start = pd.Timestamp(year=year, month=month, day=1)
+            timestamps.extend(
+                month_start + pd.Timedelta(hours=int(hour))
+                for hour in np.flatnonzero(done)
+            )
+        return timestamps
+
+    def _load_chunk(self, chunk_name: str) -> npt.NDArray:
+        if self._cached_chunk is not None and self._cached_chunk[0] == chunk_name:
+            return self._cached_chunk[1]
+
+        features_path = self._features_path(chunk_name)
+        if features_path.exists():
+            chunk = np.load(features_path, mmap_mode="r")
+        else:
+            with np.load(self._compressed_path(chunk_name)) as compressed:
+                chunk = compressed["features"]
+
+        self._cached_chunk = (chunk_name, chunk)
+        return chunk
+
+    def read(self, timestamp: pd.Timestamp) -> npt.NDArray:
+        if not self.is_done(timestamp):
+            raise FileNotFoundError(f"Features for {timestamp} not found in store")
+        chunk = self._load_chunk(self._chunk_name(timestamp))
+        return np.asarray(chunk[self._hour_index(timestamp)])
+
+    def compress(self) -> None:
+        """
+        Compresses the memory-mapped chunks, must be called when there are no writers
+        """
+        self._cached_chunk = None
+        for features_path in sorted(self.store_path.glob("*_features.npy")):
+            chunk_name = features_path.name.removesuffix("_features.npy")
+            compressed_path = self._compressed_path(chunk_name)
+            tmp_path = self.store_path / f"{chunk_name}_features.tmp.npz"
+
+            chunk = np.load(features_path, mmap_mode="r")
+            np.savez_compressed(tmp_path, features=chunk)
+            del chunk
+
+            os.replace(tmp_path, compressed_path)
+            features_path.unlink()
+
+        log.success(f"Features store compressed in {self.store_path}")
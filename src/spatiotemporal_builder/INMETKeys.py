@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from typing import TypedDict
+from typing import Optional, TypedDict
 
 import pandas as pd
 from tqdm import tqdm
@@ -22,8 +22,13 @@ class StationNameId(TypedDict):
 
 
 class INMETKeys:
-    def __init__(self, inmet_parser: INMETParser, inmet_coords: pd.DataFrame) -> None:
-        self.inmet_keys_path = Path(__file__).parent / "inmet_keys"
+    def __init__(
+        self,
+        inmet_parser: INMETParser,
+        inmet_coords: pd.DataFrame,
+        inmet_keys_path: Optional[Path] = None,
+    ) -> None:
+        self.inmet_keys_path = inmet_keys_path or Path(__file__).parent / "inmet_keys"
         if not self.inmet_keys_path.exists():
             self.inmet_keys_path.mkdir()
         self.inmet_parser = inmet_parser
@@ -1,4 +1,4 @@
-from pathlib import Path
+from typing import Optional
 
 import numpy as np
 import pandas as pd
@@ -8,6 +8,14 @@ from .ERA5Square import ERA5Square
 from .INMETKeys import INMETKeys
 from .Logger import logger
 from .square import Square
+from .StationsIndex import StationsIndex
+from .StationsPrecipitationCube import StationsPrecipitationCube, get_hourly_values
+
+try:
+    from ..utils.file_fingerprint import get_file_fingerprint
+except ImportError:
+    # imported as a top-level package, with src in the path
+    from utils.file_fingerprint import get_file_fingerprint
 
 log = logger.get_logger(__name__)
 
@@ -15,22 +23,61 @@ log = logger.get_logger(__name__)
 class INMETSquare(ERA5Square):
     def __init__(self, inmet_keys: INMETKeys) -> None:
         self.inmet_keys = inmet_keys
+        self.stations_index: Optional[StationsIndex] = None
+        self.precipitation_cube: Optional[StationsPrecipitationCube] = None
+
+    def build_stations_index(self) -> StationsIndex:
+        """
+        Lists the keys folder once, must be called after the keys are built
+        """
+        self.stations_index = StationsIndex(self.inmet_keys.inmet_keys_path)
+        return self.stations_index
+
+    def _get_hourly_precipitation(
+        self, key: str, hours: pd.DatetimeIndex
+    ) -> dict[str, np.ndarray]:
+        df_web = self.inmet_keys.load_key(key)
+        df_web = df_web[~df_web.index.duplicated()]
+        return {
+            "precipitation": get_hourly_values(
+                pd.DatetimeIndex(df_web.index), df_web["precipitation"], hours
+            )
+        }
+
+    def build_precipitation_cube(
+        self, start_date: pd.Timestamp, end_date: pd.Timestamp
+    ) -> StationsPrecipitationCube:
+        if self.stations_index is None:
+            self.build_stations_index()
+        self.precipitation_cube = StationsPrecipitationCube(
+            self.inmet_keys.inmet_keys_path / "precipitation_cube"
+        )
+        keys = self.stations_index.keys.tolist()
+        self.precipitation_cube.build(
+            keys,
+            self._get_hourly_precipitation,
+            start_date,
+            end_date,
+            fingerprints={
+                key: get_file_fingerprint(
+                    self.inmet_keys.inmet_keys_path / f"{key}.parquet"
+                )
+                for key in keys
+            },
+        )
+        return self.precipitation_cube
 
     def get_keys_in_square(
         self, square: Square, stations_inmet: set, verbose: bool = False
     ) -> list[str]:
-        keys = [x.stem for x in Path(self.inmet_keys.inmet_keys_path).glob("*.parquet")]
-        inmet_keys = []
-        for key in keys:
-            key_lat, key_lon = map(float, key.split("_"))
-
-            if (
-                verbose
-                and not (
-                    key_lat < square.bottom_left[0] or key_lat > square.top_left[0]
-                )
-                and not (key_lon < square.top_left[1] or key_lon > square.top_right[1])
-            ):
+        if self.stations_index is None:
+            self.build_stations_index()
+
+        inmet_keys = self.stations_index.get_keys_in_square(square)
+
+        if verbose:
+            for key in inmet_keys:
+                key_lat, key_lon = map(float, key.split("_"))
                 log.success(
                     f"""
                     Lat and Lon Square:
@@ -40,13 +87,6 @@ class INMETSquare(ERA5Square):
                 """
                 )
 
-            if key_lat < square.bottom_left[0] or key_lat > square.top_left[0]:
-                continue
-            if key_lon < square.top_left[1] or key_lon > square.top_right[1]:
-                continue
-
-            inmet_keys.append(key)
-
         if len(inmet_keys) > 0:
             stations_inmet.update(inmet_keys)
 
@@ -65,6 +105,20 @@ class INMETSquare(ERA5Square):
             )
         precipitations: list[float] = []
         for key in inmet_keys:
+            hourly = (
+                self.precipitation_cube.get(key, timestamp)
+                if self.precipitation_cube is not None
+                else None
+            )
+            if hourly is not None:
+                h1 = hourly["precipitation"]
+                if np.isnan(h1):
+                    h1 = super().get_era5_single_levels_precipitation_in_square(
+                        square, ds_time
+                    )
+                precipitations.append(float(h1))
+                continue
+
             df_web = self.inmet_keys.load_key(key)
             df_web_filtered = df_web[df_web.index == timestamp]
             h1 = df_web_filtered["precipitation"]
@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+from .Logger import logger
+from .square import Square
+
+log = logger.get_logger(__name__)
+
+
+class StationsIndex:
+    """
+    In-memory index of the "lat_lon.parquet" keys of a keys folder
+
+    The keys folder is listed only once, the stations are kept sorted by latitude,
+    so a square query is a binary search on the latitudes followed by a filter on
+    the longitudes of the stations inside the latitude range.
+
+    The index only holds numpy arrays, so it's cheap to pickle and it is shared
+    with the worker processes together with the Square instances.
+    """
+
+    def __init__(self, keys_path: Path) -> None:
+        keys = [x.stem for x in Path(keys_path).glob("*.parquet")]
+        lats_lons = np.array(
+            [list(map(float, key.split("_"))) for key in keys], dtype=np.float64
+        ).reshape(-1, 2)
+
+        order = np.argsort(lats_lons[:, 0], kind="stable")
+        self.keys: npt.NDArray[np.str_] = np.array(keys, dtype=str)[order]
+        self.lats: npt.NDArray[np.float64] = lats_lons[order, 0]
+        self.lons: npt.NDArray[np.float64] = lats_lons[order, 1]
+
+        log.debug(f"Stations index built with {len(self.keys)} keys from {keys_path}")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get_keys_in_square(self, square: Square) -> list[str]:
+        """
+        Keys with bottom_left lat <= lat <= top_left lat and top_left lon <= lon <= top_right lon
+        """
+        lower = np.searchsorted(self.lats, square.bottom_left[0], side="left")
+        upper = np.searchsorted(self.lats, square.top_left[0], side="right")
+        lons = self.lons[lower:upper]
+        inside = (lons >= square.top_left[1]) & (lons <= square.top_right[1])
+        return self.keys[lower:upper][inside].tolist()
@@ -0,0 +1,257 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from tqdm import tqdm
+
+from .Logger import TqdmLogger, logger
+
+log = logger.get_logger(__name__)
+
+ONE_HOUR = np.timedelta64(1, "h")
+M15_WINDOW = np.timedelta64(45, "m")
+
+
+def get_hourly_windows(
+    times: pd.DatetimeIndex,
+    m15: pd.Series,
+    h01: pd.Series,
+    hours: pd.DatetimeIndex,
+) -> dict[str, npt.NDArray]:
+    """
+    Aggregates 15 minutes data in the same windows used by get_precipitation_in_square:
+    the m15 values between hour - 45 minutes and hour, and the h01 value at the hour.
+
+    Each row belongs to at most one window, the one of the first hour at or after it,
+    so the windows of all hours are computed with a single pass over the rows.
+
+    Returns, for each hour:
+        m15_sum: sum of the non-null m15 values in the window
+        m15_complete: the window has at least 4 rows and none of them is null
+        h01_sum: sum of the non-null h01 values at the hour
+    """
+    total_hours = len(hours)
+    offsets = times.values.astype("datetime64[ns]") - hours[0].to_datetime64()
+    # ceil division, the window that ends at or after each row
+    hour_indexes = -(-offsets // ONE_HOUR)
+    window_ends = hours[0].to_datetime64() + hour_indexes * ONE_HOUR
+    in_range = (hour_indexes >= 0) & (hour_indexes < total_hours)
+    in_window = in_range & (window_ends - times.values <= M15_WINDOW)
+    at_hour = in_range & (window_ends == times.values)
+
+    m15_values = m15.to_numpy(dtype=np.float64, na_value=np.nan)
+    h01_values = h01.to_numpy(dtype=np.float64, na_value=np.nan)
+    m15_not_null = in_window & ~np.isnan(m15_values)
+    h01_not_null = at_hour & ~np.isnan(h01_values)
+
+    m15_rows = np.bincount(hour_indexes[in_window], minlength=total_hours)
+    m15_not_null_rows = np.bincount(hour_indexes[m15_not_null], minlength=total_hours)
+
+    return {
+        "m15_sum": np.bincount(
+            hour_indexes[m15_not_null],
+            weights=m15_values[m15_not_null],
+            minlength=total_hours,
+        ),
+        "m15_complete": (m15_rows >= 4) & (m15_rows == m15_not_null_rows),
+        "h01_sum": np.bincount(
+            hour_indexes[h01_not_null],
+            weights=h01_values[h01_not_null],
+            minlength=total_hours,
+        ),
+    }
+
+
+def get_hourly_values(
+    times: pd.DatetimeIndex, values: pd.Series, hours: pd.DatetimeIndex
+) -> npt.NDArray[np.float64]:
+    """
+    Values at each hour, NaN when the hour is missing
+    """
+    hourly = np.full(len(hours), np.nan, dtype=np.float64)
+    hour_indexes = hours.get_indexer(times)
+    found = hour_indexes >= 0
+    hourly[hour_indexes[found]] = values.to_numpy(dtype=np.float64, na_value=np.nan)[
+        found
+    ]
+    return hourly
+
+
+class StationsPrecipitationCube:
+    """
+    Dense station x hour arrays with the precipitation values needed by get_precipitation_in_square
+
+    The arrays are built once from the keys and saved as .npy files next to them,
+    the workers memory-map the files, so a lookup is an index read instead of a
+    read_parquet and a filter of the key for each square and timestamp.
+
+    The fingerprints of the key files are saved with the arrays, a cube built from
+    key files that changed since is rebuilt.
+    """
+
+    def __init__(self, cube_path: Path) -> None:
+        self.cube_path = cube_path
+        self.metadata_path = cube_path / "metadata.json"
+        self.rows: dict[str, int] = {}
+        self.start: Optional[pd.Timestamp] = None
+        self.total_hours = 0
+        self.columns: list[str] = []
+        self.arrays: dict[str, npt.NDArray] = {}
+
+    def __getstate__(self) -> dict:
+        # the workers memory-map the files instead of receiving pickled arrays
+        state = self.__dict__.copy()
+        state["arrays"] = {}
+        return state
+
+    def _read_metadata(self) -> Optional[dict]:
+        if not self.metadata_path.exists():
+            return None
+        with open(self.metadata_path) as f:
+            return json.load(f)
+
+    def _covers(
+        self,
+        metadata: dict,
+        keys: list[str],
+        hours: pd.DatetimeIndex,
+        fingerprints: Optional[dict[str, Optional[list[int]]]],
+    ) -> bool:
+        start = pd.Timestamp(metadata["start"])
+        end = start + (metadata["total_hours"] - 1) * pd.Timedelta(hours=1)
+        return (
+            metadata["keys"] == keys
+            and metadata.get("fingerprints") == fingerprints
+            and start <= hours[0]
+            and hours[-1] <= end
+            and (hours[0] - start) % pd.Timedelta(hours=1) == pd.Timedelta(0)
+        )
+
+    def _set_metadata(self, metadata: dict) -> None:
+        self.rows = {key: row for row, key in enumerate(metadata["keys"])}
+        self.start = pd.Timestamp(metadata["start"])
+        self.total_hours = metadata["total_hours"]
+        self.columns = metadata["columns"]
+        self.arrays = {}
+
+    def build(
+        self,
+        keys: list[str],
+        get_hourly: Callable[[str, pd.DatetimeIndex], dict[str, npt.NDArray]],
+        start_date: pd.Timestamp,
+        end_date: pd.Timestamp,
+        use_cache: bool = True,
+        fingerprints: Optional[dict[str, Optional[list[int]]]] = None,
+    ) -> None:
+        """
+        get_hourly(key, hours) returns the arrays of one station, one value per hour
+        fingerprints has the fingerprint of the file of each key, see get_file_fingerprint
+        """
+        hours = pd.date_range(start=start_date, end=end_date, freq="h")
+        metadata = self._read_metadata()
+        if (
+            use_cache
+            and metadata is not None
+            and self._covers(metadata, keys, hours, fingerprints)
+        ):
+            log.warning(
+                f"Using cached precipitation cube. To clear cache delete the {self.cube_path} folder"
+            )
+            self._set_metadata(metadata)
+            return
+
+        self.cube_path.mkdir(exist_ok=True)
+        self.metadata_path.unlink(missing_ok=True)
+
+        arrays: dict[str, npt.NDArray] = {}
+        for row, key in enumerate(
+            tqdm(keys, desc="Building precipitation cube", file=TqdmLogger(log))
+        ):
+            for column, values in get_hourly(key, hours).items():
+                if column not in arrays:
+                    arrays[column] = np.lib.format.open_memmap(
+                        self.cube_path / f"{column}.npy",
+                        mode="w+",
+                        dtype=values.dtype,
+                        shape=(len(keys), len(hours)),
+                    )
+                arrays[column][row] = values
+
+        for array in arrays.values():
+            array.flush()
+
+        metadata = {
+            "keys": keys,
+            "start": hours[0].isoformat(),
+            "total_hours": len(hours),
+            "columns": list(arrays),
+            "fingerprints": fingerprints,
+        }
+        with open(self.metadata_path, "w") as f:
+            json.dump(metadata, f, indent=4)
+        self._set_metadata(metadata)
+
+        log.success(
+            f"Precipitation cube with {len(keys)} stations and {len(hours)} hours built in {self.cube_path}"
+        )
+
+    def _load_arrays(self) -> None:
+        if not self.arrays:
+            self.arrays = {
+                column: np.load(self.cube_path / f"{column}.npy", mmap_mode="r")
+                for column in self.columns
+            }
+
+    def get_hourly_digests(
+        self, hours: pd.DatetimeIndex, chunk_size: int = 4096
+    ) -> list[str]:
+        """
+        Digest of the values of all stations at each hour, the hours must be in the cube.
+        Two hours with the same digest have the same stations and the same values.
+        """
+        if self.start is None:
+            raise ValueError("The cube must be built before reading its digests")
+
+        positions = (hours - self.start) // pd.Timedelta(hours=1)
+        if len(positions) and not (
+            positions.min() >= 0 and positions.max() < self.total_hours
+        ):
+            raise ValueError(
+                f"Hours from {hours.min()} to {hours.max()} are not all in the cube"
+            )
+
+        keys_digest = hashlib.sha1(json.dumps(list(self.rows)).encode()).digest()
+        self._load_arrays()
+        digests = []
+        for chunk_start in range(0, len(positions), chunk_size):
+            chunk = np.asarray(positions[chunk_start : chunk_start + chunk_size])
+            # (hours, stations) so the values of each hour are contiguous
+            columns = [
+                np.ascontiguousarray(self.arrays[column][:, chunk].T)
+                for column in self.columns
+            ]
+            for hour in range(len(chunk)):
+                digest = hashlib.sha1(keys_digest)
+                for values in columns:
+                    digest.update(values[hour].tobytes())
+                digests.append(digest.hexdigest())
+        return digests
+
+    def get(self, key: str, timestamp: pd.Timestamp) -> Optional[dict]:
+        """
+        Values of the key at the timestamp, None when the cube doesn't have them
+        """
+        row = self.rows.get(key)
+        if row is None or self.start is None:
+            return None
+
+        hour, remainder = divmod(timestamp - self.start, pd.Timedelta(hours=1))
+        if remainder != pd.Timedelta(0) or not 0 <= hour < self.total_hours:
+            return None
+
+        self._load_arrays()
+        return {column: self.arrays[column][row, hour] for column in self.columns}
@@ -1,6 +1,7 @@
 import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import TypedDict
+from typing import Optional, TypedDict
 
 import pandas as pd
 from pandera.typing import Index
@@ -25,24 +26,47 @@ class WebsirenesKeySchema(WebSireneSchema):
 
 class WebSirenesKeys:
     def __init__(
-        self, websirenes_parser: WebSirenesParser, websirenes_coords: pd.DataFrame
+        self,
+        websirenes_parser: WebSirenesParser,
+        websirenes_coords: pd.DataFrame,
+        websirenes_keys_path: Optional[Path] = None,
     ) -> None:
-        self.websirenes_keys_path = Path(__file__).parent / "websirenes_keys"
+        self.websirenes_keys_path = (
+            websirenes_keys_path or Path(__file__).parent / "websirenes_keys"
+        )
         if not self.websirenes_keys_path.exists():
             self.websirenes_keys_path.mkdir()
         self.websirenes_parser = websirenes_parser
         self.websirenes_coords = websirenes_coords
 
-    def _not_founds_in_coords(self) -> list[StationNameId]:
-        not_founds_in_coords: list[StationNameId] = []
-        existing_station_names = set(self.websirenes_coords["estacao"].values)
-        for file in self.websirenes_parser.list_files():
-            file_path = str(self.websirenes_parser.websirenes_defesa_civil_path / file)
+    def _get_file_path(self, file: str) -> str:
+        return str(self.websirenes_parser.websirenes_defesa_civil_path / file)
+
+    def _get_stations_name_id(self, files: list[str]) -> dict[str, StationNameId]:
+        """
+        Name and id of the station of each file, read from its first line
+        """
+        stations_name_id: dict[str, StationNameId] = {}
+        for file in files:
             name, station_id = self.websirenes_parser.read_station_name_id_txt_file(
-                file_path
+                self._get_file_path(file)
+            )
+            stations_name_id[file] = {"name": name, "station_id": station_id}
+        return stations_name_id
+
+    def _not_founds_in_coords(
+        self, stations_name_id: Optional[dict[str, StationNameId]] = None
+    ) -> list[StationNameId]:
+        if stations_name_id is None:
+            stations_name_id = self._get_stations_name_id(
+                self.websirenes_parser.list_files()
             )
-            if name not in existing_station_names:
-                not_founds_in_coords.append({"name": name, "station_id": station_id})
+        existing_station_names = set(self.websirenes_coords["estacao"].values)
+        not_founds_in_coords = [
+            station_name_id
+            for station_name_id in stations_name_id.values()
+            if station_name_id["name"] not in existing_station_names
+        ]
         log.warning(
             f"Stations not found in websirenes coordinates: {not_founds_in_coords}"
         )
@@ -73,7 +97,25 @@ class WebSirenesKeys:
     def load_key(self, key: str) -> pd.DataFrame:
         return pd.read_parquet(f"{self.websirenes_keys_path}/{key}.parquet")
 
-    def build_keys(self, use_cache: bool = True):
+    def _build_station_keys(
+        self, files: list[str]
+    ) -> tuple[pd.Timestamp, pd.Timestamp]:
+        """
+        Parses, merges and writes the files of a station, in order, in a worker process.
+        Returns the minimum and maximum dates of the files.
+        """
+        minimum_date = pd.Timestamp.max
+        maximum_date = pd.Timestamp.min
+        for file in files:
+            df = self.websirenes_parser.get_dataframe(self._get_file_path(file))
+            minimum_date = min(minimum_date, df.index.min())
+            maximum_date = max(maximum_date, df.index.max())
+
+            df = self._merge_by_name(self.websirenes_coords, df)
+            self._write_key(df)
+        return minimum_date, maximum_date
+
+    def build_keys(self, use_cache: bool = True, max_workers: Optional[int] = None):
         """
         Builds datasets by key (latitude and longitude) for each station
 
@@ -84,12 +126,15 @@ class WebSirenesKeys:
 
         The function performs the following steps:
         1. Lists all files to process
-        2. Reads each file into a DataFrame
-        3. Filters out files based on whether the station name is found in the coordinates list
+        2. Filters out files based on whether the station name is found in the coordinates list
+        3. Reads each file into a DataFrame
         4. Updates the minimum and maximum dates of the dataset
         5. Merges the DataFrame with existing coordinates
         6. Writes the resulting each DataFrame to a key file
 
+        Steps 3 to 6 run in max_workers processes (default: number of CPUs), one task per
+        station, so the files of a station are still written in order.
+
         Returns:
             None
         """
@@ -100,29 +145,30 @@ class WebSirenesKeys:
             )
             return
 
-        files = self.websirenes_parser.list_files()
-        not_found_in_coords = self._not_founds_in_coords()
+        files = sorted(self.websirenes_parser.list_files())
+        stations_name_id = self._get_stations_name_id(files)
+        not_found_in_coords = self._not_founds_in_coords(stations_name_id)
+        not_found_names = {x["name"] for x in not_found_in_coords}
         log.info(f"Found {len(not_found_in_coords)} stations not found in coordinates")
+
+        files_by_station: dict[str, list[str]] = {}
+        for file in files:
+            name = stations_name_id[file]["name"]
+            if name not in not_found_names:
+                files_by_station.setdefault(name, []).append(file)
         log.info(
-            f"Processing {len(files) - len(not_found_in_coords)} files to build keys"
+            f"Processing {sum(map(len, files_by_station.values()))} files to build keys"
         )
+
         minimum_date = pd.Timestamp.max
         maximum_date = pd.Timestamp.min
-        for file in tqdm(files):
-            df = self.websirenes_parser.get_dataframe(
-                str(self.websirenes_parser.websirenes_defesa_civil_path / file)
-            )
-            station_name = df.nome.iloc[0]
-            if station_name in [x["name"] for x in not_found_in_coords]:
-                continue
-
-            if df.index.min() < minimum_date:
-                minimum_date = df.index.min()
-            if df.index.max() > maximum_date:
-                maximum_date = df.index.max()
-
-            df = self._merge_by_name(self.websirenes_coords, df)
-            self._write_key(df)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for station_minimum_date, station_maximum_date in tqdm(
+                executor.map(self._build_station_keys, files_by_station.values()),
+                total=len(files_by_station),
+            ):
+                minimum_date = min(minimum_date, station_minimum_date)
+                maximum_date = max(maximum_date, station_maximum_date)
         log.info(
             f"""
             Minimum date: {minimum_date}
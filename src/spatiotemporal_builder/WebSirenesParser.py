@@ -1,6 +1,8 @@
+import io
 import os
 import re
 from pathlib import Path
+from typing import Optional
 
 import numpy as np
 import pandas as pd
@@ -25,11 +27,20 @@ class WebSireneSchema(pa.DataFrameModel):
     station_id: int
 
 
+# after the name, each line has the date, the time, these columns and the station id
+VALUE_COLUMNS = ["m15", "m30", "h01", "h02", "h03", "h04", "h24", "h96"]
+FIELDS_AFTER_NAME = 2 + len(VALUE_COLUMNS) + 1
+
+
 class WebSirenesParser:
     websirenes_defesa_civil_path = (
         Path(__file__).parent.parent.parent / "data/ws" / "websirenes_defesa_civil"
     )
 
+    def __init__(self, websirenes_defesa_civil_path: Optional[Path] = None) -> None:
+        if websirenes_defesa_civil_path is not None:
+            self.websirenes_defesa_civil_path = websirenes_defesa_civil_path
+
     def list_files(self) -> list[str]:
         return os.listdir(self.websirenes_defesa_civil_path)
 
@@ -119,25 +130,70 @@ class WebSirenesParser:
             int(station_id),
         )
 
-    def _parse_txt_file(self, file_path: str) -> tuple[list[str], list[tuple]]:
+    def _split_lines(self, file_path: str) -> tuple[list[str], list[list[str]]]:
         """
-        Given a file path, parse the file and return the header and the data
-        Returns:
-            tuple: (header, data)
-            Where:
-                header: list of strings with the header of the file
-                data: list of tuples with the data of the file
+        Splits each line in its fields: the name, which may have spaces, is everything
+        before the last FIELDS_AFTER_NAME fields, so a single rsplit per line is enough.
         """
-        try:
-            file_data: list[tuple] = []
-            with open(file_path, "r", encoding="utf-8-sig") as file:
-                header = file.readline().strip().split()
-                for line in file:
-                    file_data.append(self._extract_features(line))
-            return header, file_data
-        except Exception as e:
-            log.error(f"Error parsing file {file_path}: {e}")
-            raise e
+        with open(file_path, "r", encoding="utf-8-sig") as file:
+            header = file.readline().strip().split()
+            rows = [
+                line.rsplit(None, FIELDS_AFTER_NAME)
+                for line in file.read().splitlines()
+                if line.strip()
+            ]
+
+        for line_number, row in enumerate(rows, start=2):
+            if len(row) != FIELDS_AFTER_NAME + 1:
+                raise ValueError(
+                    f"Could not extract features from line {line_number}: {' '.join(row)}"
+                )
+        return header, rows
+
+    def _parse_columns(self, file_path: str) -> pd.DataFrame:
+        """
+        The lines of the file as a dataframe with the header columns, the same values
+        _extract_features gets from each line, but each column is converted at once:
+        the fields after the name are read by the C parser of read_csv.
+        horaLeitura is converted from the "-03" offset of each line to naive UTC.
+        """
+        header, rows = self._split_lines(file_path)
+        if len(header) != FIELDS_AFTER_NAME:
+            raise ValueError(f"Unexpected header: {header}")
+        if not rows:
+            raise ValueError("No data lines")
+
+        fields = ["date", "time", *VALUE_COLUMNS, "id"]
+        # values may have a decimal comma, the name is not part of the text
+        text = "\n".join([" ".join(row[1:]) for row in rows]).replace(",", ".")
+        df = pd.read_csv(
+            io.StringIO(text),
+            sep=" ",
+            header=None,
+            names=fields,
+            na_values=["null"],
+            keep_default_na=False,
+            dtype={
+                "date": str,
+                "time": str,
+                **{column: np.float64 for column in VALUE_COLUMNS},
+                "id": np.int64,
+            },
+        )
+
+        # "00:00:00-03" is the local time and its offset in hours
+        local_time = pd.to_datetime(
+            df["date"] + " " + df["time"].str.slice(0, 8), format="%Y-%m-%d %H:%M:%S"
+        )
+        utc_offset = pd.to_timedelta(df["time"].str.slice(8).astype(np.int64), unit="h")
+
+        columns = [
+            pd.Series([row[0] for row in rows], dtype=str),
+            local_time - utc_offset,
+            *[df[column] for column in VALUE_COLUMNS],
+            df["id"],
+        ]
+        return pd.DataFrame(dict(zip(header, columns)))
 
     def read_station_name_id_txt_file(self, file_path: str) -> tuple[str, int]:
         try:
@@ -162,11 +218,11 @@ class WebSirenesParser:
             raise e
 
     def get_dataframe(self, file_path: str) -> pd.DataFrame:
-        header, file_data = self._parse_txt_file(file_path)
-        df = pd.DataFrame(file_data, columns=header)
-        df["horaLeitura"] = pd.to_datetime(
-            df["horaLeitura"], format="%Y-%m-%d %H:%M:%S%z"
-        ).dt.tz_convert(None)
+        try:
+            df = self._parse_columns(file_path)
+        except Exception as e:
+            log.error(f"Error parsing file {file_path}: {e}")
+            raise e
         df.rename(columns={"id": "station_id"}, inplace=True)
         WebSireneSchema.validate(df)
         df.set_index("horaLeitura", inplace=True)
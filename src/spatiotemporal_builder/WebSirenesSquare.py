@@ -1,5 +1,5 @@
 from datetime import timedelta
-from pathlib import Path
+from typing import Optional
 
 import numpy as np
 import pandas as pd
@@ -8,14 +8,60 @@ import xarray as xr
 from .ERA5Square import ERA5Square
 from .Logger import logger
 from .square import Square
+from .StationsIndex import StationsIndex
+from .StationsPrecipitationCube import StationsPrecipitationCube, get_hourly_windows
 from .WebSirenesKeys import WebSirenesKeys
 
+try:
+    from ..utils.file_fingerprint import get_file_fingerprint
+except ImportError:
+    # imported as a top-level package, with src in the path
+    from utils.file_fingerprint import get_file_fingerprint
+
 log = logger.get_logger(__name__)
 
 
 class WebSirenesSquare(ERA5Square):
     def __init__(self, websirenes_keys: WebSirenesKeys) -> None:
         self.websirenes_keys = websirenes_keys
+        self.stations_index: Optional[StationsIndex] = None
+        self.precipitation_cube: Optional[StationsPrecipitationCube] = None
+
+    def build_stations_index(self) -> StationsIndex:
+        """
+        Lists the keys folder once, must be called after the keys are built
+        """
+        self.stations_index = StationsIndex(self.websirenes_keys.websirenes_keys_path)
+        return self.stations_index
+
+    def _get_hourly_precipitation(
+        self, key: str, hours: pd.DatetimeIndex
+    ) -> dict[str, np.ndarray]:
+        df_web = self.websirenes_keys.load_key(key)
+        return get_hourly_windows(df_web.index, df_web["m15"], df_web["h01"], hours)
+
+    def build_precipitation_cube(
+        self, start_date: pd.Timestamp, end_date: pd.Timestamp
+    ) -> StationsPrecipitationCube:
+        if self.stations_index is None:
+            self.build_stations_index()
+        self.precipitation_cube = StationsPrecipitationCube(
+            self.websirenes_keys.websirenes_keys_path / "precipitation_cube"
+        )
+        keys = self.stations_index.keys.tolist()
+        self.precipitation_cube.build(
+            keys,
+            self._get_hourly_precipitation,
+            start_date,
+            end_date,
+            fingerprints={
+                key: get_file_fingerprint(
+                    self.websirenes_keys.websirenes_keys_path / f"{key}.parquet"
+                )
+                for key in keys
+            },
+        )
+        return self.precipitation_cube
 
     def get_keys_in_square(
         self, square: Square, stations_websirenes: set, verbose: bool = False
@@ -25,21 +71,14 @@ class WebSirenesSquare(ERA5Square):
         Args:
             square (Square): The square to check for keys
         """
-        keys = [
-            x.stem
-            for x in Path(self.websirenes_keys.websirenes_keys_path).glob("*.parquet")
-        ]
-        websirenes_keys = []
-        for key in keys:
-            key_lat, key_lon = map(float, key.split("_"))
-
-            if (
-                verbose
-                and not (
-                    key_lat < square.bottom_left[0] or key_lat > square.top_left[0]
-                )
-                and not (key_lon < square.top_left[1] or key_lon > square.top_right[1])
-            ):
+        if self.stations_index is None:
+            self.build_stations_index()
+
+        websirenes_keys = self.stations_index.get_keys_in_square(square)
+
+        if verbose:
+            for key in websirenes_keys:
+                key_lat, key_lon = map(float, key.split("_"))
                 log.success(
                     f"""
                     Lat and Lon Square:
@@ -49,13 +88,6 @@ class WebSirenesSquare(ERA5Square):
                 """
                 )
 
-            if key_lat < square.bottom_left[0] or key_lat > square.top_left[0]:
-                continue
-            if key_lon < square.top_left[1] or key_lon > square.top_right[1]:
-                continue
-
-            websirenes_keys.append(key)
-
         if len(websirenes_keys) > 0:
             stations_websirenes.update(websirenes_keys)
 
@@ -75,6 +107,24 @@ class WebSirenesSquare(ERA5Square):
 
         precipitations_15_min_aggregated: list[float] = []
         for key in websirenes_keys:
+            window = (
+                self.precipitation_cube.get(key, timestamp)
+                if self.precipitation_cube is not None
+                else None
+            )
+            if window is not None:
+                m15 = window["m15_sum"]
+                if not window["m15_complete"]:
+                    # same fallback as below, the window misses a value or has a NaN
+                    m15_era5 = super().get_era5_single_levels_precipitation_in_square(
+                        square, ds_time
+                    )
+                    m15 = np.array([m15, m15_era5]).max()
+                precipitations_15_min_aggregated.append(
+                    np.array([m15, window["h01_sum"]]).max().item()
+                )
+                continue
+
             df_web = self.websirenes_keys.load_key(key)
 
             time_upper_bound = timestamp
@@ -8,6 +8,7 @@ import pandas as pd
 import xarray as xr
 from tqdm import tqdm
 
+from .BuildManifest import get_fingerprint
 from .Logger import TqdmLogger, logger
 from .WebsirenesTarget import SpatioTemporalFeatures
 
@@ -19,70 +20,304 @@ os.environ["HDF5_USE_FILE_LOCKING"] = "FALSE"
 class WebsirenesDataset:
     dataset_path = Path(__file__).parent / "output_dataset.nc"
 
-    def __init__(self, websirenes_target: SpatioTemporalFeatures) -> None:
+    def __init__(
+        self,
+        websirenes_target: SpatioTemporalFeatures,
+        dataset_path: Optional[Path] = None,
+    ) -> None:
+        if dataset_path is not None:
+            self.dataset_path = dataset_path
         self.websirenes_target = websirenes_target
         self.TIMESTEPS = 5
 
-    def _has_timesteps(self, year: int, month: int, day: int, hour: int) -> bool:
-        start_time = pd.Timestamp(year=year, month=month, day=day, hour=hour)
-        for timestep in reversed(range(self.TIMESTEPS)):
-            current_time = start_time - pd.Timedelta(hours=timestep)
-            file = (
-                self.websirenes_target.features_path
-                / f"{current_time.year:04}_{current_time.month:02}_{current_time.day:02}_{current_time.hour:02}_features.npy"
+    def _get_time_axis(
+        self, min_timestamp: pd.Timestamp, max_timestamp: pd.Timestamp, shift: int
+    ) -> pd.DatetimeIndex:
+        """
+        Every hour used by the samples from min_timestamp to max_timestamp:
+        the x window of the first sample starts TIMESTEPS - 1 hours before min_timestamp,
+        the y window of the last sample ends shift hours after max_timestamp
+        """
+        return pd.date_range(
+            start=min_timestamp.floor("h") - pd.Timedelta(hours=self.TIMESTEPS - 1),
+            end=max_timestamp.floor("h") + pd.Timedelta(hours=shift),
+            freq="h",
+        )
+
+    def _get_samples(
+        self,
+        time_axis: pd.DatetimeIndex,
+        min_timestamp: pd.Timestamp,
+        max_timestamp: pd.Timestamp,
+        ignored_months: list[int],
+        shift: int,
+    ) -> npt.NDArray[np.int64]:
+        """
+        Indexes in time_axis of the last hour of the x window of each sample.
+        A sample exists when all hours of its x window and of its y window (shift hours later) exist.
+        """
+        available = np.array(
+            [self.websirenes_target.has_features(hour) for hour in time_axis],
+            dtype=np.int64,
+        )
+        # available_windows[i] is True when the TIMESTEPS hours ending at time_axis[i] exist
+        cumulative = np.concatenate([[0], np.cumsum(available)])
+        available_windows = np.zeros(len(time_axis), dtype=bool)
+        available_windows[self.TIMESTEPS - 1 :] = (
+            cumulative[self.TIMESTEPS :] - cumulative[: -self.TIMESTEPS]
+        ) == self.TIMESTEPS
+
+        timestamps = pd.date_range(start=min_timestamp, end=max_timestamp, freq="h")
+        timestamps = timestamps[~timestamps.month.isin(ignored_months)]
+        x_ends = time_axis.get_indexer(timestamps.floor("h"))
+        return x_ends[available_windows[x_ends] & available_windows[x_ends + shift]]
+
+    def _create_netcdf(
+        self,
+        dataset_path: Path,
+        dims: dict[str, Optional[int]],
+        variables: dict[str, tuple[np.dtype, tuple[str, ...], Optional[tuple]]],
+    ):
+        import netCDF4
+
+        nc = netCDF4.Dataset(dataset_path, "w")
+        for dim, size in dims.items():
+            nc.createDimension(dim, size)
+        for name, (dtype, var_dims, chunksizes) in variables.items():
+            nc.createVariable(
+                name,
+                dtype,
+                var_dims,
+                zlib=chunksizes is not None,
+                chunksizes=chunksizes,
             )
-            if not Path(file).exists():
-                return False
-        return True
-
-    def _get_dataset_with_timesteps(
-        self, year: int, month: int, day: int, hour: int, time_step: int = 5
-    ) -> npt.NDArray[np.float64]:
-        start_time = pd.Timestamp(year=year, month=month, day=day, hour=hour)
-        timesteps = []
-        oldest_to_newest = reversed(range(time_step))
-        for timestep in oldest_to_newest:
-            current_time = start_time - pd.Timedelta(hours=timestep)
-            file = f"{current_time.year:04}_{current_time.month:02}_{current_time.day:02}_{current_time.hour:02}_features.npy"
-            try:
-                data = np.load(self.websirenes_target.features_path / file)
-            except Exception as e:
-                print(f"Error loading file {file}: {e}")
-                exit(1)
-            timesteps.append(data)
-        data = np.stack(timesteps, axis=0)
-        return data
-
-    def _process_timestamp(
-        self, timestamp: pd.Timestamp, overlapping: bool = True
-    ) -> tuple[Optional[npt.NDArray[np.float64]], Optional[npt.NDArray[np.float64]]]:
-        year = timestamp.year
-        month = timestamp.month
-        day = timestamp.day
-        hour = timestamp.hour
-        if not self._has_timesteps(year, month, day, hour):
-            return None, None
-
-        next_timestamp = (
-            timestamp + pd.Timedelta(hours=1)
-            if overlapping
-            else timestamp + pd.Timedelta(hours=self.TIMESTEPS)
+        nc["lat"][:] = self.websirenes_target.sorted_latitudes_ascending[::-1]
+        nc["lon"][:] = self.websirenes_target.sorted_longitudes_ascending
+        nc["channel"][:] = np.arange(dims["channel"])
+        return nc
+
+    def _write_samples(
+        self,
+        dataset_path: Path,
+        time_axis: pd.DatetimeIndex,
+        samples: npt.NDArray[np.int64],
+        shift: int,
+        batch_size: int = 256,
+    ) -> None:
+        """
+        x and y of each sample as (sample, timestep, lat, lon, channel) arrays, the output_dataset.nc layout.
+        The hours are read once, in order, keeping only the last TIMESTEPS + shift hours in memory.
+        """
+        window_length = self.TIMESTEPS + shift
+        lats = len(self.websirenes_target.sorted_latitudes_ascending)
+        lons = len(self.websirenes_target.sorted_longitudes_ascending)
+        channels = len(self.websirenes_target.features_tuple)
+        shape = (lats, lons, channels)
+        dtype = self.websirenes_target.load_features(time_axis[samples[0]]).dtype
+        chunksizes = (1, self.TIMESTEPS, *shape)
+
+        nc = self._create_netcdf(
+            dataset_path,
+            {
+                "sample": None,
+                "timestep": self.TIMESTEPS,
+                "lat": lats,
+                "lon": lons,
+                "channel": channels,
+            },
+            {
+                "sample": (np.int64, ("sample",), None),
+                "timestep": (np.int64, ("timestep",), None),
+                "lat": (np.float64, ("lat",), None),
+                "lon": (np.float64, ("lon",), None),
+                "channel": (np.int64, ("channel",), None),
+                "x": (
+                    dtype,
+                    ("sample", "timestep", "lat", "lon", "channel"),
+                    chunksizes,
+                ),
+                "y": (
+                    dtype,
+                    ("sample", "timestep", "lat", "lon", "channel"),
+                    chunksizes,
+                ),
+            },
         )
-        year_y = next_timestamp.year
-        month_y = next_timestamp.month
-        day_y = next_timestamp.day
-        hour_y = next_timestamp.hour
+        nc["timestep"][:] = np.arange(self.TIMESTEPS)
+
+        # ring buffer with the last window_length hours, indexed by position % window_length
+        hours = np.zeros((window_length, *shape), dtype=dtype)
+        batch_x = np.zeros((batch_size, self.TIMESTEPS, *shape), dtype=dtype)
+        batch_y = np.zeros((batch_size, self.TIMESTEPS, *shape), dtype=dtype)
+        batch_samples = 0
+        written_samples = 0
+
+        first_position = samples[0] - self.TIMESTEPS + 1
+        last_position = samples[-1] + shift
+        # the sample with x window ending at position - shift is complete at position
+        samples_by_y_end = set((samples + shift).tolist())
+
+        try:
+            for position in tqdm(
+                range(first_position, last_position + 1),
+                mininterval=60,
+                file=TqdmLogger(log),
+            ):
+                if self.websirenes_target.has_features(time_axis[position]):
+                    hours[position % window_length] = (
+                        self.websirenes_target.load_features(time_axis[position])
+                    )
+
+                if position not in samples_by_y_end:
+                    continue
+
+                x_end = position - shift
+                x_positions = np.arange(x_end - self.TIMESTEPS + 1, x_end + 1)
+                y_positions = np.arange(position - self.TIMESTEPS + 1, position + 1)
+                batch_x[batch_samples] = hours[x_positions % window_length]
+                batch_y[batch_samples] = hours[y_positions % window_length]
+                batch_samples += 1
+
+                if batch_samples == batch_size:
+                    self._flush_batch(
+                        nc, batch_x, batch_y, batch_samples, written_samples
+                    )
+                    written_samples += batch_samples
+                    batch_samples = 0
+
+            self._flush_batch(nc, batch_x, batch_y, batch_samples, written_samples)
+            written_samples += batch_samples
+        finally:
+            nc.close()
+
+        assert written_samples == len(
+            samples
+        ), f"Expected {len(samples)} samples, wrote {written_samples}"
+
+    def _flush_batch(
+        self,
+        nc,
+        batch_x: npt.NDArray,
+        batch_y: npt.NDArray,
+        batch_samples: int,
+        written_samples: int,
+    ) -> None:
+        if batch_samples == 0:
+            return
+        batch = slice(written_samples, written_samples + batch_samples)
+        nc["x"][batch] = batch_x[:batch_samples]
+        nc["y"][batch] = batch_y[:batch_samples]
+        nc["sample"][batch] = np.arange(batch.start, batch.stop)
 
-        if not self._has_timesteps(year_y, month_y, day_y, hour_y):
-            return None, None
+    def _write_time_axis(
+        self,
+        dataset_path: Path,
+        time_axis: pd.DatetimeIndex,
+        samples: npt.NDArray[np.int64],
+        shift: int,
+    ) -> None:
+        """
+        Each hour used by the samples is stored once in a (time, lat, lon, channel) array,
+        the samples are the index of the first hour of their x and y windows:
+            x = features[x_start:x_start + timestep], y = features[y_start:y_start + timestep]
+        See get_sample.
+        """
+        window_offsets = np.arange(-self.TIMESTEPS + 1, 1)
+        used_positions = np.unique(
+            np.concatenate(
+                [
+                    samples[:, None] + window_offsets,
+                    samples[:, None] + shift + window_offsets,
+                ]
+            )
+        )
+        # windows are contiguous in the used hours, all their hours are used
+        compact_positions = np.full(len(time_axis), -1, dtype=np.int64)
+        compact_positions[used_positions] = np.arange(len(used_positions))
 
-        # log.debug(f"Loading data_x for {year:02}-{month:02}-{day:02} {hour}:00")
-        data_x = self._get_dataset_with_timesteps(year, month, day, hour)
+        lats = len(self.websirenes_target.sorted_latitudes_ascending)
+        lons = len(self.websirenes_target.sorted_longitudes_ascending)
+        channels = len(self.websirenes_target.features_tuple)
+        dtype = self.websirenes_target.load_features(time_axis[samples[0]]).dtype
 
-        # log.debug(f"Loading data_y for {year:02}-{month:02}-{day:02} {hour + self.TIMESTEPS}:00")
-        data_y = self._get_dataset_with_timesteps(year_y, month_y, day_y, hour_y)
+        nc = self._create_netcdf(
+            dataset_path,
+            {
+                "time": len(used_positions),
+                "sample": len(samples),
+                "lat": lats,
+                "lon": lons,
+                "channel": channels,
+            },
+            {
+                "time": (np.int64, ("time",), None),
+                "lat": (np.float64, ("lat",), None),
+                "lon": (np.float64, ("lon",), None),
+                "channel": (np.int64, ("channel",), None),
+                "features": (
+                    dtype,
+                    ("time", "lat", "lon", "channel"),
+                    (1, lats, lons, channels),
+                ),
+                "x_start": (np.int64, ("sample",), None),
+                "y_start": (np.int64, ("sample",), None),
+            },
+        )
+        try:
+            nc.timesteps = self.TIMESTEPS
+            nc["time"].units = f"hours since {time_axis[0].isoformat(sep=' ')}"
+            nc["time"][:] = used_positions
+            nc["x_start"][:] = compact_positions[samples - self.TIMESTEPS + 1]
+            nc["y_start"][:] = compact_positions[samples + shift - self.TIMESTEPS + 1]
+            for time_index, position in enumerate(
+                tqdm(used_positions, mininterval=60, file=TqdmLogger(log))
+            ):
+                nc["features"][time_index] = self.websirenes_target.load_features(
+                    time_axis[position]
+                )
+        finally:
+            nc.close()
+
+    def _get_inputs_fingerprint(
+        self,
+        time_axis: pd.DatetimeIndex,
+        samples: npt.NDArray[np.int64],
+        shift: int,
+        layout: str,
+    ) -> str:
+        """
+        Fingerprint of the hours used by the samples, as recorded in the features manifest
+        """
+        build_manifest = self.websirenes_target.build_manifest
+        return get_fingerprint(
+            {
+                "layout": layout,
+                "timesteps": self.TIMESTEPS,
+                "shift": shift,
+                "start": time_axis[0].isoformat(),
+                "samples": get_fingerprint(samples.tolist()),
+                "hours": [build_manifest.get(hour) for hour in time_axis],
+            }
+        )
+
+    def _read_inputs_fingerprint(self) -> Optional[str]:
+        import netCDF4
 
-        return data_x, data_y
+        with netCDF4.Dataset(self.dataset_path) as nc:
+            return getattr(nc, "inputs_fingerprint", None)
+
+    @staticmethod
+    def get_sample(ds: xr.Dataset, sample: int) -> tuple[xr.DataArray, xr.DataArray]:
+        """
+        x and y windows of a sample of a dataset built with layout="time_axis"
+        """
+        timesteps = ds.attrs["timesteps"]
+        x_start = int(ds["x_start"][sample])
+        y_start = int(ds["y_start"][sample])
+        return (
+            ds["features"].isel(time=slice(x_start, x_start + timesteps)),
+            ds["features"].isel(time=slice(y_start, y_start + timesteps)),
+        )
 
     def build_netcdf(
         self,
@@ -91,12 +326,33 @@ class WebsirenesDataset:
         ignored_months: list[int],
         use_cache: bool = True,
         overlapping: bool = True,
+        layout: str = "samples",
     ) -> None:
+        """
+        layout="samples" writes x and y as (sample, timestep, lat, lon, channel) arrays
+        layout="time_axis" writes each hour once and the windows as indexes, see get_sample
+
+        The cached dataset is only used when it was built from the same hours, with the
+        same input fingerprints, otherwise it's rebuilt.
+        """
+        shift = 1 if overlapping else self.TIMESTEPS
+        time_axis = self._get_time_axis(min_timestamp, max_timestamp, shift)
+        samples = self._get_samples(
+            time_axis, min_timestamp, max_timestamp, ignored_months, shift
+        )
+        inputs_fingerprint = self._get_inputs_fingerprint(
+            time_axis, samples, shift, layout
+        )
+
         if use_cache and self.dataset_path.exists():
-            log.warning(
-                f"Using cached output_dataset.nc. To clear cache delete the {self.dataset_path} file"
+            if self._read_inputs_fingerprint() == inputs_fingerprint:
+                log.warning(
+                    f"Using cached output_dataset.nc. To clear cache delete the {self.dataset_path} file"
+                )
+                return
+            log.info(
+                f"The hours used by {self.dataset_path} changed since it was built, rebuilding it"
             )
-            return
 
         log.info(f"Building dataset in {self.dataset_path}")
 
@@ -104,84 +360,32 @@ class WebsirenesDataset:
             min_timestamp, max_timestamp, ignored_months
         )
 
-        has_last_timestamp_plus_one_hour = self._has_timesteps(
-            max_timestamp.year,
-            max_timestamp.month,
-            max_timestamp.day,
-            max_timestamp.hour + 1,
-        )
-        added_extra_hour = 1 if has_last_timestamp_plus_one_hour else 0
-
-        total_samples = (
-            validated_total_timestamps - self.TIMESTEPS + added_extra_hour
-            if overlapping
-            else validated_total_timestamps
-            - (2 * self.TIMESTEPS)
-            + 1
-            + added_extra_hour
-        )
-
-        timestamps = pd.date_range(start=min_timestamp, end=max_timestamp, freq="h")
-
         log.info(
             f"""
             Total timestamps: {validated_total_timestamps}
             Min timestamp: {min_timestamp}
             Max timestamp: {max_timestamp}
-            Total samples: {total_samples} (overlapping: {overlapping})
+            Total samples: {len(samples)} (overlapping: {overlapping})
+            Layout: {layout}
         """
         )
 
-        data_x_list = []
-        data_y_list = []
-        for timestamp in tqdm(timestamps, mininterval=60, file=TqdmLogger(log)):
-            if timestamp.month in ignored_months:
-                continue
-
-            data_x, data_y = self._process_timestamp(timestamp, overlapping)
-            if data_x is None and data_y is None:
-                continue
-            data_x_list.append(data_x)
-            data_y_list.append(data_y)
-            # high space complexity, may need to investigate another approach
-
-        assert len(data_x_list) == len(
-            data_y_list
-        ), "Mismatch between data_x and data_y lists"
-
-        data_x = np.stack(data_x_list, axis=0)
-        data_y = np.stack(data_y_list, axis=0)
-
-        print(f"data_x shape: {data_x.shape}")
-        print(f"data_y shape: {data_y.shape}")
-
-        # assert len(data_x) == total_samples, f"Expected {total_samples} samples, got {len(data_x)}"
-        # this assertion is not valid when ignoring months
-
-        assert (
-            data_x.shape == data_y.shape
-        ), f"x shape {data_x.shape} != y shape {data_y.shape}"
+        if len(samples) == 0:
+            log.error("No samples found, all x and y windows have missing hours")
+            return
 
-        log.debug(f"data_x shape: {data_x.shape}")
-        log.debug(f"data_y shape: {data_y.shape}")
+        tmp_dataset_path = self.dataset_path.with_suffix(".tmp.nc")
+        if layout == "samples":
+            self._write_samples(tmp_dataset_path, time_axis, samples, shift)
+        elif layout == "time_axis":
+            self._write_time_axis(tmp_dataset_path, time_axis, samples, shift)
+        else:
+            raise ValueError(f"Unknown layout: {layout}")
 
-        sample = np.arange(data_x.shape[0])
-        timestep = np.arange(data_x.shape[1])
-        channel = np.arange(data_x.shape[4])
+        import netCDF4
 
-        ds = xr.Dataset(
-            {
-                "x": (["sample", "timestep", "lat", "lon", "channel"], data_x),
-                "y": (["sample", "timestep", "lat", "lon", "channel"], data_y),
-            },
-            coords={
-                "sample": sample,
-                "timestep": timestep,
-                "lat": self.websirenes_target.sorted_latitudes_ascending[::-1],
-                "lon": self.websirenes_target.sorted_longitudes_ascending,
-                "channel": channel,
-            },
-        )
+        with netCDF4.Dataset(tmp_dataset_path, "a") as nc:
+            nc.inputs_fingerprint = inputs_fingerprint
 
-        ds.to_netcdf(self.dataset_path)
+        os.replace(tmp_dataset_path, self.dataset_path)
         log.success(f"Dataset saved to {self.dataset_path}")
@@ -1,9 +1,8 @@
 import os
 import time
 from concurrent.futures import ProcessPoolExecutor, as_completed
-from multiprocessing.managers import BaseManager
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
 
 import numpy as np
 import numpy.typing as npt
@@ -12,53 +11,72 @@ import xarray as xr
 from tqdm import tqdm
 
 from .AlertarioSquare import AlertarioSquare
+from .BuildManifest import BuildManifest, get_fingerprint
+from .FeaturesStore import FeaturesStore
 from .INMETSquare import INMETSquare
 from .Logger import TqdmLogger, logger
 from .settings import settings
 from .square import Square, get_square
 from .WebSirenesSquare import WebSirenesSquare
 
-log = logger.get_logger(__name__)
+try:
+    from ..utils.file_fingerprint import get_file_fingerprint
+except ImportError:
+    # imported as a top-level package, with src in the path
+    from utils.file_fingerprint import get_file_fingerprint
 
+log = logger.get_logger(__name__)
 
-class StationsManager(BaseManager):
-    pass
 
+class BlockResult(NamedTuple):
+    """
+    Stations and cells with stations found while processing a block of hours
+    """
 
-StationsManager.register("Set", set)
-StationsManager.register("Dict", dict)
+    stations_cells: set[tuple[int, int]]
+    stations_websirenes: set[str]
+    stations_inmet: set[str]
+    stations_alertario: set[str]
 
 
 class SpatioTemporalFeatures:
-    manager = StationsManager()
-    manager.start()
-    stations_cells = manager.Set()
-    stations_inmet = manager.Set()
-    stations_websirenes = manager.Set()
-    stations_alertario = manager.Set()
-    dataset_era5_year_month = manager.Dict()
-
     def __init__(
         self,
         websirenes_square: WebSirenesSquare,
         inmet_square: INMETSquare,
         alertario_square: AlertarioSquare,
+        features_path: Optional[Path] = None,
+        era5_single_levels_path: Optional[Path] = None,
+        era5_pressure_levels_path: Optional[Path] = None,
     ):
-        self.features_path = Path(__file__).parent / "features"
+        self.features_path = features_path or Path(__file__).parent / "features"
         if not self.features_path.exists():
             self.features_path.mkdir()
 
         self.era5_single_levels_path = (
-            Path(__file__).parent.parent.parent / "data/reanalysis/ERA5-single-levels"
+            era5_single_levels_path
+            or Path(__file__).parent.parent.parent
+            / "data/reanalysis/ERA5-single-levels"
         )
         self.era5_pressure_levels_path = (
-            Path(__file__).parent.parent.parent / "data/reanalysis/ERA5-pressure-levels"
+            era5_pressure_levels_path
+            or Path(__file__).parent.parent.parent
+            / "data/reanalysis/ERA5-pressure-levels"
         )
 
         self.websirenes_square = websirenes_square
         self.inmet_square = inmet_square
         self.alertario_square = alertario_square
 
+        # filled by the blocks of hours, see _process_block
+        self.stations_cells: set[tuple[int, int]] = set()
+        self.stations_websirenes: set[str] = set()
+        self.stations_inmet: set[str] = set()
+        self.stations_alertario: set[str] = set()
+        # ERA5 datasets opened by a worker, kept open while it processes its block
+        self.era5_datasets: dict[tuple[str, int, int], xr.Dataset] = {}
+        self.era5_files: list[xr.Dataset] = []
+
         lats, lons = self._get_grid_lats_lons()
 
         self.sorted_latitudes_ascending = np.sort(lats)
@@ -86,6 +104,20 @@ class SpatioTemporalFeatures:
             "w1000": "Vertical velocity at 1000 hPa",
         }
 
+        self.features_store: Optional[FeaturesStore] = (
+            FeaturesStore(
+                self.features_path / "store",
+                (
+                    len(self.sorted_latitudes_ascending),
+                    len(self.sorted_longitudes_ascending),
+                    len(self.features_tuple),
+                ),
+            )
+            if settings.features_store == "chunked"
+            else None
+        )
+        self.build_manifest = BuildManifest(self.features_path / "manifest")
+
         log.debug("SpatioTemporalFeatures initialized")
         log.debug(
             f"Grid: {len(self.sorted_latitudes_ascending)}x{len(self.sorted_longitudes_ascending)}"
@@ -96,68 +128,167 @@ class SpatioTemporalFeatures:
             f"Spatial resolution: {self.sorted_latitudes_ascending[1] - self.sorted_latitudes_ascending[0]:.2f} degrees"
         )
 
+    def _get_features_filename(self, timestamp: pd.Timestamp) -> Path:
+        return self.features_path / f"{timestamp.strftime('%Y_%m_%d_%H')}_features.npy"
+
     def _write_features(
         self, features: npt.NDArray[np.float64], timestamp: pd.Timestamp
     ):
-        features_filename = (
-            self.features_path / f"{timestamp.strftime('%Y_%m_%d_%H')}_features.npy"
-        )
-        np.save(features_filename, features)
+        if self.features_store is not None:
+            self.features_store.write(timestamp, features)
+            return
+        np.save(self._get_features_filename(timestamp), features)
+
+    def has_features(self, timestamp: pd.Timestamp) -> bool:
+        if self.features_store is not None:
+            return self.features_store.is_done(timestamp)
+        return self._get_features_filename(timestamp).exists()
+
+    def load_features(self, timestamp: pd.Timestamp) -> npt.NDArray[np.float64]:
+        if self.features_store is not None:
+            return self.features_store.read(timestamp)
+        return np.load(self._get_features_filename(timestamp))
 
     def _get_grid_lats_lons(
         self,
     ) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.float32]]:
-        ds = self._get_era5_single_levels_dataset(2009, 6)
-        lats = ds.coords["latitude"].values
-        lons = ds.coords["longitude"].values
+        era5_year_month_path = (
+            self.era5_single_levels_path / "monthly_data" / "RJ_2009_6.nc"
+        )
+        with xr.open_dataset(era5_year_month_path) as ds:
+            lats = ds.coords["latitude"].values
+            lons = ds.coords["longitude"].values
         return lats, lons
 
+    def _get_era5_month_path(self, levels_path: Path, year: int, month: int) -> Path:
+        return levels_path / "monthly_data" / f"RJ_{year}_{month}.nc"
+
+    def _get_input_fingerprints(
+        self, timestamps: list[pd.Timestamp]
+    ) -> dict[pd.Timestamp, str]:
+        """
+        Fingerprint of the inputs of each hour: the ERA5 files of its month and, unless
+        only_ERA5, the values of all stations at the hour in the precipitation cubes.
+        Adding or correcting station data only changes the fingerprints of the hours
+        with different values.
+        """
+        era5_months: dict[tuple[int, int], dict] = {}
+        for timestamp in timestamps:
+            month = (timestamp.year, timestamp.month)
+            if month not in era5_months:
+                era5_months[month] = {
+                    "single_levels": get_file_fingerprint(
+                        self._get_era5_month_path(self.era5_single_levels_path, *month)
+                    ),
+                    "pressure_levels": get_file_fingerprint(
+                        self._get_era5_month_path(
+                            self.era5_pressure_levels_path, *month
+                        )
+                    ),
+                }
+
+        stations_digests: list[list[str]] = []
+        if not settings.only_ERA5:
+            hours = pd.DatetimeIndex(timestamps)
+            stations_digests = [
+                square.precipitation_cube.get_hourly_digests(hours)
+                for square in (
+                    self.websirenes_square,
+                    self.inmet_square,
+                    self.alertario_square,
+                )
+            ]
+
+        return {
+            timestamp: get_fingerprint(
+                {
+                    "only_ERA5": settings.only_ERA5,
+                    "era5": era5_months[(timestamp.year, timestamp.month)],
+                    "stations": [digests[i] for digests in stations_digests],
+                }
+            )
+            for i, timestamp in enumerate(timestamps)
+        }
+
+    def _get_pending_timestamps(
+        self, timestamps: list[pd.Timestamp], fingerprints: dict[pd.Timestamp, str]
+    ) -> list[pd.Timestamp]:
+        """
+        Hours without features or whose inputs changed since they were built.
+        Hours built before the manifest existed are kept and recorded with the current fingerprints.
+        """
+        pending_timestamps = []
+        changed = 0
+        adopted = 0
+        for timestamp in timestamps:
+            if not self.has_features(timestamp):
+                pending_timestamps.append(timestamp)
+                continue
+
+            recorded = self.build_manifest.get(timestamp)
+            if recorded is None:
+                self.build_manifest.record(timestamp, fingerprints[timestamp])
+                adopted += 1
+            elif recorded != fingerprints[timestamp]:
+                pending_timestamps.append(timestamp)
+                changed += 1
+
+        if adopted:
+            self.build_manifest.save()
+            log.warning(
+                f"{adopted} hours were built without input fingerprints, they were kept as they are. Delete their features to rebuild them"
+            )
+        log.info(
+            f"{len(pending_timestamps)} hours to build: {len(pending_timestamps) - changed} new, {changed} with changed inputs"
+        )
+        return pending_timestamps
+
     def _get_era5_single_levels_dataset(self, year: int, month: int) -> xr.Dataset:
-        if (
-            self.dataset_era5_year_month.get((year, month)) == (year, month)
-            and self.dataset_era5_year_month.get("single_levels") is not None
-        ):
-            return self.dataset_era5_year_month.get("single_levels")
+        if ("single_levels", year, month) in self.era5_datasets:
+            return self.era5_datasets[("single_levels", year, month)]
 
-        era5_year_month_path = (
-            self.era5_single_levels_path / "monthly_data" / f"RJ_{year}_{month}.nc"
+        era5_year_month_path = self._get_era5_month_path(
+            self.era5_single_levels_path, year, month
         )
 
         if not os.path.exists(era5_year_month_path):
             raise FileNotFoundError(f"File {era5_year_month_path} not found")
 
-        if self.dataset_era5_year_month.get("single_levels") is not None:
-            self.dataset_era5_year_month.get("single_levels").close()
-
-        ds = xr.open_dataset(era5_year_month_path)
-        ds = ds[["tp"]]
-        self.dataset_era5_year_month.update({(year, month): (year, month)})
-        self.dataset_era5_year_month.update({"single_levels": ds})
+        ds_file = xr.open_dataset(era5_year_month_path)
+        self.era5_files.append(ds_file)
+        ds = ds_file[["tp"]]
+        if settings.scheduling == "month":
+            # the whole month is used by the block, decode it once
+            ds = ds.load()
+        self.era5_datasets[("single_levels", year, month)] = ds
         return ds
 
     def _get_era5_pressure_levels_dataset(self, year: int, month: int) -> xr.Dataset:
-        if (
-            self.dataset_era5_year_month.get((year, month)) == (year, month)
-            and self.dataset_era5_year_month.get("pressure_levels") is not None
-        ):
-            return self.dataset_era5_year_month.get("pressure_levels")
+        if ("pressure_levels", year, month) in self.era5_datasets:
+            return self.era5_datasets[("pressure_levels", year, month)]
 
-        era5_year_month_path = (
-            self.era5_pressure_levels_path / "monthly_data" / f"RJ_{year}_{month}.nc"
+        era5_year_month_path = self._get_era5_month_path(
+            self.era5_pressure_levels_path, year, month
         )
 
         if not era5_year_month_path.exists():
             raise FileNotFoundError(f"File {era5_year_month_path} not found")
 
-        if self.dataset_era5_year_month.get("pressure_levels") is not None:
-            self.dataset_era5_year_month.get("pressure_levels").close()
-
-        ds = xr.open_dataset(era5_year_month_path)
-        ds = ds[["r", "t", "u", "v", "w"]]
-        self.dataset_era5_year_month.update({(year, month): (year, month)})
-        self.dataset_era5_year_month.update({"pressure_levels": ds})
+        ds_file = xr.open_dataset(era5_year_month_path)
+        self.era5_files.append(ds_file)
+        ds = ds_file[["r", "t", "u", "v", "w"]]
+        if settings.scheduling == "month":
+            # the whole month is used by the block, decode it once
+            ds = ds.load()
+        self.era5_datasets[("pressure_levels", year, month)] = ds
         return ds
 
+    def _close_era5_datasets(self):
+        for ds_file in self.era5_files:
+            ds_file.close()
+        self.era5_files.clear()
+        self.era5_datasets.clear()
+
     def _get_precipitation_in_square(
         self,
         square: Square,
@@ -166,6 +297,7 @@ class SpatioTemporalFeatures:
         keys: list[tuple],
         lat_index: int,
         lon_index: int,
+        era5_tp: Optional[float] = None,
     ):
         if settings.only_ERA5:
             return (
@@ -174,14 +306,21 @@ class SpatioTemporalFeatures:
                 )
             )
 
-        websirenes_keys = self.websirenes_square.get_keys_in_square(square, keys)
+        websirenes_keys = self.websirenes_square.get_keys_in_square(
+            square, self.stations_websirenes
+        )
 
-        inmet_keys = self.inmet_square.get_keys_in_square(square, keys)
+        inmet_keys = self.inmet_square.get_keys_in_square(square, self.stations_inmet)
 
-        alertario_keys = self.alertario_square.get_keys_in_square(square, keys)
+        alertario_keys = self.alertario_square.get_keys_in_square(
+            square, self.stations_alertario
+        )
 
         if inmet_keys or websirenes_keys or alertario_keys:
             keys.append((lat_index, lon_index))
+        elif era5_tp is not None:
+            # every square would fall back to the same ERA5 precipitation
+            return era5_tp
 
         tp_sirenes = self.websirenes_square.get_precipitation_in_square(
             square, websirenes_keys, timestamp, ds
@@ -382,6 +521,56 @@ class SpatioTemporalFeatures:
             processed == total_squares
         ), "Not all cells processed failed to include last row and last column"
 
+    def _process_grid_vectorized(
+        self,
+        features: npt.NDArray[np.float64],
+        ds_single_levels: xr.Dataset,
+        ds_pressure_levels: xr.Dataset,
+        timestamp: pd.Timestamp,
+    ):
+        """
+        Same output as _process_grid, but the ERA5 channels of the whole grid
+        are extracted with array operations instead of square by square
+        """
+        features[:] = self.websirenes_square.get_era5_features_in_grid(
+            ds_single_levels,
+            ds_pressure_levels,
+            self.sorted_latitudes_ascending,
+            self.sorted_longitudes_ascending,
+        )
+
+        if settings.only_ERA5:
+            return
+
+        # only the precipitation of squares with stations differs from ERA5
+        top_down_lats = self.sorted_latitudes_ascending[::-1]
+        left_right_lons = self.sorted_longitudes_ascending
+
+        keys = []
+        for i, lat in enumerate(top_down_lats):
+            for j, lon in enumerate(left_right_lons):
+                square = get_square(
+                    lat,
+                    lon,
+                    self.sorted_latitudes_ascending,
+                    self.sorted_longitudes_ascending,
+                )
+
+                if square is None:
+                    continue
+
+                features[i, j, 0] = self._get_precipitation_in_square(
+                    square,
+                    timestamp,
+                    ds_single_levels,
+                    keys,
+                    i,
+                    j,
+                    era5_tp=features[i, j, 0],
+                )
+
+        self.stations_cells.update(keys)
+
     def _process_timestamp(self, timestamp: pd.Timestamp):
         year = timestamp.year
         month = timestamp.month
@@ -409,12 +598,51 @@ class SpatioTemporalFeatures:
             dtype=np.float64,
         )
 
-        self._process_grid(
+        process_grid = (
+            self._process_grid_vectorized
+            if settings.grid_mode == "vectorized"
+            else self._process_grid
+        )
+        process_grid(
             features, ds_single_levels_time, ds_pressure_levels_time, timestamp
         )
         self._write_features(features, timestamp)
-        ds_single_levels_time.close()
-        ds_pressure_levels_time.close()
+
+    def _process_block(self, timestamps: list[pd.Timestamp]) -> BlockResult:
+        """
+        Processes a block of hours in a worker, the ERA5 datasets of the block's
+        months are opened once and kept open until the block is done.
+        The stations found are returned instead of shared between the workers.
+        """
+        self.stations_cells = set()
+        self.stations_websirenes = set()
+        self.stations_inmet = set()
+        self.stations_alertario = set()
+        try:
+            for timestamp in timestamps:
+                self._process_timestamp(timestamp)
+        finally:
+            self._close_era5_datasets()
+
+        return BlockResult(
+            self.stations_cells,
+            self.stations_websirenes,
+            self.stations_inmet,
+            self.stations_alertario,
+        )
+
+    def _get_blocks(self, timestamps: list[pd.Timestamp]) -> list[list[pd.Timestamp]]:
+        """
+        scheduling="month": one block per month, so a worker opens the month's ERA5 files once
+        scheduling="hour": one block per hour
+        """
+        if settings.scheduling == "hour":
+            return [[timestamp] for timestamp in timestamps]
+
+        blocks: dict[tuple[int, int], list[pd.Timestamp]] = {}
+        for timestamp in timestamps:
+            blocks.setdefault((timestamp.year, timestamp.month), []).append(timestamp)
+        return list(blocks.values())
 
     def build_timestamps_hourly(
         self,
@@ -433,23 +661,40 @@ class SpatioTemporalFeatures:
         ONE_MINUTE = 60 * 1
         all_cached = True
 
+        if not settings.only_ERA5:
+            # built once here and shared with the workers along with the squares
+            self.websirenes_square.build_stations_index()
+            self.inmet_square.build_stations_index()
+            self.alertario_square.build_stations_index()
+            self.websirenes_square.build_precipitation_cube(minimum_date, maximum_date)
+            self.inmet_square.build_precipitation_cube(minimum_date, maximum_date)
+            self.alertario_square.build_precipitation_cube(minimum_date, maximum_date)
+
+        included_timestamps = [
+            timestamp
+            for timestamp in timestamps
+            if timestamp.month not in ignored_months
+        ]
+        fingerprints = self._get_input_fingerprints(included_timestamps)
+
         with ProcessPoolExecutor() as executor:
             futures = []
 
-            for timestamp in timestamps:
-                if (
-                    use_cache
-                    and self.features_path.joinpath(
-                        f"{timestamp.strftime('%Y_%m_%d_%H')}_features.npy"
-                    ).exists()
-                ):
-                    continue
+            pending_timestamps = (
+                self._get_pending_timestamps(included_timestamps, fingerprints)
+                if use_cache
+                else included_timestamps
+            )
 
-                if timestamp.month in ignored_months:
-                    continue
+            if self.features_store is not None:
+                self.features_store.prepare(pending_timestamps)
 
-                all_cached = False
-                futures.append(executor.submit(self._process_timestamp, timestamp))
+            all_cached = len(pending_timestamps) == 0
+            blocks = {
+                executor.submit(self._process_block, block): block
+                for block in self._get_blocks(pending_timestamps)
+            }
+            futures.extend(blocks)
             log.info(f"Tasks submitted - {len(futures)}")
 
             with tqdm(
@@ -461,47 +706,31 @@ class SpatioTemporalFeatures:
             ) as pbar:
                 for future in as_completed(futures):
                     try:
-                        future.result()
-                        pbar.update()
+                        block_result = future.result()
+                        pbar.update(len(blocks[future]))
                     except Exception as e:
                         log.error(f"Error processing timestamp: {e}")
                         raise SystemExit(e)
 
-            self.found_stations = self.stations_websirenes._getvalue()
-            self.found_stations_inmet = self.stations_inmet._getvalue()
-            self.found_stations_alertario = self.stations_alertario._getvalue()
-            self.stations_cells = self.stations_cells._getvalue()
-            self.manager.shutdown()
+                    for timestamp in blocks[future]:
+                        self.build_manifest.record(timestamp, fingerprints[timestamp])
+                    self.build_manifest.save()
+
+                    self.stations_cells.update(block_result.stations_cells)
+                    self.stations_websirenes.update(block_result.stations_websirenes)
+                    self.stations_inmet.update(block_result.stations_inmet)
+                    self.stations_alertario.update(block_result.stations_alertario)
+
+            self.found_stations = self.stations_websirenes
+            self.found_stations_inmet = self.stations_inmet
+            self.found_stations_alertario = self.stations_alertario
+
+        if self.features_store is not None and not all_cached:
+            self.features_store.compress()
 
         end_time = time.time()
         log.info(f"Target built in {end_time - start_time:.2f} seconds - parallel")
 
-        # start_time = time.time()
-        # os.environ["IS_SEQUENTIAL"] = "True"
-        # for i in tqdm(
-        #     range(len(timestamps)),
-        #     desc="Processing timestamps",
-        #     file=TqdmLogger(log),
-        #     dynamic_ncols=True,
-        #     mininterval=ONE_MINUTE,
-        # ):
-        #     if self.features_path.joinpath(
-        #         f"{timestamps[i].strftime('%Y_%m_%d_%H')}_features.npy"
-        #     ).exists():
-        #         continue
-
-        #     if timestamps[i].month in ignored_months:
-        #         continue
-
-        #     self._process_timestamp(timestamps[i])
-        # self.found_stations = self.stations_websirenes._getvalue()
-        # self.found_stations_inmet = self.stations_inmet._getvalue()
-        # self.found_stations_alertario = self.stations_alertario._getvalue()
-        # self.stations_cells = self.stations_cells._getvalue()
-        # self.manager.shutdown()
-        # end_time = time.time()
-        # log.info(f"Target built in {end_time - start_time:.2f} seconds - sequential")
-
         validated_total_timestamps = self.validate_timestamps(
             minimum_date, maximum_date, ignored_months
         )
@@ -576,20 +805,13 @@ class SpatioTemporalFeatures:
                 continue
 
             total_timestamps += 1
-            year = timestamp.year
-            month = timestamp.month
-            day = timestamp.day
-            hour = timestamp.hour
-            file = (
-                self.features_path
-                / f"{year:04}_{month:02}_{day:02}_{hour:02}_features.npy"
-            )
+            file = self._get_features_filename(timestamp)
 
-            if not Path(file).exists():
+            if not self.has_features(timestamp):
                 not_found.append(timestamp)
                 continue
 
-            features = np.load(file)
+            features = self.load_features(timestamp)
             assert features.shape[0] == len(
                 self.sorted_latitudes_ascending
             ), f"shape[0] should be {len(self.sorted_latitudes_ascending)} but is {features.shape[0]}"
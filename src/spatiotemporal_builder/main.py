@@ -3,6 +3,7 @@ from typing import Optional
 
 import pandas as pd
 
+from ..utils import instrumentation
 from .AlertarioCoords import get_alertario_coords
 from .AlertarioKeys import AlertarioKeys
 from .AlertarioParser import AlertarioParser
@@ -126,24 +127,31 @@ def build_features(
     start_date: pd.Timestamp, end_date: pd.Timestamp, ignored_months: list[int]
 ):
     try:
-        (
-            websirenes_keys,
-            inmet_keys,
-            alertario_keys,
-            spatio_temporal_features,
-            dataset_builder,
-        ) = get_instances()
-
-        if not settings.only_ERA5:
-            websirenes_keys.build_keys()
-            inmet_keys.build_keys()
-            alertario_keys.build_keys()
-
-        spatio_temporal_features.build_timestamps_hourly(
-            start_date, end_date, ignored_months
-        )
-
-        dataset_builder.build_netcdf(start_date, end_date, ignored_months)
+        with instrumentation.run("spatiotemporal_builder", settings=vars(settings)):
+            with instrumentation.stage("get_instances"):
+                (
+                    websirenes_keys,
+                    inmet_keys,
+                    alertario_keys,
+                    spatio_temporal_features,
+                    dataset_builder,
+                ) = get_instances()
+
+            if not settings.only_ERA5:
+                with instrumentation.stage("build_keys"):
+                    websirenes_keys.build_keys()
+                    inmet_keys.build_keys()
+                    alertario_keys.build_keys()
+
+            with instrumentation.stage("build_timestamps_hourly"):
+                spatio_temporal_features.build_timestamps_hourly(
+                    start_date, end_date, ignored_months
+                )
+
+            with instrumentation.stage("build_netcdf", files=1):
+                dataset_builder.build_netcdf(
+                    start_date, end_date, ignored_months, layout=settings.dataset_layout
+                )
     except Exception as e:
         log.error(f"Error while building features: {e}")
 
@@ -184,6 +192,34 @@ if __name__ == "__main__":
         action="store_true",
         help="Build features only using ERA5 data",
     )
+    parser.add_argument(
+        "--grid-mode",
+        type=str,
+        choices=["vectorized", "cell"],
+        default="vectorized",
+        help="Extract the ERA5 features of the whole grid at once (vectorized) or square by square (cell)",
+    )
+    parser.add_argument(
+        "--features-store",
+        type=str,
+        choices=["npy", "chunked"],
+        default="npy",
+        help="Write the hourly features as one .npy file per hour (npy) or as month chunks of a single float32 array (chunked)",
+    )
+    parser.add_argument(
+        "--dataset-layout",
+        type=str,
+        choices=["samples", "time_axis"],
+        default="samples",
+        help="Write x and y of every sample (samples) or each hour once with the windows as indexes (time_axis)",
+    )
+    parser.add_argument(
+        "--scheduling",
+        type=str,
+        choices=["month", "hour"],
+        default="month",
+        help="Give each worker a whole month, keeping its ERA5 files open (month), or a single hour (hour)",
+    )
 
     # check_data_requirements()
 
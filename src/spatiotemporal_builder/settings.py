@@ -14,6 +14,10 @@ class Settings:
         self.start_date: pd.Timestamp = pd.Timestamp.min
         self.end_date: pd.Timestamp = pd.Timestamp.max
         self.ignored_months = []
+        self.grid_mode = "vectorized"
+        self.features_store = "npy"
+        self.dataset_layout = "samples"
+        self.scheduling = "month"
 
     def set_settings(self, args: Namespace):
         for key, value in vars(args).items():
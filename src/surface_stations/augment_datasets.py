@@ -3,7 +3,6 @@ This script merges the train/val/test datasets from two or more user-specified w
 """
 
 import argparse
-import pickle
 import sys
 
 import numpy as np
@@ -14,7 +13,9 @@ from globals import (
     INMET_WEATHER_STATION_IDS,
 )
 
+import train.pipeline as pipeline
 from src.utils.util import haversine_distance
+from utils import dataset_artifacts
 from utils.rainfall import OrdinalPrecipitationLevel, get_events_per_level
 
 # def get_pos_class_ratio(y):
@@ -85,21 +86,19 @@ def main(argv):
         sys.exit(2)
 
     #
-    # Load numpy arrays (stored in a pickle file) for the WSoI (weather station of interest).
-    filename = DATASETS_DIR + soi_pipeline_id + ".pickle"
-    print(f"Loading train/val/test datasets from {filename} for WSoI.")
-    file = open(filename, "rb")
+    # Load numpy arrays for the WSoI (weather station of interest).
+    print(f"Loading train/val/test datasets of pipeline {soi_pipeline_id} for WSoI.")
     (wsoi_X_train, wsoi_y_train, wsoi_X_val, wsoi_y_val, wsoi_X_test, wsoi_y_test) = (
-        pickle.load(file)
+        pipeline.load_datasets(soi_pipeline_id)
     )
     print(
         f"Number of examples (train/val/test): {len(wsoi_X_train)}/{len(wsoi_X_val)}/{len(wsoi_X_test)}."
     )
     print(
-        f"Min values of train/val/test data matrices: {min(wsoi_X_train.reshape(-1, 1))}/{min(wsoi_X_val.reshape(-1, 1))}/{min(wsoi_X_test.reshape(-1, 1))}"
+        f"Min values of train/val/test data matrices: {wsoi_X_train.min()}/{wsoi_X_val.min()}/{wsoi_X_test.min()}"
     )
     print(
-        f"Max values in the train/val/test data matrices: {max(wsoi_X_train.reshape(-1, 1))}/{max(wsoi_X_val.reshape(-1, 1))}/{max(wsoi_X_test.reshape(-1, 1))}"
+        f"Max values in the train/val/test data matrices: {wsoi_X_train.max()}/{wsoi_X_val.max()}/{wsoi_X_test.max()}"
     )
     print_events_by_level(str(wsoi_id) + "/train", wsoi_y_train)
     print_events_by_level(str(wsoi_id) + "/val", wsoi_y_val)
@@ -136,18 +135,13 @@ def main(argv):
         print(f"dist({wsoi_id}, {ws_id}) = {dist:.2f} Km.")
 
         pipeline_id = soi_pipeline_id.replace(wsoi_id, ws_id)
-        filename = DATASETS_DIR + pipeline_id + ".pickle"
-        print(f"Loading train/val/test datasets from {filename}.")
-        file = open(filename, "rb")
-
-        (X_train, y_train, X_val, y_val, _, y_test) = pickle.load(file)
-        print(f"Number of examples (train/val): {len(X_train)}/{len(X_val)}.")
-        print(
-            f"Min values of train/val data matrices: {min(X_train.reshape(-1, 1))}/{min(X_val.reshape(-1, 1))})"
-        )
-        print(
-            f"Max values of train/val data matrices: {max(X_train.reshape(-1, 1))}/{max(X_val.reshape(-1, 1))}"
+        print(f"Loading train/val/test datasets of pipeline {pipeline_id}.")
+        (X_train, y_train, X_val, y_val, _, y_test) = pipeline.load_datasets(
+            pipeline_id
         )
+        print(f"Number of examples (train/val): {len(X_train)}/{len(X_val)}.")
+        print(f"Min values of train/val data matrices: {X_train.min()}/{X_val.min()})")
+        print(f"Max values of train/val data matrices: {X_train.max()}/{X_val.max()}")
         print_events_by_level(str(ws_id) + "/train", y_train)
         print_events_by_level(str(ws_id) + "/val", y_val)
         print_events_by_level(str(ws_id) + "/test", y_test)
@@ -175,7 +169,7 @@ def main(argv):
         print()
 
     #
-    # Write resulting merged numpy arrays for train/val/test datasets to a single pickle file
+    # Write resulting merged numpy arrays for train/val/test datasets as a dataset artifact
     print(
         f"Number of examples in the merged datasets (train/val/test): {len(augmented_X_train)}/{len(augmented_X_val)}/{len(wsoi_X_test)}."
     )
@@ -184,20 +178,28 @@ def main(argv):
     print_events_by_level("aug/test", wsoi_y_test)
 
     merge_list = "_".join(identifiers)
-    filename = DATASETS_DIR + soi_pipeline_id + "_" + merge_list + ".pickle"
+    merged_pipeline_id = soi_pipeline_id + "_" + merge_list
     print(
-        f"Dumping merged train/val/test np arrays to pickle file {filename}.", end=" "
+        f"Saving merged train/val/test np arrays to dataset artifact {dataset_artifacts.get_artifact_dir(DATASETS_DIR, merged_pipeline_id)}.",
+        end=" ",
+    )
+    soi_metadata = (
+        dataset_artifacts.load_metadata(DATASETS_DIR, soi_pipeline_id)
+        if dataset_artifacts.artifact_exists(DATASETS_DIR, soi_pipeline_id)
+        else {}
     )
-    file = open(filename, "wb")
-    ndarrays = (
+    dataset_artifacts.save_datasets(
+        DATASETS_DIR,
+        merged_pipeline_id,
         augmented_X_train,
         augmented_y_train,
         augmented_X_val,
         augmented_y_val,
         wsoi_X_test,
         wsoi_y_test,
+        feature_names=soi_metadata.get("feature_names"),
+        window_size=soi_metadata.get("window_size"),
     )
-    pickle.dump(ndarrays, file)
     print("Done!")
 
 
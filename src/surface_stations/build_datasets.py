@@ -1,26 +1,24 @@
 import argparse
 import datetime
 import logging
-import pickle
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import List
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import yaml
-from era5_data_source import Era5ReanalisysDataSource
+from era5_data_source import Era5ReanalisysDataSource, get_station_coordinates
 from statsmodels.stats.diagnostic import acorr_ljungbox
 
+import src.surface_stations.fusion_sources as fusion
 import src.utils.util as util
 from config import globals
 from src.surface_stations.subsampling import apply_subsampling
-from src.utils.util import (
-    add_missing_indicator_column,
-    find_contiguous_observation_blocks,
-    split_dataframe_by_date,
-)
-from utils.windowing import apply_windowing
+from src.utils.util import split_dataframe_by_date
+from utils import dataset_artifacts, instrumentation
+from utils.windowing import apply_sliding_window
 
 # def format_for_binary_classification(y_train, y_val, y_test):
 #     y_train_oc = map_to_binary_precipitation_levels(y_train)
@@ -35,56 +33,14 @@ from utils.windowing import apply_windowing
 #     return y_train_oc, y_val_oc, y_test_oc
 
 
-def apply_sliding_window(df: pd.DataFrame, target_idx: int, window_size: int):
-    """
-    This function applies the sliding window preprocessing technique to generate data and response
-    matrices (that is, X and y) from an input time series represented as a pandas DataFrame. This
-    DataFrame is supposed to have a datetime index that corresponds to the timestamps in the time series.
-
-    @see: https://stackoverflow.com/questions/8269916/what-is-sliding-window-algorithm-examples
-
-    Note that this function takes the eventual existence of gaps in the input time series
-    into account. In particular, the windowing operation is performed in each separate
-    contiguous block of observations.
-    """
-    contiguous_observation_blocks = list(find_contiguous_observation_blocks(df))
-
-    is_first_block = True
-
-    for block in contiguous_observation_blocks:
-        start = block[0]
-        end = block[1]
-
-        # logging.info(df[start:end].shape)
-        if df[start:end].shape[0] < window_size + 1:
-            continue
-
-        arr = np.array(df[start:end])
-        X_block, y_block = apply_windowing(
-            arr,
-            initial_time_step=0,
-            max_time_step=len(arr) - window_size - 1,
-            window_size=window_size,
-            target_idx=target_idx,
-        )
-        y_block = y_block.reshape(-1, 1)
-        if is_first_block:
-            X = X_block
-            y = y_block
-            is_first_block = False
-        else:
-            X = np.concatenate((X, X_block), axis=0)
-            y = np.concatenate((y, y_block), axis=0)
-
-    return X, y
-
-
-def generate_windowed_split(train_df, val_df, test_df, target_name, window_size):
+def generate_windowed_split(
+    train_df, val_df, test_df, target_name, window_size, lazy=False
+):
     target_idx = train_df.columns.get_loc(target_name)
     logging.info(f"Position (index) of target variable {target_name}: {target_idx}")
-    X_train, y_train = apply_sliding_window(train_df, target_idx, window_size)
-    X_val, y_val = apply_sliding_window(val_df, target_idx, window_size)
-    X_test, y_test = apply_sliding_window(test_df, target_idx, window_size)
+    X_train, y_train = apply_sliding_window(train_df, target_idx, window_size, lazy)
+    X_val, y_val = apply_sliding_window(val_df, target_idx, window_size, lazy)
+    X_test, y_test = apply_sliding_window(test_df, target_idx, window_size, lazy)
     return X_train, y_train, X_val, y_val, X_test, y_test
 
 
@@ -129,9 +85,103 @@ def gaussian_noise(df, column_name, mu=0, sigma=1):
     return df
 
 
+# Fusion sources in the order their suffixes are added to the pipeline id
+PIPELINE_ID_SOURCES = ["ERA5", "R", "L", "DSI", "TPW", "I", "C", "A"]
+
+
+def get_pipeline_id(station_id: str, fusion_sources: List[str]) -> str:
+    pipeline_id = station_id
+    if fusion_sources is not None:
+        for source in PIPELINE_ID_SOURCES:
+            if source in fusion_sources:
+                pipeline_id = pipeline_id + "_" + source
+    return pipeline_id
+
+
+def load_window_size() -> int:
+    with open("./config/config.yaml", "r") as file:
+        config = yaml.safe_load(file)
+    return config["preproc"]["SLIDING_WINDOW_SIZE"]
+
+
+def get_glm_path(station_id: str) -> str:
+    return f"data/parquet_files/glm_{station_id}_preprocessed_file.parquet"
+
+
+def load_glm(station_id: str) -> pd.DataFrame:
+    df_lightning = pd.read_parquet(get_glm_path(station_id))
+    df_lightning_filtered = get_goes16_data_for_weather_station(df_lightning)
+    print(df_lightning_filtered.isnull().sum())
+    return df_lightning_filtered.bfill()
+
+
+def load_fusion_sources(station_ids_by_source: dict) -> dict:
+    """
+    Loads the fusion sources of the stations that use them, {source: [station_id, ...]}, so
+    that each one is read once when building the datasets of many stations. The result maps
+    the identifier of each source to its data:
+
+        "ERA5": an Era5ReanalisysDataSource with the series of the stations in memory
+        "R": the atmospheric sounding indices
+        "TPW", "L": {station_id: DataFrame}
+        "DSI": {variable_name: DataFrame}, with the columns of the cells of the stations
+
+    The image features ("I", "C" and "A") are per-station files read by each build.
+    """
+    sources = dict()
+    if "ERA5" in station_ids_by_source:
+        station_ids = station_ids_by_source["ERA5"]
+        logging.info(
+            f"Loading reanalisys (ERA5) data of {len(station_ids)} stations..."
+        )
+        data_source = Era5ReanalisysDataSource()
+        data_source.warm_cache(station_ids)
+        sources["ERA5"] = data_source
+    if "R" in station_ids_by_source:
+        sources["R"] = fusion.read_sounding_indices()
+    if "TPW" in station_ids_by_source:
+        sources["TPW"] = {
+            station_id: fusion.read_tpw(station_id)
+            for station_id in station_ids_by_source["TPW"]
+        }
+    if "DSI" in station_ids_by_source:
+        sources["DSI"] = fusion.read_dsi_variables(station_ids_by_source["DSI"])
+    if "L" in station_ids_by_source:
+        sources["L"] = {
+            station_id: load_glm(station_id)
+            for station_id in station_ids_by_source["L"]
+        }
+    return sources
+
+
+def _append_columns(joined_df: pd.DataFrame, aligned: pd.DataFrame) -> pd.DataFrame:
+    """
+    Appends the columns of a source aligned to the rows of joined_df, or to a subset of them
+    """
+    if not aligned.index.equals(joined_df.index):
+        joined_df = joined_df.loc[aligned.index]
+    return pd.concat([joined_df, aligned.set_axis(joined_df.index)], axis=1)
+
+
 def add_features_from_user_specified_data_sources(
-    station_id, fusion_sources: List[str], df_wsoi, min_datetime, max_datetime
+    station_id,
+    fusion_sources: List[str],
+    df_wsoi,
+    min_datetime,
+    max_datetime,
+    sources: dict = None,
 ):
+    """
+    Joins the features of the fusion sources to the observations of the station.
+
+    Each source is aligned to the timestamps of the rows joined so far (see fusion_sources)
+    and kept in globals.FUSION_SOURCES_DIR, so the next builds of the station with the same
+    time axis only read the aligned columns. A source that has to be aligned is taken from
+    sources, when it was loaded by load_fusion_sources, or read with only the columns and the
+    time range of the station.
+    """
+    sources = sources or dict()
+    store = fusion.AlignedSourceStore(globals.FUSION_SOURCES_DIR)
     join_radiosonde_features = "R" in fusion_sources
     join_reanalisys_features = "ERA5" in fusion_sources
     join_goes16_glm_features = "L" in fusion_sources
@@ -150,26 +200,32 @@ def add_features_from_user_specified_data_sources(
         logging.info(
             f"Loading reanalisys (ERA5) data near the weather station {station_id}..."
         )
-        data_source = Era5ReanalisysDataSource()
-        df_era5_reanalisys = data_source.get_data(
-            station_id, min_datetime, max_datetime
-        )
-        logging.info(f"Done! Shape = {df_era5_reanalisys.shape}.")
-        assert not df_era5_reanalisys.isnull().values.any().any()
+        if "ERA5" in sources:
+            data_source = sources["ERA5"]
+        else:
+            data_source = Era5ReanalisysDataSource()
+
+        def align_era5():
+            df_era5_reanalisys = data_source.get_data(
+                station_id, min_datetime, max_datetime
+            )
+            logging.info(f"Done! Shape = {df_era5_reanalisys.shape}.")
+            assert not df_era5_reanalisys.isnull().values.any().any()
+            return fusion.align_era5(df_era5_reanalisys, joined_df.index)
 
-        joined_df = pd.merge(
-            joined_df, df_era5_reanalisys, how="left", left_index=True, right_index=True
+        df_era5_aligned = store.get(
+            station_id,
+            "ERA5",
+            joined_df.index,
+            [data_source.series_cache.era5_path],
+            align_era5,
+            params={"coordinates": get_station_coordinates(station_id)},
         )
+        joined_df = _append_columns(joined_df, df_era5_aligned)
 
         logging.info(
             f"Reanalisys data successfully joined; resulting shape: {joined_df.shape}."
         )
-        logging.info(df_wsoi.index.difference(joined_df.index).shape)
-        logging.info(df_wsoi.index.difference(df_era5_reanalisys.index).shape)
-        logging.info(df_wsoi.index.difference(df_era5_reanalisys.index))
-        logging.info(joined_df.index.difference(df_wsoi.index).shape)
-        logging.info(df_era5_reanalisys.index.intersection(df_wsoi.index).shape)
-        logging.info(df_era5_reanalisys.index.difference(df_wsoi.index).shape)
 
         shape_before_dropna = joined_df.shape
         joined_df = joined_df.dropna()
@@ -184,54 +240,33 @@ def add_features_from_user_specified_data_sources(
     # SBGL features
     ############################################################################################
     if join_radiosonde_features:
-        filename = globals.AS_DATA_DIR + "SBGL_indices_1997_2023.parquet.gzip"
-        logging.info(f"Loading atmospheric sounding indices from {filename}...")
-        df_as = pd.read_parquet(filename)
-        logging.info(f"Done! Shape = {df_as.shape}.")
-
-        format_string = "%Y-%m-%d %H:%M:%S"
 
-        #
-        # Add index to dataframe using the observation's timestamps.
-        df_as["Datetime"] = pd.to_datetime(df_as["time"], format=format_string)
-        df_as = df_as.set_index(pd.DatetimeIndex(df_as["Datetime"]))
-        logging.info(
-            f"Range of timestamps in the atmospheric sounding data source: [{min(df_as.index)}, {max(df_as.index)}]"
-        )
-
-        #
-        # Remove time-related columns since now this information is in the index.
-        df_as = df_as.drop(["time", "Datetime"], axis=1)
+        def align_sounding_indices():
+            if "R" in sources:
+                df_as = sources["R"]
+            else:
+                df_as = fusion.read_sounding_indices(min_datetime, max_datetime)
+            logging.info(
+                "Doing interpolation to imput missing values on the sounding indices..."
+            )
+            return fusion.align_sounding_indices(df_as, joined_df.index)
 
-        joined_df = pd.merge(
-            joined_df, df_as, how="left", left_index=True, right_index=True
+        # At the beggining of the joined dataframe, a few entries may remain with NaN values
+        # after the interpolation, these are filled backwards.
+        # see https://stackoverflow.com/questions/27905295/how-to-replace-nans-by-preceding-or-next-values-in-pandas-dataframe
+        df_as_aligned = store.get(
+            station_id,
+            "R",
+            joined_df.index,
+            [fusion.get_sounding_indices_path()],
+            align_sounding_indices,
         )
+        joined_df = _append_columns(joined_df, df_as_aligned)
 
         logging.info(
             f"Atmospheric sounding data successfully joined; resulting shape: {joined_df.shape}."
         )
 
-        joined_df = add_missing_indicator_column(joined_df, "asi_idx_missing")
-        logging.info(f"Shape after adding missing indicator column: {joined_df.shape}.")
-
-        logging.info(
-            "Doing interpolation to imput missing values on the sounding indices..."
-        )
-        joined_df["cape"] = joined_df["cape"].interpolate(method="linear")
-        joined_df["cin"] = joined_df["cin"].interpolate(method="linear")
-        joined_df["lift"] = joined_df["lift"].interpolate(method="linear")
-        joined_df["k"] = joined_df["k"].interpolate(method="linear")
-        joined_df["total_totals"] = joined_df["total_totals"].interpolate(
-            method="linear"
-        )
-        joined_df["showalter"] = joined_df["showalter"].interpolate(method="linear")
-        logging.info("Done!")
-
-        # At the beggining of the joined dataframe, a few entries may remain with NaN values.
-        # The code below gets rid of these entries.
-        # see https://stackoverflow.com/questions/27905295/how-to-replace-nans-by-preceding-or-next-values-in-pandas-dataframe
-        joined_df.fillna(method="bfill", inplace=True)
-
         # TODO: data normalization
         # TODO: implement interpolation
         # TODO: deal with missing values (see https://youtu.be/DKmDJJzayZw)
@@ -242,35 +277,31 @@ def add_features_from_user_specified_data_sources(
     # TPW features
     ############################################################################################
     if join_goes16_tpw_features:
-        logging.info(f"Loading GOES16 TPW data for WSoI {station_id}...")
-        df_tpw = pd.read_parquet(f"{globals.TPW_DATA_DIR}/{station_id}.parquet")
-        logging.info(f"Done! Shape = {df_tpw.shape}.")
 
-        logging.info(
-            f"Range of timestamps in the TPW data: [{min(df_tpw.index)}, {max(df_tpw.index)}]"
-        )
+        def align_tpw():
+            if "TPW" in sources:
+                df_tpw = sources["TPW"][station_id]
+            else:
+                df_tpw = fusion.read_tpw(station_id, min_datetime, max_datetime)
+            logging.info(
+                f"Range of timestamps in the TPW data: [{min(df_tpw.index)}, {max(df_tpw.index)}]"
+            )
+            return fusion.align_tpw(df_tpw, joined_df.index)
 
-        joined_df = joined_df.join(df_tpw, how="inner")
+        # Only the timestamps with TPW data are kept.
+        df_tpw_aligned = store.get(
+            station_id,
+            "TPW",
+            joined_df.index,
+            [fusion.get_tpw_path(station_id)],
+            align_tpw,
+        )
+        joined_df = _append_columns(joined_df, df_tpw_aligned)
 
         logging.info(
             f"TPW data successfully joined; resulting shape: {joined_df.shape}."
         )
 
-        # print(joined_df.columns)
-
-        logging.info("Adding missing indicator column...")
-        joined_df = add_missing_indicator_column(joined_df, "tpw_idx_missing")
-        logging.info(f"Done! New shape: {joined_df.shape}.")
-
-        logging.info("Doing interpolation to imput missing values on the TPW values...")
-        joined_df["tpw_value"] = joined_df["tpw_value"].interpolate(method="linear")
-        logging.info("Done!")
-
-        # At the beggining of the joined dataframe, a few entries may remain with NaN values.
-        # The code below gets rid of these entries.
-        # see https://stackoverflow.com/questions/27905295/how-to-replace-nans-by-preceding-or-next-values-in-pandas-dataframe
-        joined_df.fillna(method="bfill", inplace=True)
-
         shape_before_dropna = joined_df.shape
         joined_df = joined_df.dropna()
         shape_after_dropna = joined_df.shape
@@ -280,66 +311,36 @@ def add_features_from_user_specified_data_sources(
     # DSI features
     ############################################################################################
     if join_goes16_dsi_features:
-        # Remember: (y, x)
-        wsoi2cell_dict = dict()
-        wsoi2cell_dict["A627"] = (1, 6)
-        wsoi2cell_dict["A652"] = (2, 5)
-        wsoi2cell_dict["A636"] = (2, 4)
-        wsoi2cell_dict["A621"] = (1, 3)
-        wsoi2cell_dict["A602"] = (3, 2)
-        wsoi2cell_dict["A601"] = (0, 1)
-
-        associated_cell = wsoi2cell_dict[station_id]
-
         logging.info(f"Loading GOES16 DSI data for WSoI {station_id}...")
-        dsi_variable_names = ["CAPE", "LI", "TT", "SI", "KI"]
-        features_dict = dict()
-        for variable_name in dsi_variable_names:
-            logging.info(f"Adding feature - {variable_name}...")
-            df_dsi = pd.read_parquet(
-                f"{globals.DSI_DATA_DIR}/DSI_{variable_name}_1H.parquet"
-            )
-            logging.info(f"Done! Shape = {df_dsi.shape}.")
-
-            logging.info(
-                f"Range of timestamps in the DSI data: [{min(df_dsi.index)}, {max(df_dsi.index)}]"
-            )
-
-            column_name = f"{variable_name}{associated_cell[0]}{associated_cell[1]}"
-
-            features_dict[variable_name] = df_dsi[column_name]
 
-        # Transform the dictionary into a DataFrame
-        df_dsi_features = pd.DataFrame(features_dict)
-        logging.info(
-            f"Dataframe of features create with shape {df_dsi_features.shape}."
-        )
-
-        df_dsi_features.to_parquet("dsi_features.parquet")
-        # assert (not df_dsi_features.isnull().values.any().any())
+        def align_dsi():
+            if "DSI" in sources:
+                dsi_frames = sources["DSI"]
+            else:
+                dsi_frames = fusion.read_dsi_variables(
+                    [station_id], min_datetime, max_datetime
+                )
+            return fusion.align_dsi(dsi_frames, station_id, joined_df.index)
 
-        # joined_df = joined_df.join(df_dsi_features, how='inner')
-        joined_df = joined_df.merge(
-            df_dsi_features, how="left", left_index=True, right_index=True
+        df_dsi_features = store.get(
+            station_id,
+            "DSI",
+            joined_df.index,
+            [
+                fusion.get_dsi_path(variable_name)
+                for variable_name in fusion.DSI_VARIABLE_NAMES
+            ],
+            align_dsi,
+            params={"cell": fusion.WSOI_TO_DSI_CELL[station_id]},
         )
+        joined_df = _append_columns(joined_df, df_dsi_features)
 
         logging.info(
             f"DSI features successfully joined; resulting shape: {joined_df.shape}."
         )
         logging.info(
-            f"|wsoi - dsi_features|: {df_wsoi.index.difference(df_dsi_features.index).shape}"
-        )
-        logging.info(
-            f"|dsi_features - wsoi|: {df_dsi_features.index.difference(df_wsoi.index).shape}"
+            f"Timestamps without DSI features: {df_dsi_features.isnull().any(axis=1).sum()}"
         )
-        logging.info(df_wsoi.index.difference(joined_df.index).shape)
-        logging.info(joined_df.index.difference(df_wsoi.index).shape)
-        logging.info(df_dsi_features.index.intersection(df_wsoi.index).shape)
-        logging.info("")
-        logging.info(
-            f"wsoi - dsi_features:\n {df_wsoi.index.difference(df_dsi_features.index)}"
-        )
-        # assert(False)
 
     assert not joined_df.isnull().values.any().any()
 
@@ -348,22 +349,23 @@ def add_features_from_user_specified_data_sources(
             f"Loading GLM (Goes 16) data near the weather station {station_id}...",
             end="",
         )
-        df_lightning = pd.read_parquet(
-            f"data/parquet_files/glm_{station_id}_preprocessed_file.parquet"
-        )
-        df_lightning_filtered = get_goes16_data_for_weather_station(df_lightning)
-        print(df_lightning_filtered.isnull().sum())
-        df_lightning_filtered.fillna(method="bfill", inplace=True)
-        assert not df_lightning_filtered.isnull().values.any().any()
-        joined_df = pd.merge(
-            df_wsoi,
-            df_lightning_filtered,
-            how="left",
-            left_index=True,
-            right_index=True,
-        )
 
-        joined_df["event_energy"].fillna(method="bfill", inplace=True)
+        def align_glm():
+            if "L" in sources:
+                df_lightning_filtered = sources["L"][station_id]
+            else:
+                df_lightning_filtered = load_glm(station_id)
+            assert not df_lightning_filtered.isnull().values.any().any()
+            return fusion.align_glm(df_lightning_filtered, df_wsoi.index)
+
+        df_lightning_aligned = store.get(
+            station_id,
+            "L",
+            df_wsoi.index,
+            [get_glm_path(station_id)],
+            align_glm,
+        )
+        joined_df = _append_columns(df_wsoi, df_lightning_aligned)
 
         # Ruido branco
         lb_test_stat = acorr_ljungbox(joined_df["event_energy"], lags=10)
@@ -375,13 +377,6 @@ def add_features_from_user_specified_data_sources(
         plt.show()
 
         print(f"GLM data successfully joined; resulting shape = {joined_df.shape}.")
-        print(df_wsoi.index.difference(joined_df.index).shape)
-        print(joined_df.index.difference(df_wsoi.index).shape)
-
-        print(df_lightning_filtered.index.intersection(df_wsoi.index).shape)
-        print(df_lightning_filtered.index.difference(df_wsoi.index).shape)
-        print(df_wsoi.index.difference(df_lightning_filtered.index).shape)
-        print(df_wsoi.index.difference(df_lightning_filtered.index))
 
         shape_before_dropna = joined_df.shape
         joined_df = joined_df.dropna()
@@ -393,84 +388,25 @@ def add_features_from_user_specified_data_sources(
     assert not joined_df.isnull().values.any().any()
 
     if join_colorcord_features:
-        filename = f"FEATURE_{station_id}_COLORCORD.csv"
-        logging.info(f"Loading image features {filename}...")
-        df_new = pd.read_csv(filename)
-        logging.info(f"Done! Shape = {df_new.shape}.")
-        df_new["date"] = pd.to_datetime(df_new["date"], format="%Y-%m-%d--%H%M%S")
-        df_new["date"] = df_new["date"].dt.floor("H")
-        del df_new["Estação"]
-        df_new = df_new.groupby("date", as_index=False).mean()
-
-        format_string = "%Y-%m-%d %H:%M:%S"
-
-        df_new["Datetime"] = pd.to_datetime(df_new["date"], format=format_string)
-        df_new = df_new.set_index(pd.DatetimeIndex(df_new["Datetime"]))
-        logging.info(
-            f"Range of timestamps in the image feature data source: [{min(df_new.index)}, {max(df_new.index)}]"
-        )
-
-        df_new = df_new.drop(["date", "Datetime", "Estação"], axis=1)
-        joined_df = pd.merge(
-            joined_df, df_new, how="left", left_index=True, right_index=True
-        )
-        joined_df = joined_df.fillna(0)
-
-        logging.info(
-            f"Image features data successfully joined; resulting shape: {joined_df.shape}."
-        )
-
+        image_source = "I"
     elif join_conv2d_features:
-        filename = f"FEATURE_{station_id}_CONV2D.csv"
-        logging.info(f"Loading image features {filename}...")
-        df_new = pd.read_csv(filename)
-        logging.info(f"Done! Shape = {df_new.shape}.")
-        df_new["date"] = pd.to_datetime(df_new["date"], format="%Y-%m-%d--%H%M%S")
-        df_new["date"] = df_new["date"].dt.floor("H")
-        del df_new["Estação"]
-        df_new = df_new.groupby("date", as_index=False).mean()
-
-        format_string = "%Y-%m-%d %H:%M:%S"
-
-        df_new["Datetime"] = pd.to_datetime(df_new["date"], format=format_string)
-        df_new = df_new.set_index(pd.DatetimeIndex(df_new["Datetime"]))
-        logging.info(
-            f"Range of timestamps in the image feature data source: [{min(df_new.index)}, {max(df_new.index)}]"
-        )
-
-        df_new = df_new.drop(["date", "Datetime"], axis=1)
-        joined_df = pd.merge(
-            joined_df, df_new, how="left", left_index=True, right_index=True
-        )
-        joined_df = joined_df.fillna(0)
-
-        logging.info(
-            f"Image features data successfully joined; resulting shape: {joined_df.shape}."
-        )
-
+        image_source = "C"
     elif join_autoencoder_features:
-        filename = f"FEATURE_{station_id}_AUTOENCODER.csv"
-        logging.info(f"Loading image features {filename}...")
-        df_new = pd.read_csv(filename)
-        logging.info(f"Done! Shape = {df_new.shape}.")
-        df_new["date"] = pd.to_datetime(df_new["date"], format="%Y-%m-%d--%H%M%S")
-        df_new["date"] = df_new["date"].dt.ceil("H")
-        del df_new["Estação"]
-        df_new = df_new.groupby("date", as_index=False).mean()
-
-        format_string = "%Y-%m-%d %H:%M:%S"
-
-        df_new["Datetime"] = pd.to_datetime(df_new["date"], format=format_string)
-        df_new = df_new.set_index(pd.DatetimeIndex(df_new["Datetime"]))
-        logging.info(
-            f"Range of timestamps in the image feature data source: [{min(df_new.index)}, {max(df_new.index)}]"
-        )
+        image_source = "A"
+    else:
+        image_source = None
 
-        df_new = df_new.drop(["date", "Datetime"], axis=1)
-        joined_df = pd.merge(
-            joined_df, df_new, how="left", left_index=True, right_index=True
+    if image_source is not None:
+        df_new_aligned = store.get(
+            station_id,
+            image_source,
+            joined_df.index,
+            [fusion.get_image_features_path(station_id, image_source)],
+            lambda: fusion.align_image_features(
+                fusion.read_image_features(station_id, image_source), joined_df.index
+            ),
         )
-        joined_df = joined_df.fillna(0)
+        joined_df = _append_columns(joined_df, df_new_aligned)
 
         logging.info(
             f"Image features data successfully joined; resulting shape: {joined_df.shape}."
@@ -496,6 +432,8 @@ def build_datasets(
     #    join_conv2d_datasource: bool,
     #    join_autoencoder_datasource: bool,
     subsampling_procedure: str,
+    window_size: int = None,
+    sources: dict = None,
 ):
     """
     This function builds the train, validation and test datasets. These resulting datasets will used to fit the parameters
@@ -506,26 +444,12 @@ def build_datasets(
     This function can *optionally* use a set of extra data sources to build the datasets. Each data source contributes
     with a group of additional features. Notice that these extra data sources are not mandatory. Indeed, it can be the
     case that the only features used are the ones extracted from the WSoI.
+
+    window_size defaults to preproc.SLIDING_WINDOW_SIZE of config.yaml, and sources to the
+    fusion sources loaded by load_fusion_sources, if any (see build_datasets_batch).
     """
 
-    pipeline_id = station_id
-    if fusion_sources is not None:
-        if "ERA5" in fusion_sources:
-            pipeline_id = pipeline_id + "_ERA5"
-        if "R" in fusion_sources:
-            pipeline_id = pipeline_id + "_R"
-        if "L" in fusion_sources:
-            pipeline_id = pipeline_id + "_L"
-        if "DSI" in fusion_sources:
-            pipeline_id = pipeline_id + "_DSI"
-        if "TPW" in fusion_sources:
-            pipeline_id = pipeline_id + "_TPW"
-        if "I" in fusion_sources:
-            pipeline_id = pipeline_id + "_I"
-        if "C" in fusion_sources:
-            pipeline_id = pipeline_id + "_C"
-        if "A" in fusion_sources:
-            pipeline_id = pipeline_id + "_A"
+    pipeline_id = get_pipeline_id(station_id, fusion_sources)
     # if join_reanalisys_datasource:
     #     pipeline_id = pipeline_id + '_N'
     # if join_AS_data_source:
@@ -542,7 +466,11 @@ def build_datasets(
     #     pipeline_id = pipeline_id + '_A'
 
     logging.info(f"Loading observations for weather station {station_id}...")
-    df_wsoi = pd.read_parquet(input_folder + station_id + "_preprocessed.parquet.gzip")
+    with instrumentation.stage("load_station", files=1) as stage:
+        df_wsoi = pd.read_parquet(
+            input_folder + station_id + "_preprocessed.parquet.gzip"
+        )
+        stage.add(rows=len(df_wsoi))
     logging.info(f"Done! Shape = {df_wsoi.shape}.\n")
 
     ####
@@ -612,20 +540,23 @@ def build_datasets(
         logging.info(
             "Going to add features from the user-specified data sources (if any)..."
         )
-        joined_df = add_features_from_user_specified_data_sources(
-            station_id,
-            fusion_sources,
-            # join_AS_data_source,
-            # join_reanalisys_datasource,
-            # join_goes16_glm_datasource,
-            # join_goes16_tpw_datasource,
-            # join_colorcord_datasource,
-            # join_conv2d_datasource,
-            # join_autoencoder_datasource,
-            df_wsoi,
-            min_timestamp,
-            max_timestamp,
-        )
+        with instrumentation.stage("join_data_sources") as stage:
+            joined_df = add_features_from_user_specified_data_sources(
+                station_id,
+                fusion_sources,
+                # join_AS_data_source,
+                # join_reanalisys_datasource,
+                # join_goes16_glm_datasource,
+                # join_goes16_tpw_datasource,
+                # join_colorcord_datasource,
+                # join_conv2d_datasource,
+                # join_autoencoder_datasource,
+                df_wsoi,
+                min_timestamp,
+                max_timestamp,
+                sources,
+            )
+            stage.add(rows=len(joined_df))
         min_timestamp = min(joined_df.index)
         max_timestamp = max(joined_df.index)
         logging.info(
@@ -638,7 +569,8 @@ def build_datasets(
     logging.info(
         f"Saving joined dataframe for pipeline {pipeline_id} to file {filename}."
     )
-    joined_df.to_parquet(filename, compression="gzip")
+    with instrumentation.stage("save_joined", rows=len(joined_df), files=1):
+        joined_df.to_parquet(filename, compression="gzip")
     logging.info("Done!\n")
 
     assert not joined_df.isnull().values.any().any()
@@ -682,15 +614,21 @@ def build_datasets(
     logging.info(
         f"Saving each train/val/test dataset for pipeline {pipeline_id} as a parquet file."
     )
-    df_train.to_parquet(
-        globals.DATASETS_DIR + pipeline_id + "_train.parquet.gzip", compression="gzip"
-    )
-    df_val.to_parquet(
-        globals.DATASETS_DIR + pipeline_id + "_val.parquet.gzip", compression="gzip"
-    )
-    df_test.to_parquet(
-        globals.DATASETS_DIR + pipeline_id + "_test.parquet.gzip", compression="gzip"
-    )
+    with instrumentation.stage(
+        "save_splits", rows=len(df_train) + len(df_val) + len(df_test), files=3
+    ):
+        df_train.to_parquet(
+            globals.DATASETS_DIR + pipeline_id + "_train.parquet.gzip",
+            compression="gzip",
+        )
+        df_val.to_parquet(
+            globals.DATASETS_DIR + pipeline_id + "_val.parquet.gzip",
+            compression="gzip",
+        )
+        df_test.to_parquet(
+            globals.DATASETS_DIR + pipeline_id + "_test.parquet.gzip",
+            compression="gzip",
+        )
     logging.info("Done!\n")
 
     assert not df_train.isnull().values.any().any()
@@ -732,13 +670,14 @@ def build_datasets(
 
     #
     # Apply sliding window method to build examples (instances) of train/val/test datasets
-    with open("./config/config.yaml", "r") as file:
-        config = yaml.safe_load(file)
-    window_size = config["preproc"]["SLIDING_WINDOW_SIZE"]
+    if window_size is None:
+        window_size = load_window_size()
     logging.info("Applying sliding window to build train/val/test datasets...")
-    X_train, y_train, X_val, y_val, X_test, y_test = generate_windowed_split(
-        df_train, df_val, df_test, target_name, window_size
-    )
+    with instrumentation.stage("windowing") as stage:
+        X_train, y_train, X_val, y_val, X_test, y_test = generate_windowed_split(
+            df_train, df_val, df_test, target_name, window_size, lazy=True
+        )
+        stage.add(rows=len(X_train) + len(X_val) + len(X_test))
     logging.info("Resulting shapes:")
     logging.info(
         f" - (X_train/X_val/X_test): ({X_train.shape}/{X_val.shape}/{X_test.shape})"
@@ -748,9 +687,9 @@ def build_datasets(
     )
     logging.info("Done!\n")
 
-    assert not np.isnan(np.sum(X_train))
-    assert not np.isnan(np.sum(X_val))
-    assert not np.isnan(np.sum(X_test))
+    assert not np.isnan(X_train.series).any()
+    assert not np.isnan(X_val.series).any()
+    assert not np.isnan(X_test.series).any()
     assert not np.isnan(np.sum(y_train))
     assert not np.isnan(np.sum(y_val))
     assert not np.isnan(np.sum(y_test))
@@ -785,11 +724,20 @@ def build_datasets(
         logging.info(
             f"- Shapes before subsampling (y_train/y_val/y_test): {y_train.shape}, {y_val.shape}, {y_test.shape}"
         )
-        logging.info("Subsampling train data.")
-        X_train, y_train = apply_subsampling(X_train, y_train, subsampling_procedure)
-        logging.info("Subsampling val data...")
+        with instrumentation.stage("subsampling") as stage:
+            logging.info("Subsampling train data.")
+            X_train, y_train = apply_subsampling(
+                X_train,
+                y_train,
+                subsampling_procedure,
+                cache_dir=globals.PILOT_SCORES_DIR,
+            )
+            logging.info("Subsampling val data...")
 
-        X_val, y_val = apply_subsampling(X_val, y_val, "NEGATIVE")
+            X_val, y_val = apply_subsampling(
+                X_val, y_val, "NEGATIVE", cache_dir=globals.PILOT_SCORES_DIR
+            )
+            stage.add(rows=len(X_train) + len(X_val))
         logging.info(
             "- Min precipitation values (train/val/test) after subsampling: %.5f, %.5f, %.5f"
             % (np.min(y_train), np.min(y_val), np.min(y_test))
@@ -805,26 +753,145 @@ def build_datasets(
         logging.info("Done!\n")
 
     #
-    # Write numpy arrays for train/val/test dataset to a single pickle file
-    logging.info(f"Dumping train/val/test np arrays to pickle file {filename}...")
+    # Write numpy arrays for train/val/test dataset as a memory-mappable dataset artifact
+    artifact_dir = dataset_artifacts.get_artifact_dir(globals.DATASETS_DIR, pipeline_id)
+    logging.info(
+        f"Saving train/val/test np arrays to dataset artifact {artifact_dir}..."
+    )
     logging.info(
         f"Number of examples (train/val/test): {len(X_train)}/{len(X_val)}/{len(X_test)}."
     )
-    filename = globals.DATASETS_DIR + pipeline_id + ".pickle"
-    file = open(filename, "wb")
-    ndarrays = (X_train, y_train, X_val, y_val, X_test, y_test)
-    pickle.dump(ndarrays, file)
+    with instrumentation.stage(
+        "save_datasets", rows=len(X_train) + len(X_val) + len(X_test), files=10
+    ):
+        dataset_artifacts.save_datasets(
+            globals.DATASETS_DIR,
+            pipeline_id,
+            X_train,
+            y_train,
+            X_val,
+            y_val,
+            X_test,
+            y_test,
+            feature_names=df_train.columns,
+            window_size=window_size,
+        )
     logging.info("Done!\n")
 
     logging.info("Done it all!")
 
 
+# Shared by the jobs of a worker process of build_datasets_batch
+_batch_sources = None
+_batch_window_size = None
+
+
+def _init_batch_worker(sources, window_size):
+    global _batch_sources, _batch_window_size
+    _batch_sources = sources
+    _batch_window_size = window_size
+
+
+def _build_batch_job(job: dict) -> str:
+    with instrumentation.run(
+        "build_datasets",
+        station_id=job["station_id"],
+        fusion_sources=job["fusion_sources"],
+        subsampling_procedure=job["subsampling_procedure"],
+    ):
+        build_datasets(**job, window_size=_batch_window_size, sources=_batch_sources)
+    return get_pipeline_id(job["station_id"], job["fusion_sources"])
+
+
+def build_datasets_batch(jobs: List[dict], max_workers: int = None) -> List[str]:
+    """
+    Builds the datasets of many stations and combinations of fusion sources. Each job has the
+    arguments of build_datasets, e.g.
+
+        {"station_id": "A652", "input_folder": ..., "train_start_threshold": ...,
+         "train_test_threshold": ..., "test_end_threshold": ...,
+         "fusion_sources": ["ERA5", "R"], "subsampling_procedure": "NONE"}
+
+    The fusion sources of all jobs and config.yaml are read once, by load_fusion_sources and
+    load_window_size, and the jobs then run in max_workers processes (default: number of
+    CPUs). The workers receive the loaded sources when they start, and only read them: with
+    the fork start method of Linux, they share the memory of the parent process instead of
+    getting a copy.
+
+    A failing job is logged and doesn't stop the others. Returns the pipeline ids of the
+    failed jobs.
+    """
+    station_ids_by_source = dict()
+    for job in jobs:
+        for source in job["fusion_sources"] or []:
+            station_ids = station_ids_by_source.setdefault(source, [])
+            if job["station_id"] not in station_ids:
+                station_ids.append(job["station_id"])
+
+    with instrumentation.run(
+        "build_datasets_batch",
+        station_ids_by_source=station_ids_by_source,
+        jobs=len(jobs),
+    ):
+        with instrumentation.stage("load_fusion_sources"):
+            sources = load_fusion_sources(station_ids_by_source)
+        window_size = load_window_size()
+
+    failed = []
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_batch_worker,
+        initargs=(sources, window_size),
+    ) as executor:
+        futures = {
+            executor.submit(_build_batch_job, job): get_pipeline_id(
+                job["station_id"], job["fusion_sources"]
+            )
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            pipeline_id = futures[future]
+            try:
+                future.result()
+                logging.info(f"Datasets of pipeline {pipeline_id} built.")
+            except Exception:
+                logging.exception(f"Failed to build the datasets of {pipeline_id}.")
+                failed.append(pipeline_id)
+    return failed
+
+
+def get_input_folder(station_id: str) -> str:
+    if station_id in globals.INMET_WEATHER_STATION_IDS:
+        return globals.WS_INMET_DATA_DIR
+    elif station_id in globals.ALERTARIO_WEATHER_STATION_IDS:
+        return globals.WS_ALERTARIO_DATA_DIR
+    elif station_id in globals.ALERTARIO_GAUGE_STATION_IDS:
+        # Its a gauge station.
+        return globals.GS_ALERTARIO_DATA_DIR
+    return None
+
+
+def get_train_test_threshold(station_id: str, train_test_threshold):
+    if (
+        station_id in globals.ALERTARIO_WEATHER_STATION_IDS
+        or station_id in globals.ALERTARIO_GAUGE_STATION_IDS
+    ):
+        # This UTC thing is really anonying!
+        return pd.to_datetime(train_test_threshold, utc=True)
+    return pd.to_datetime(train_test_threshold)
+
+
 def main(argv):
     parser = argparse.ArgumentParser(
         description="""This script builds the train/val/test datasets for a given weather station, by using the user-specified data sources."""
     )
     parser.add_argument(
-        "-s", "--station_id", type=str, required=True, help="station id"
+        "-s",
+        "--station_id",
+        nargs="+",
+        type=str,
+        required=True,
+        help="station id, or a list of station ids to build in batch",
     )
     parser.add_argument(
         "-tt",
@@ -861,11 +928,31 @@ def main(argv):
         default="NONE",
         help="Subsampling procedure do be applied.",
     )
+    parser.add_argument(
+        "-c",
+        "--combinations",
+        nargs="+",
+        type=str,
+        help="Combinations of data sources to build in batch for each station, each one a comma-separated list (e.g. ERA5 ERA5,R TPW), or NONE for no data sources. Overrides --datasources.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes of a batch (default: number of CPUs).",
+    )
     args = parser.parse_args(argv[1:])
 
-    station_id = args.station_id
-    fusion_sources = args.datasources
+    station_ids = args.station_id
     subsampling_procedure = args.subsampling_procedure
+    if args.combinations is not None:
+        lst_fusion_sources = [
+            None if combination == "NONE" else combination.split(",")
+            for combination in args.combinations
+        ]
+    else:
+        lst_fusion_sources = [args.datasources]
 
     try:
         train_start_threshold = args.train_start_threshold
@@ -877,15 +964,7 @@ def main(argv):
         sys.exit(2)
 
     try:
-        if (
-            station_id in globals.ALERTARIO_WEATHER_STATION_IDS
-            or station_id in globals.ALERTARIO_GAUGE_STATION_IDS
-        ):
-            train_test_threshold = pd.to_datetime(
-                args.train_test_threshold, utc=True
-            )  # This UTC thing is really anonying!
-        else:
-            train_test_threshold = pd.to_datetime(args.train_test_threshold)
+        train_test_threshold = pd.to_datetime(args.train_test_threshold)
     except pd.errors.ParserError:
         print(f"Invalid date format: {args.train_test_threshold}.")
         parser.print_help()
@@ -912,22 +991,11 @@ def main(argv):
         parser.print_help()
         sys.exit(2)
 
-    if not (
-        (station_id in globals.INMET_WEATHER_STATION_IDS)
-        or (station_id in globals.ALERTARIO_WEATHER_STATION_IDS)
-        or (station_id in globals.ALERTARIO_GAUGE_STATION_IDS)
-    ):
-        print(f"Invalid station identifier: {station_id}")
-        parser.print_help()
-        sys.exit(2)
-
-    if station_id in globals.INMET_WEATHER_STATION_IDS:
-        input_folder = globals.WS_INMET_DATA_DIR
-    elif station_id in globals.ALERTARIO_WEATHER_STATION_IDS:
-        input_folder = globals.WS_ALERTARIO_DATA_DIR
-    elif station_id in globals.ALERTARIO_GAUGE_STATION_IDS:
-        # Its a gauge station.
-        input_folder = globals.GS_ALERTARIO_DATA_DIR
+    for station_id in station_ids:
+        if get_input_folder(station_id) is None:
+            print(f"Invalid station identifier: {station_id}")
+            parser.print_help()
+            sys.exit(2)
 
     fmt = "[%(levelname)s] %(funcName)s():%(lineno)i: %(message)s"
     logging.basicConfig(level=logging.DEBUG, format=fmt)
@@ -960,24 +1028,55 @@ def main(argv):
     #     if "A" in datasources:
     #         join_autoencoder_data_source = True
 
+    jobs = [
+        {
+            "station_id": station_id,
+            "input_folder": get_input_folder(station_id),
+            "train_start_threshold": train_start_threshold,
+            "train_test_threshold": get_train_test_threshold(
+                station_id, train_test_threshold
+            ),
+            "test_end_threshold": test_end_threshold,
+            "fusion_sources": fusion_sources,
+            "subsampling_procedure": subsampling_procedure,
+        }
+        for station_id in station_ids
+        for fusion_sources in lst_fusion_sources
+    ]
+
+    if len(jobs) > 1:
+        failed = build_datasets_batch(jobs, max_workers=args.workers)
+        if failed:
+            print(f"Failed to build the datasets of: {failed}")
+            sys.exit(1)
+        return
+
+    station_id = jobs[0]["station_id"]
+    fusion_sources = jobs[0]["fusion_sources"]
     assert (station_id is not None) and (station_id != "")
 
-    build_datasets(
-        station_id,
-        input_folder,
-        train_start_threshold,
-        train_test_threshold,
-        test_end_threshold,
-        fusion_sources,
-        #    join_as_data_source,
-        #    join_nwp_data_source,
-        #    join_lightning_data_source,
-        #    join_goes16_tpw_data_source,
-        #    join_colorcord_data_source,
-        #    join_conv2d_data_source,
-        #    join_autoencoder_data_source,
-        subsampling_procedure,
-    )
+    with instrumentation.run(
+        "build_datasets",
+        station_id=station_id,
+        fusion_sources=fusion_sources,
+        subsampling_procedure=subsampling_procedure,
+    ):
+        build_datasets(
+            station_id,
+            jobs[0]["input_folder"],
+            train_start_threshold,
+            jobs[0]["train_test_threshold"],
+            test_end_threshold,
+            fusion_sources,
+            #    join_as_data_source,
+            #    join_nwp_data_source,
+            #    join_lightning_data_source,
+            #    join_goes16_tpw_data_source,
+            #    join_colorcord_data_source,
+            #    join_conv2d_data_source,
+            #    join_autoencoder_data_source,
+            subsampling_procedure,
+        )
 
 
 if __name__ == "__main__":
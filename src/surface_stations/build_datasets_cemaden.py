@@ -2,7 +2,6 @@ import argparse
 import datetime
 import logging
 import os
-import pickle
 import sys
 
 import numpy as np
@@ -10,6 +9,7 @@ import pandas as pd
 import yaml
 
 from config import globals
+from utils import dataset_artifacts
 
 
 def split_dataframe_by_date(df, threshold_date):
@@ -112,8 +112,18 @@ def build_datasets(
         X_train, y_train = apply_subsampling(X_train, y_train, subsampling_procedure)
         X_val, y_val = apply_subsampling(X_val, y_val, "NEGATIVE")
 
-    with open(f"{filename_base}.pickle", "wb") as f:
-        pickle.dump((X_train, y_train, X_val, y_val, X_test, y_test), f)
+    dataset_artifacts.save_datasets(
+        globals.DATASETS_DIR,
+        station_id,
+        X_train,
+        y_train,
+        X_val,
+        y_val,
+        X_test,
+        y_test,
+        feature_names=df_train.columns,
+        window_size=window_size,
+    )
 
     logging.info("Processamento concluído com sucesso.")
 
@@ -51,7 +51,7 @@ def main(argv):
     seed_everything()
 
     X_train, y_train, X_val, y_val, X_test, y_test = pipeline.load_datasets(
-        args.pipeline_id
+        args.pipeline_id, lazy=True
     )
 
     with open("./config/config.yaml", "r") as file:
@@ -0,0 +1,334 @@
+"""
+Fusion sources of build_datasets aligned to the time axis of a weather station.
+
+Each source is read with only the columns and the time range the station needs, and
+resampled onto the index of the station's observations, so that joining it is appending
+columns of the same length. The aligned sources are stored by AlignedSourceStore, so later
+builds of the station with the same time axis read them instead of the source files.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from config import globals
+from utils.file_fingerprint import get_file_fingerprint
+
+# Remember: (y, x)
+WSOI_TO_DSI_CELL = {
+    "A627": (1, 6),
+    "A652": (2, 5),
+    "A636": (2, 4),
+    "A621": (1, 3),
+    "A602": (3, 2),
+    "A601": (0, 1),
+}
+
+DSI_VARIABLE_NAMES = ["CAPE", "LI", "TT", "SI", "KI"]
+
+SOUNDING_INDICES_FILENAME = "SBGL_indices_1997_2023.parquet.gzip"
+
+# Sounding indices interpolated over the time axis of the station
+SOUNDING_INTERPOLATED_COLUMNS = [
+    "cape",
+    "cin",
+    "lift",
+    "k",
+    "total_totals",
+    "showalter",
+]
+
+# Rounding of the timestamps of the image features to hours, by kind of feature
+IMAGE_FEATURE_KINDS = {
+    "I": ("COLORCORD", "floor"),
+    "C": ("CONV2D", "floor"),
+    "A": ("AUTOENCODER", "ceil"),
+}
+
+
+def get_sounding_indices_path() -> str:
+    return globals.AS_DATA_DIR + SOUNDING_INDICES_FILENAME
+
+
+def get_dsi_path(variable_name: str) -> str:
+    return f"{globals.DSI_DATA_DIR}/DSI_{variable_name}_1H.parquet"
+
+
+def get_dsi_column(variable_name: str, station_id: str) -> str:
+    y, x = WSOI_TO_DSI_CELL[station_id]
+    return f"{variable_name}{y}{x}"
+
+
+def get_tpw_path(station_id: str) -> str:
+    return f"{globals.TPW_DATA_DIR}/{station_id}.parquet"
+
+
+def get_image_features_path(station_id: str, source: str) -> str:
+    kind, _ = IMAGE_FEATURE_KINDS[source]
+    return f"FEATURE_{station_id}_{kind}.csv"
+
+
+def _match_tz(timestamp, tz):
+    """
+    The timestamp as an instant comparable to the values of a column with time zone tz
+    """
+    timestamp = pd.Timestamp(timestamp)
+    if tz is None:
+        return timestamp.tz_convert(None) if timestamp.tzinfo is not None else timestamp
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize(tz)
+    return timestamp.tz_convert(tz)
+
+
+def _get_index_column(path: str):
+    """
+    The column that stores the index of a parquet file written by pandas, and its type
+    """
+    schema = pq.read_schema(path)
+    metadata = schema.pandas_metadata or {}
+    for index_column in metadata.get("index_columns", []):
+        # a RangeIndex isn't stored as a column
+        if isinstance(index_column, str):
+            return index_column, schema.field(index_column).type
+    return None, None
+
+
+def read_parquet_range(
+    path: str, columns: List[str] = None, start=None, end=None
+) -> pd.DataFrame:
+    """
+    Reads the columns of a parquet file indexed by timestamps, only in [start, end].
+
+    The time range is pushed down to the reader, so the row groups outside of it are
+    skipped. Files whose index isn't stored as a timestamp column are read whole.
+    """
+    index_column, index_type = _get_index_column(path)
+    if index_column is None or not hasattr(index_type, "tz"):
+        return pd.read_parquet(path, columns=columns)
+
+    filters = []
+    if start is not None:
+        filters.append((index_column, ">=", _match_tz(start, index_type.tz)))
+    if end is not None:
+        filters.append((index_column, "<=", _match_tz(end, index_type.tz)))
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+
+def read_sounding_indices(start=None, end=None) -> pd.DataFrame:
+    filename = get_sounding_indices_path()
+    logging.info(f"Loading atmospheric sounding indices from {filename}...")
+    format_string = "%Y-%m-%d %H:%M:%S"
+    filters = []
+    # the timestamps are strings in format_string, which sort as the timestamps
+    if start is not None:
+        filters.append(("time", ">=", pd.Timestamp(start).strftime(format_string)))
+    if end is not None:
+        filters.append(("time", "<=", pd.Timestamp(end).strftime(format_string)))
+    df_as = pd.read_parquet(filename, filters=filters or None)
+    logging.info(f"Done! Shape = {df_as.shape}.")
+
+    #
+    # Add index to dataframe using the observation's timestamps, and remove the time-related
+    # column since now this information is in the index.
+    df_as.index = pd.DatetimeIndex(
+        pd.to_datetime(df_as["time"], format=format_string), name="Datetime"
+    )
+    return df_as.drop(["time"], axis=1)
+
+
+def read_tpw(station_id: str, start=None, end=None) -> pd.DataFrame:
+    logging.info(f"Loading GOES16 TPW data for WSoI {station_id}...")
+    df_tpw = read_parquet_range(get_tpw_path(station_id), start=start, end=end)
+    logging.info(f"Done! Shape = {df_tpw.shape}.")
+    return df_tpw
+
+
+def read_dsi_variables(station_ids: List[str], start=None, end=None) -> dict:
+    """
+    Reads the DSI dataframe of each variable of DSI_VARIABLE_NAMES, with only the columns
+    of the cells associated with the stations, {variable_name: DataFrame}.
+    """
+    dsi_frames = dict()
+    for variable_name in DSI_VARIABLE_NAMES:
+        columns = sorted(
+            {get_dsi_column(variable_name, station_id) for station_id in station_ids}
+        )
+        logging.info(f"Loading GOES16 DSI data of {variable_name}...")
+        dsi_frames[variable_name] = read_parquet_range(
+            get_dsi_path(variable_name), columns=columns, start=start, end=end
+        )
+        logging.info(f"Done! Shape = {dsi_frames[variable_name].shape}.")
+    return dsi_frames
+
+
+def read_image_features(station_id: str, source: str) -> pd.DataFrame:
+    """
+    Image features of the station ("I", "C" or "A"), averaged by hour
+    """
+    _, rounding = IMAGE_FEATURE_KINDS[source]
+    filename = get_image_features_path(station_id, source)
+    logging.info(f"Loading image features {filename}...")
+    df_new = pd.read_csv(filename)
+    logging.info(f"Done! Shape = {df_new.shape}.")
+    dates = pd.to_datetime(df_new["date"], format="%Y-%m-%d--%H%M%S")
+    df_new["date"] = dates.dt.floor("h") if rounding == "floor" else dates.dt.ceil("h")
+    df_new = df_new.drop(["Estação"], axis=1).groupby("date").mean()
+    df_new.index = pd.DatetimeIndex(df_new.index, name="Datetime")
+    logging.info(
+        f"Range of timestamps in the image feature data source: [{min(df_new.index)}, {max(df_new.index)}]"
+    )
+    return df_new
+
+
+def _reindex(df: pd.DataFrame, index: pd.DatetimeIndex) -> pd.DataFrame:
+    return df[~df.index.duplicated()].reindex(index)
+
+
+def align_era5(df_era5: pd.DataFrame, index: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    ERA5 features at the timestamps of index, missing where ERA5 has no values
+    """
+    return _reindex(df_era5, index)
+
+
+def align_sounding_indices(
+    df_as: pd.DataFrame, index: pd.DatetimeIndex
+) -> pd.DataFrame:
+    """
+    Sounding indices at the timestamps of index, with the asi_idx_missing indicator of the
+    timestamps without a sounding. The missing values of SOUNDING_INTERPOLATED_COLUMNS are
+    interpolated linearly over the rows, and the ones left at the start are filled backwards.
+    """
+    aligned = _reindex(df_as, index)
+    aligned["asi_idx_missing"] = aligned.isnull().any(axis=1).astype(np.int64)
+    for column in SOUNDING_INTERPOLATED_COLUMNS:
+        aligned[column] = aligned[column].interpolate(method="linear")
+    return aligned.bfill()
+
+
+def align_tpw(df_tpw: pd.DataFrame, index: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    TPW at the timestamps of index that the TPW data has, with the tpw_idx_missing indicator
+    of its missing values. tpw_value is interpolated linearly and the missing values left
+    at the start are filled backwards.
+
+    The timestamps without TPW data are left out, so the result may be shorter than index.
+    """
+    df_tpw = df_tpw[~df_tpw.index.duplicated()]
+    aligned = df_tpw.reindex(index[index.isin(df_tpw.index)])
+    aligned["tpw_idx_missing"] = aligned.isnull().any(axis=1).astype(np.int64)
+    aligned["tpw_value"] = aligned["tpw_value"].interpolate(method="linear")
+    return aligned.bfill()
+
+
+def align_dsi(
+    dsi_frames: dict, station_id: str, index: pd.DatetimeIndex
+) -> pd.DataFrame:
+    """
+    DSI_VARIABLE_NAMES at the cell of the station, at the timestamps of index
+    """
+    features = pd.DataFrame(
+        {
+            variable_name: dsi_frames[variable_name][
+                get_dsi_column(variable_name, station_id)
+            ]
+            for variable_name in DSI_VARIABLE_NAMES
+        }
+    )
+    return _reindex(features, index)
+
+
+def align_image_features(df_new: pd.DataFrame, index: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    Image features at the timestamps of index, 0 where there are none
+    """
+    return _reindex(df_new, index).fillna(0)
+
+
+def align_glm(df_lightning: pd.DataFrame, index: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    Lightning features at the timestamps of index, event_energy filled backwards
+    """
+    aligned = _reindex(df_lightning, index)
+    aligned["event_energy"] = aligned["event_energy"].bfill()
+    return aligned
+
+
+def get_index_digest(index: pd.DatetimeIndex) -> str:
+    digest = hashlib.sha1(str(index.tz).encode())
+    digest.update(np.ascontiguousarray(index.asi8).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class AlignedSourceStore:
+    """
+    Fusion sources aligned to the time axis of each station, kept in
+    {cache_dir}/{station_id}/{source}_{index_digest}_{inputs_digest}.parquet.
+
+    The index digest identifies the time axis, and the inputs digest covers the size and
+    modification time of the files the source is read from and the parameters of the
+    alignment. An aligned source is rebuilt when its input files change, and the one it
+    replaces is removed. The folder can be deleted at any time.
+    """
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = Path(cache_dir)
+
+    def _get_path(
+        self, station_id: str, source: str, index_digest: str, inputs_digest: str
+    ) -> Path:
+        return (
+            self.cache_dir
+            / station_id
+            / f"{source}_{index_digest}_{inputs_digest}.parquet"
+        )
+
+    def _remove_stale(self, current_path: Path, source: str, index_digest: str) -> None:
+        for path in current_path.parent.glob(f"{source}_{index_digest}_*.parquet"):
+            if path != current_path:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    # removed by a build of the station running in parallel
+                    pass
+
+    def get(
+        self,
+        station_id: str,
+        source: str,
+        index: pd.DatetimeIndex,
+        input_paths: List[str],
+        align: Callable[[], pd.DataFrame],
+        params: dict = None,
+    ) -> pd.DataFrame:
+        """
+        The source aligned to index, read from the store or built by align() and stored
+        """
+        inputs = {
+            "files": [[str(path), get_file_fingerprint(path)] for path in input_paths],
+            "params": params or {},
+        }
+        inputs_digest = hashlib.sha1(
+            json.dumps(inputs, sort_keys=True, default=str).encode()
+        ).hexdigest()[:16]
+        index_digest = get_index_digest(index)
+        path = self._get_path(station_id, source, index_digest, inputs_digest)
+        if path.exists():
+            logging.info(f"Reading {source} data aligned to {station_id} from {path}.")
+            return pd.read_parquet(path)
+
+        aligned = align()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # parallel builds of the station may store the same source
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        aligned.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+        self._remove_stale(path, source, index_digest)
+        return aligned
@@ -1,19 +1,16 @@
-import pickle
-
 import torch
 import yaml
 
 import config.globals as globals
+import train.pipeline as pipeline
 from src.train.ordinal_classifier import OrdinalClassifier
 
 if __name__ == "__main__":
     pipeline_id = "A652_N"
 
     #
-    # Load numpy arrays (stored in a pickle file) from disk
-    filename = globals.DATASETS_DIR + pipeline_id + ".pickle"
-    file = open(filename, "rb")
-    (_, _, _, _, X_test, _) = pickle.load(file)
+    # Load numpy arrays from disk
+    (_, _, _, _, X_test, _) = pipeline.load_datasets(pipeline_id)
     print(f"Shape of test data matrix: {X_test.shape}")
 
     # Example to predict is the firs one in the test dataset.
@@ -8,11 +8,16 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
-from sklearn.impute import KNNImputer
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
 
 from config import globals
-from utils import util as util
+from utils import instrumentation, util
+from utils.imputation import (
+    DEFAULT_STRATEGY,
+    apply_imputation,
+    fill_from_donors,
+    get_donor_station_ids,
+)
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 SRC_DIR = PROJECT_ROOT / "src"
@@ -109,38 +114,34 @@ def apply_scaling(df: pd.DataFrame, scaler_config: dict) -> pd.DataFrame:
     return scaled_df
 
 
-def apply_imputation(df: pd.DataFrame, imputation_config: dict) -> pd.DataFrame:
-    if df.empty:
-        return df
-    imputation_config = imputation_config or {}
-    strategy = imputation_config.get("strategy", "knn")
-    if not isinstance(strategy, str):
-        logging.warning(
-            f"Invalid imputation strategy '{strategy}'. Skipping imputation."
+def load_donor_stations(
+    ws_id: str, station_system: str, system_settings: dict, donors_config: dict
+) -> list:
+    """
+    Loads the neighbor stations of ws_id that can lend their values to it, nearest first,
+    with the columns renamed like the station's.
+    """
+    system_config = STATION_SYSTEM_CONFIG[station_system]
+    donor_ids = get_donor_station_ids(
+        ws_id,
+        system_settings.get("stations", {}),
+        sorted(system_config["ids"]),
+        n_donors=donors_config.get("n_donors", 3),
+        max_distance_km=donors_config.get("max_distance_km", 30.0),
+    )
+    column_name_mapping = system_settings.get("column_mapping", {})
+    donors = []
+    for donor_id in donor_ids:
+        donor_filename = Path(system_config["data_dir"]) / f"{donor_id}.parquet"
+        if not donor_filename.exists():
+            logging.warning(f"Donor station file {donor_filename} not found, skipping.")
+            continue
+        donor_df = util.add_datetime_index(donor_id, pd.read_parquet(donor_filename))
+        donor_df = util.get_dataframe_with_selected_columns(
+            donor_df, column_name_mapping.keys()
         )
-        return df
-    strategy = strategy.lower()
-    params = imputation_config.get("params", {}) or {}
-
-    if strategy == "knn":
-        n_neighbors = params.get("n_neighbors", 2)
-        weights = params.get("weights", "uniform")
-        imputer = KNNImputer(n_neighbors=n_neighbors, weights=weights)
-        imputed = imputer.fit_transform(df)
-        return pd.DataFrame(imputed, columns=df.columns, index=df.index)
-    if strategy in {"ffill_then_zero", "forward_then_zero"}:
-        return df.ffill().fillna(0.0)
-    if strategy in {"ffill", "forward"}:
-        return df.ffill()
-    if strategy in {"bfill", "backward"}:
-        return df.bfill()
-    if strategy in {"zero", "zeros"}:
-        return df.fillna(0.0)
-    if strategy in {"none", "skip"}:
-        return df
-
-    logging.warning(f"Unknown imputation strategy '{strategy}'. Skipping imputation.")
-    return df
+        donors.append(util.rename_dataframe_column_names(donor_df, column_name_mapping))
+    return donors
 
 
 def apply_quality_checks(
@@ -415,7 +416,9 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
     station_metadata = _safe_get(_safe_get(system_settings, "stations", {}), ws_id, {})
 
     logging.info(f"Loading datasource file {ws_filename}).")
-    df = pd.read_parquet(ws_filename)
+    with instrumentation.stage("load_datasource", files=1) as stage:
+        df = pd.read_parquet(ws_filename)
+        stage.add(rows=len(df))
     logging.info(df.head())
     logging.info("Done!\n")
 
@@ -474,6 +477,34 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
     logging.info(df.head())
     logging.info("Done!\n")
 
+    #
+    # Fill missing values with the values of the nearest stations at the same timestamps.
+    donors_config = _safe_get(imputation_config, "donors", {}) or {}
+    if impute_missing_values and _is_truthy(_safe_get(donors_config, "enabled", False)):
+        logging.info("Filling missing values from neighbor stations...")
+        donor_columns = [
+            column
+            for column in _ensure_list(
+                donors_config.get("columns"), default=predictor_names
+            )
+            if column in df.columns and column != target_name
+        ]
+        with instrumentation.stage("donors", rows=len(df)) as stage:
+            donors = load_donor_stations(
+                ws_id, station_system, system_settings, donors_config
+            )
+            stage.add(files=len(donors))
+            missing_before = int(df[donor_columns].isna().sum().sum())
+            df[donor_columns] = fill_from_donors(
+                df[donor_columns],
+                [donor[donor.columns.intersection(donor_columns)] for donor in donors],
+                adjust_bias=_is_truthy(donors_config.get("adjust_bias", False)),
+            )
+        logging.info(
+            f"Filled {missing_before - int(df[donor_columns].isna().sum().sum())} of {missing_before} missing values from {len(donors)} neighbor stations."
+        )
+        logging.info("Done!\n")
+
     quality_summary = []
     quality_added_predictors = []
     if quality_enabled:
@@ -481,13 +512,14 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
         pre_quality_columns = [
             column for column in predictor_names if column in df.columns
         ]
-        df, quality_output = apply_quality_checks(
-            df=df,
-            quality_config=quality_config,
-            predictor_columns=pre_quality_columns,
-            flag_suffix=flag_suffix,
-            include_flag_columns=include_flag_columns,
-        )
+        with instrumentation.stage("quality_checks", rows=len(df)):
+            df, quality_output = apply_quality_checks(
+                df=df,
+                quality_config=quality_config,
+                predictor_columns=pre_quality_columns,
+                flag_suffix=flag_suffix,
+                include_flag_columns=include_flag_columns,
+            )
         quality_summary = quality_output.get("checks", [])
         if include_flag_columns:
             quality_added_predictors = [
@@ -501,7 +533,8 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
     # Create wind-related features (U and V components of wind observations).
     if add_wind_features:
         logging.info("Creating wind-related features...")
-        df = util.add_wind_related_features(ws_id, df)
+        with instrumentation.stage("wind_features", rows=len(df)):
+            df = util.add_wind_related_features(ws_id, df)
         logging.info(df.head())
         logging.info("Done!\n")
     else:
@@ -548,7 +581,7 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
     # Notice that we drop the target column before scaling, to avoid some kind of data leakage.
     # (see https://stats.stackexchange.com/questions/214728/should-data-be-normalized-before-or-after-imputation-of-missing-data)
     target_column = df[target_name]
-    predictors_df = df.drop(columns=[target_name], axis=1).copy()
+    predictors_df = df.drop(columns=[target_name]).copy()
     if normalize_predictors:
         scaler_type = (
             (scaler_config.get("type") or "minmax")
@@ -556,7 +589,8 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
             else "minmax"
         )
         logging.info(f"Applying '{scaler_type}' scaling...")
-        predictors_df = apply_scaling(predictors_df, scaler_config)
+        with instrumentation.stage("scaling", rows=len(predictors_df)):
+            predictors_df = apply_scaling(predictors_df, scaler_config)
         logging.info("Done!\n")
     else:
         logging.info("Skipping normalization as configured.\n")
@@ -565,9 +599,9 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
     # Imput missing values on some features.
     if impute_missing_values:
         strategy = (
-            (imputation_config.get("strategy") or "knn")
+            (imputation_config.get("strategy") or DEFAULT_STRATEGY)
             if isinstance(imputation_config, dict)
-            else "knn"
+            else DEFAULT_STRATEGY
         )
         logging.info(f"Applying '{strategy}' imputation...")
         percentage_missing = (
@@ -576,7 +610,8 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
         logging.info(
             f"There are {predictors_df.isnull().sum().sum()} missing values ({percentage_missing:.2f}%). Going to fill them..."
         )
-        predictors_df = apply_imputation(predictors_df, imputation_config)
+        with instrumentation.stage("imputation", rows=len(predictors_df)):
+            predictors_df = apply_imputation(predictors_df, imputation_config)
         assert not predictors_df.isnull().values.any().any()
         logging.info("Done!\n")
     else:
@@ -584,7 +619,7 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
     strategy_value = None
     strategy_flag = True
     if isinstance(imputation_config, dict):
-        strategy_value = imputation_config.get("strategy", "knn")
+        strategy_value = imputation_config.get("strategy", DEFAULT_STRATEGY)
         if isinstance(strategy_value, str):
             strategy_flag = strategy_value.lower() not in {"none", "skip"}
     imputation_applied = bool(impute_missing_values and strategy_flag)
@@ -599,7 +634,8 @@ def preprocess_ws(ws_id, ws_filename, output_folder, station_system):
     filename_and_extension = util.get_filename_and_extension(ws_filename)
     filename = output_folder + filename_and_extension[0] + "_preprocessed.parquet.gzip"
     logging.info(f"Saving preprocessed data to {filename}...")
-    df.to_parquet(filename, compression="gzip")
+    with instrumentation.stage("save", rows=len(df), files=1):
+        df.to_parquet(filename, compression="gzip")
     logging.info("Done!\n")
 
     if (
@@ -678,12 +714,15 @@ def main(argv):
         f"Preprocessing data coming from weather station {station_id} (system: {station_system.upper()})"
     )
     ws_filename = ws_data_dir + args.station_id + ".parquet"
-    preprocess_ws(
-        ws_id=station_id,
-        ws_filename=ws_filename,
-        output_folder=ws_data_dir,
-        station_system=station_system,
-    )
+    with instrumentation.run(
+        "preprocess_ws", station_id=station_id, station_system=station_system
+    ):
+        preprocess_ws(
+            ws_id=station_id,
+            ws_filename=ws_filename,
+            output_folder=ws_data_dir,
+            station_system=station_system,
+        )
 
 
 if __name__ == "__main__":
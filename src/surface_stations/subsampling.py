@@ -1,19 +1,52 @@
+import hashlib
+import json
 import logging
+import os
+from pathlib import Path
 
 import numpy as np
-from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.ensemble import GradientBoostingClassifier, HistGradientBoostingClassifier
+
+from utils.windowing import WindowedSeries
 
 NAIVE_SUBSAMPLING_KEEP_RATIO = 0.05
 
 # With negative subsampling (train/val/test): 13934/3142/10219.
 
-
-def apply_subsampling(X, y, subsampling_strategy):
+NEGATIVE_SUBSAMPLING_SEED = 0
+
+# Pilot models of negative subsampling. HIST bins the features and trains on all cores,
+# GB is the exact (single-threaded) GradientBoostingClassifier used previously.
+PILOT_MODELS = {
+    "HIST": lambda: HistGradientBoostingClassifier(
+        random_state=NEGATIVE_SUBSAMPLING_SEED
+    ),
+    "GB": lambda: GradientBoostingClassifier(random_state=NEGATIVE_SUBSAMPLING_SEED),
+}
+
+# Negative examples scored by the pilot model at a time
+SCORING_CHUNK_SIZE = 65_536
+
+
+def apply_subsampling(
+    X,
+    y,
+    subsampling_strategy,
+    pilot_model="HIST",
+    chunk_size=SCORING_CHUNK_SIZE,
+    cache_dir=None,
+):
+    """
+    The pilot_model, chunk_size and cache_dir parameters are only used by NEGATIVE
+    subsampling, see apply_negative_subsampling.
+    """
     assert subsampling_strategy in ("NAIVE", "NEGATIVE")
     if subsampling_strategy == "NAIVE":
         return apply_naive_subsampling(X, y)
     else:
-        return apply_negative_subsampling(X, y)
+        return apply_negative_subsampling(
+            X, y, pilot_model=pilot_model, chunk_size=chunk_size, cache_dir=cache_dir
+        )
 
 
 def apply_naive_subsampling(X, y):
@@ -53,10 +86,91 @@ def apply_naive_subsampling(X, y):
     return X, y
 
 
-def apply_negative_subsampling(X_train, y_train):
-    original_shape_X_train = X_train.shape
+def _get_flat_examples(X, idxs):
+    """
+    Examples idxs of X, a WindowedSeries or an array of windows, flattened to rows of
+    features for the pilot model
+    """
+    if isinstance(X, WindowedSeries):
+        examples = X.take(idxs)
+    else:
+        examples = np.asarray(X[idxs])
+    return examples.reshape(len(examples), -1)
+
+
+def get_dataset_fingerprint(X, y) -> str:
+    """
+    Digest of the examples of X and of y. A WindowedSeries is digested through its series
+    and window starts, without building its windows.
+    """
+    digest = hashlib.sha1()
+    if isinstance(X, WindowedSeries):
+        digest.update(f"windows {X.window_size}".encode())
+        digest.update(np.ascontiguousarray(X.series).tobytes())
+        digest.update(np.ascontiguousarray(X.window_starts).tobytes())
+    else:
+        X = np.ascontiguousarray(X)
+        digest.update(f"array {X.shape} {X.dtype}".encode())
+        digest.update(X.tobytes())
+    y = np.ascontiguousarray(y)
+    digest.update(f"{y.shape} {y.dtype}".encode())
+    digest.update(y.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class PilotScoreCache:
+    """
+    Normalized scores of the negative examples of a dataset, kept as {key}.npy, where the
+    key covers the fingerprint of the dataset (see get_dataset_fingerprint), the pilot
+    model and the seed. Builds of the same dataset, e.g. with other subsampling
+    strategies for train, reuse the scores instead of training the pilot model again.
+    The folder can be deleted at any time.
+    """
 
-    X_train = X_train.reshape(len(X_train), -1)
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = Path(cache_dir)
+
+    def get_key(self, fingerprint: str, pilot_model: str) -> str:
+        inputs = {
+            "dataset": fingerprint,
+            "pilot_model": pilot_model,
+            "seed": NEGATIVE_SUBSAMPLING_SEED,
+        }
+        digest = hashlib.sha1(json.dumps(inputs, sort_keys=True).encode())
+        return digest.hexdigest()[:16]
+
+    def _get_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+
+    def get(self, key: str):
+        path = self._get_path(key)
+        if not path.exists():
+            return None
+        logging.info(f"Reading the pilot scores of the negative examples from {path}.")
+        return np.load(path)
+
+    def put(self, key: str, scores: np.ndarray) -> None:
+        path = self._get_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # parallel builds may store the scores of the same dataset
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp.npy")
+        np.save(tmp_path, scores)
+        os.replace(tmp_path, path)
+
+
+def apply_negative_subsampling(
+    X_train, y_train, pilot_model="HIST", chunk_size=SCORING_CHUNK_SIZE, cache_dir=None
+):
+    """
+    Keeps all the positive examples and as many negative examples, sampled proportionally
+    to the scores a pilot model trained on a balanced subset gives them.
+
+    X_train is a WindowedSeries or an array of windows, and only the windows the pilot
+    model is trained on and, chunk_size at a time, the ones it scores are flattened (all
+    of them at once if chunk_size is None). The sampled examples are selected from X_train
+    itself, so a WindowedSeries stays lazy. With cache_dir, the scores are stored in a
+    PilotScoreCache and the pilot model isn't trained again for the same dataset.
+    """
     y_train_binarized = np.copy(y_train)
     y_train_binarized[y_train_binarized > 0] = 1
 
@@ -69,33 +183,37 @@ def apply_negative_subsampling(X_train, y_train):
     # Apply the steps of the negative sampling procedure
     ###
 
-    # Step 1: Train "pilot" model
-    clf = train_pilot_model(X_train, y_train_binarized)
+    cache = PilotScoreCache(cache_dir) if cache_dir is not None else None
+    y_proba_normalized = None
+    if cache is not None:
+        key = cache.get_key(get_dataset_fingerprint(X_train, y_train), pilot_model)
+        y_proba_normalized = cache.get(key)
 
-    # Step 2: Score the negative examples with the pilot model
-    y_proba_normalized = score_negative_examples(clf, X_train, y_train_binarized)
+    if y_proba_normalized is None:
+        # Step 1: Train "pilot" model
+        clf = train_pilot_model(X_train, y_train_binarized, pilot_model)
+
+        # Step 2: Score the negative examples with the pilot model
+        y_proba_normalized = score_negative_examples(
+            clf, X_train, y_train_binarized, chunk_size
+        )
+        if cache is not None:
+            cache.put(key, y_proba_normalized)
 
     # Step 3: Sample the negative examples proportionally to their scores
     negative_indices = sample_from_negative_examples(
         X_train, y_train_binarized, y_proba_normalized
     )
 
-    X_train_sampled = np.concatenate(
-        (X_train[positive_indices], X_train[negative_indices])
-    )
-    y_train_sampled = np.concatenate(
-        (y_train[positive_indices], y_train[negative_indices])
-    )
-
-    X_train_sampled = X_train_sampled.reshape(
-        (len(X_train_sampled), original_shape_X_train[1], original_shape_X_train[2])
-    )
+    sampled_indices = np.concatenate((positive_indices, negative_indices))
+    X_train_sampled = X_train[sampled_indices]
+    y_train_sampled = y_train[sampled_indices]
     y_train_sampled = y_train_sampled.reshape(-1, 1)
 
     return X_train_sampled, y_train_sampled
 
 
-def train_pilot_model(X_train, y_train):
+def train_pilot_model(X_train, y_train, pilot_model="HIST"):
     """
     Train the pilot model on a balanced dataset. This balanced dataset is built in
     such a way that it has equal amounts of positive and negative examples. If there
@@ -109,25 +227,26 @@ def train_pilot_model(X_train, y_train):
         f"Amounts of neg/pos examples: {len(y_eq_zero_idxs)}/{len(y_gt_zero_idxs)}"
     )
 
-    X_train_positives = X_train[y_gt_zero_idxs]
-    X_train_negatives = X_train[y_eq_zero_idxs]
-
-    num_positive_examples = len(X_train_positives)
-    num_negative_examples = len(X_train_negatives)
+    num_positive_examples = len(y_gt_zero_idxs)
+    num_negative_examples = len(y_eq_zero_idxs)
 
     assert num_positive_examples < num_negative_examples
 
     num_negative_examples_to_sample = min(num_positive_examples, num_negative_examples)
 
-    positive_indices = np.random.choice(
+    rng = np.random.default_rng(NEGATIVE_SUBSAMPLING_SEED)
+    positive_indices = rng.choice(
         num_positive_examples, size=num_negative_examples_to_sample, replace=False
     )
-    negative_indices = np.random.choice(
+    negative_indices = rng.choice(
         num_negative_examples, size=num_negative_examples_to_sample, replace=False
     )
 
-    X_train_balanced = np.concatenate(
-        (X_train_positives[positive_indices], X_train_negatives[negative_indices])
+    X_train_balanced = _get_flat_examples(
+        X_train,
+        np.concatenate(
+            (y_gt_zero_idxs[positive_indices], y_eq_zero_idxs[negative_indices])
+        ),
     )
     y_train_balanced = np.concatenate(
         (
@@ -138,8 +257,9 @@ def train_pilot_model(X_train, y_train):
 
     assert len(y_train_balanced) == 2 * num_negative_examples_to_sample
 
-    # Create a GradientBoostingClassifier object with default hyperparameters
-    clf = GradientBoostingClassifier()
+    # Create the pilot model with default hyperparameters
+    logging.info(f"Training the {pilot_model} pilot model...")
+    clf = PILOT_MODELS[pilot_model]()
 
     # Train the classifier on the balanced training dataset
     clf.fit(X_train_balanced, y_train_balanced)
@@ -147,16 +267,20 @@ def train_pilot_model(X_train, y_train):
     return clf
 
 
-def score_negative_examples(clf, X_train, y_train):
+def score_negative_examples(clf, X_train, y_train, chunk_size=None):
     y_eq_zero_idxs = np.where(y_train == 0)[0]
-    X_train_negatives = X_train[y_eq_zero_idxs]
     y_train_negatives = y_train[y_eq_zero_idxs]
 
-    # Get predicted probabilities on the negative samples
-    y_proba = clf.predict_proba(X_train_negatives)
+    # Get predicted probabilities on the negative samples, chunk_size examples at a time
+    if chunk_size is None:
+        chunk_size = max(len(y_eq_zero_idxs), 1)
+    y_proba_negative = np.empty(len(y_eq_zero_idxs))
+    for start in range(0, len(y_eq_zero_idxs), chunk_size):
+        chunk_idxs = y_eq_zero_idxs[start : start + chunk_size]
+        y_proba = clf.predict_proba(_get_flat_examples(X_train, chunk_idxs))
 
-    # The predicted probabilities for the negative class (class 0) are in the first column
-    y_proba_negative = y_proba[:, 0]
+        # The predicted probabilities for the negative class (class 0) are in the first column
+        y_proba_negative[start : start + chunk_size] = y_proba[:, 0]
 
     # Normalize the probabilities to sum to 1
     y_proba_normalized = y_proba_negative / np.sum(y_proba_negative)
@@ -176,11 +300,11 @@ def sample_from_negative_examples(X_train, y_train, y_proba_normalized):
     y_eq_zero_idxs = np.where(y_train == 0)[0]
     y_gt_zero_idxs = np.where(y_train > 0)[0]
 
-    positive_examples = X_train[y_gt_zero_idxs]
-    num_positive_examples = len(positive_examples)
+    num_positive_examples = len(y_gt_zero_idxs)
 
     # Sample the indices using the normalized probabilities
-    negative_sampled_idxs = np.random.choice(
+    rng = np.random.default_rng(NEGATIVE_SUBSAMPLING_SEED)
+    negative_sampled_idxs = rng.choice(
         y_eq_zero_idxs, size=num_positive_examples, replace=False, p=y_proba_normalized
     )
 
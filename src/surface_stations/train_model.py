@@ -21,6 +21,7 @@ from train.training_utils import (
     seed_everything,
     to_device,
 )
+from utils import instrumentation
 
 
 def compute_weights_for_binary_classification(y):
@@ -151,18 +152,19 @@ def train(
     # optimizer = torch.optim.SGD(model.parameters(), lr=1e-5, momentum=0.9)
 
     print(" - Creating data loaders.")
-    train_loader = learner.create_dataloader(
-        X_train, y_train, batch_size=BATCH_SIZE, weights=train_weights
-    )
-    val_loader = learner.create_dataloader(
-        X_val, y_val, batch_size=BATCH_SIZE, weights=val_weights
-    )
-
-    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-    print(f" - Moving data and parameters to {device}.")
-    train_loader = DeviceDataLoader(train_loader, device)
-    val_loader = DeviceDataLoader(val_loader, device)
-    to_device(forecaster.learner, device)
+    with instrumentation.stage("create_dataloaders", rows=len(X_train) + len(X_val)):
+        train_loader = learner.create_dataloader(
+            X_train, y_train, batch_size=BATCH_SIZE, weights=train_weights
+        )
+        val_loader = learner.create_dataloader(
+            X_val, y_val, batch_size=BATCH_SIZE, weights=val_weights
+        )
+
+        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        print(f" - Moving data and parameters to {device}.")
+        train_loader = DeviceDataLoader(train_loader, device)
+        val_loader = DeviceDataLoader(val_loader, device)
+        to_device(forecaster.learner, device)
 
     # resume_training = True
     # if resume_training:
@@ -170,15 +172,19 @@ def train(
     #     model.load_state_dict(torch.load(model_path))
 
     print(" - Fitting model...", end=" ")
-    train_loss, val_loss = forecaster.learner.fit(
-        n_epochs=N_EPOCHS,
-        optimizer=optimizer,
-        train_loader=train_loader,
-        val_loader=val_loader,
-        patience=PATIENCE,
-        criterion=loss,
-        pipeline_id=pipeline_id,
-    )
+    with instrumentation.stage("fit") as stage:
+        train_loss, val_loss = forecaster.learner.fit(
+            n_epochs=N_EPOCHS,
+            optimizer=optimizer,
+            train_loader=train_loader,
+            val_loader=val_loader,
+            patience=PATIENCE,
+            criterion=loss,
+            pipeline_id=pipeline_id,
+        )
+        # one pass over the train and val examples per epoch
+        stage.add(rows=len(train_loss) * (len(X_train) + len(X_val)))
+        stage.add(epochs=len(train_loss))
     print("Done!")
 
     gen_learning_curve(train_loss, val_loss, pipeline_id)
@@ -186,9 +192,10 @@ def train(
     #
     # Load the best model obtainined throughout the training epochs.
     #
-    forecaster.learner.load_state_dict(
-        torch.load(MODELS_DIR + "/best_" + pipeline_id + ".pt")
-    )
+    with instrumentation.stage("load_best_model", files=1):
+        forecaster.learner.load_state_dict(
+            torch.load(MODELS_DIR + "/best_" + pipeline_id + ".pt")
+        )
 
 
 def main(argv):
@@ -222,9 +229,21 @@ def main(argv):
 
     seed_everything()
 
-    X_train, y_train, X_val, y_val, X_test, y_test = pipeline.load_datasets(
-        args.pipeline_id
-    )
+    with instrumentation.run(
+        "train_model",
+        pipeline_id=args.pipeline_id,
+        task=args.task,
+        learner=args.learner,
+    ):
+        _train_and_evaluate(args, forecasting_task_id)
+
+
+def _train_and_evaluate(args, forecasting_task_id):
+    with instrumentation.stage("load_datasets") as stage:
+        X_train, y_train, X_val, y_val, X_test, y_test = pipeline.load_datasets(
+            args.pipeline_id, lazy=True
+        )
+        stage.add(rows=len(X_train) + len(X_val) + len(X_test))
 
     with open("./config/config.yaml", "r") as file:
         config = yaml.safe_load(file)
@@ -275,24 +294,26 @@ def main(argv):
 
     # Build model
     start_time = time.time()
-    train(
-        forecaster,
-        X_train,
-        y_train,
-        X_val,
-        y_val,
-        prediction_task_sufix,
-        args.pipeline_id,
-        learner,
-        config,
-    )
+    with instrumentation.stage("train"):
+        train(
+            forecaster,
+            X_train,
+            y_train,
+            X_val,
+            y_val,
+            prediction_task_sufix,
+            args.pipeline_id,
+            learner,
+            config,
+        )
     logging.info("Model training took %s seconds." % (time.time() - start_time))
 
     # Evaluate using the best model produced
-    test_loader = learner.create_dataloader(X_test, y_test, batch_size=BATCH_SIZE)
-    forecaster.print_evaluation_report(
-        args.pipeline_id, test_loader, forecasting_task_id
-    )
+    with instrumentation.stage("evaluate", rows=len(X_test)):
+        test_loader = learner.create_dataloader(X_test, y_test, batch_size=BATCH_SIZE)
+        forecaster.print_evaluation_report(
+            args.pipeline_id, test_loader, forecasting_task_id
+        )
 
 
 if __name__ == "__main__":
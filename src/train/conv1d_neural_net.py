@@ -3,9 +3,9 @@ import operator
 
 import torch
 import torch.nn as nn
-from torch.utils.data import TensorDataset
 
 from train.base_neural_net import BaseNeuralNet
+from train.windowed_dataset import create_windowed_dataloader
 
 
 class Conv1DNeuralNet(BaseNeuralNet):
@@ -44,22 +44,13 @@ class Conv1DNeuralNet(BaseNeuralNet):
 
     def create_dataloader(self, X, y, batch_size, weights=None):
         """
-        The X parameter is a numpy array having the following shape:
+        The X parameter is a numpy array or a WindowedSeries having the following shape:
                     [batch_size, input_size, sequence_len]
 
         The nn.Conv1D module expects inputs having the following shape:
                     [batch_size, sequence_len, input_size]
         See https://stackoverflow.com/questions/62372938/understanding-input-shape-to-pytorch-conv1d
         """
-        X = torch.from_numpy(X.astype("float64"))
-        X = torch.permute(X, (0, 2, 1))
-        y = torch.from_numpy(y.astype("float64"))
-
-        if weights is None:
-            ds = TensorDataset(X, y)
-        else:
-            ds = TensorDataset(X, y, weights)
-
-        loader = torch.utils.data.DataLoader(ds, batch_size=batch_size, shuffle=True)
-
-        return loader
+        return create_windowed_dataloader(
+            X, y, batch_size, weights=weights, channels_first=True
+        )
@@ -1,8 +1,7 @@
-import torch
 import torch.nn as nn
-from torch.utils.data import TensorDataset
 
 from train.base_neural_net import BaseNeuralNet
+from train.windowed_dataset import create_windowed_dataloader
 
 
 # Needed because nn.LSTM() returns tuple of (tensor, (recurrent state))
@@ -49,7 +48,7 @@ class LstmNeuralNet(BaseNeuralNet):
 
     def create_dataloader(self, X, y, batch_size, weights=None):
         """
-        The X parameter is a numpy array having the following shape:
+        The X parameter is a numpy array or a WindowedSeries having the following shape:
                     [batch_size, sequence_len, input_size]
 
         The nn.LSTM module (with 'batch_first = True') expects inputs having the following shape:
@@ -62,17 +61,6 @@ class LstmNeuralNet(BaseNeuralNet):
 
         See https://discuss.pytorch.org/t/using-lstm-after-conv1d-for-time-series-data/111140
         """
-        X = torch.from_numpy(X.astype("float64"))
-        y = torch.from_numpy(y.astype("float64"))
-
-        if weights is None:
-            ds = TensorDataset(X, y)
-        else:
-            print(X.shape)
-            print(y.shape)
-            print(weights.shape)
-            ds = TensorDataset(X, y, weights)
-
-        loader = torch.utils.data.DataLoader(ds, batch_size=batch_size, shuffle=True)
-
-        return loader
+        return create_windowed_dataloader(
+            X, y, batch_size, weights=weights, channels_first=False
+        )
@@ -2,30 +2,61 @@ import logging
 import pickle
 
 from config import globals
+from utils import dataset_artifacts
 
 
-def load_datasets(pipeline_id: str):
+def _log_split_stats(metadata):
+    splits = metadata["splits"]
+    shapes = "/".join(str(tuple(splits[split]["X_shape"])) for split in splits)
+    logging.info(f"Shapes of train/val/test data matrices: {shapes}")
+    for stat in ("min", "max"):
+        features = "/".join(
+            str(splits[split]["features"].get(stat)) for split in splits
+        )
+        target = "/".join(str(splits[split]["target"].get(stat)) for split in splits)
+        logging.info(
+            f"{stat.capitalize()} values of train/val/test data matrices: {features}"
+        )
+        logging.info(f"{stat.capitalize()} values of train/val/test target: {target}")
+
+
+def load_datasets(pipeline_id: str, mmap_mode="r", lazy=False):
     """
-    Load numpy arrays (stored in a pickle file) from disk
+    Load train/val/test numpy arrays from disk.
+
+    The memory-mapped dataset artifact is used when it exists, otherwise the arrays are
+    unpickled from the file written by previous versions of build_datasets. With lazy=True,
+    the X arrays stored as series are returned as WindowedSeries (see dataset_artifacts).
     """
+    if dataset_artifacts.artifact_exists(globals.DATASETS_DIR, pipeline_id):
+        artifact_dir = dataset_artifacts.get_artifact_dir(
+            globals.DATASETS_DIR, pipeline_id
+        )
+        logging.info(f"Loading train/val/test datasets from {artifact_dir}.")
+        metadata = dataset_artifacts.load_metadata(globals.DATASETS_DIR, pipeline_id)
+        _log_split_stats(metadata)
+        return dataset_artifacts.load_datasets(
+            globals.DATASETS_DIR, pipeline_id, mmap_mode=mmap_mode, lazy=lazy
+        )
+
     filename = globals.DATASETS_DIR + pipeline_id + ".pickle"
     logging.info(f"Loading train/val/test datasets from {filename}.")
-    file = open(filename, "rb")
-    (X_train, y_train, X_val, y_val, X_test, y_test) = pickle.load(file)
+    with open(filename, "rb") as file:
+        (X_train, y_train, X_val, y_val, X_test, y_test) = pickle.load(file)
     logging.info(
         f"Shapes of train/val/test data matrices: {X_train.shape}/{X_val.shape}/{X_test.shape}"
     )
     logging.info(
-        f"Min values of train/val/test data matrices: {min(X_train.reshape(-1, 1))}/{min(X_val.reshape(-1, 1))}/{min(X_test.reshape(-1, 1))}"
+        f"Min values of train/val/test data matrices: {X_train.min()}/{X_val.min()}/{X_test.min()}"
     )
     logging.info(
-        f"Max values of train/val/test data matrices: {max(X_train.reshape(-1, 1))}/{max(X_val.reshape(-1, 1))}/{max(X_test.reshape(-1, 1))}"
+        f"Max values of train/val/test data matrices: {X_train.max()}/{X_val.max()}/{X_test.max()}"
     )
     logging.info(
-        f"Min values of train/val/test target: {min(y_train)}/{min(y_val)}/{min(y_test)}"
+        f"Min values of train/val/test target: {y_train.min()}/{y_val.min()}/{y_test.min()}"
     )
     logging.info(
-        f"Max values of train/val/test target: {max(y_train)}/{max(y_val)}/{max(y_test)}"
+        f"Max values of train/val/test target: {y_train.max()}/{y_val.max()}/{y_test.max()}"
     )
 
     return X_train, y_train, X_val, y_val, X_test, y_test
@@ -0,0 +1,67 @@
+import numpy as np
+import torch
+from torch.utils.data import (
+    BatchSampler,
+    DataLoader,
+    Dataset,
+    RandomSampler,
+    SequentialSampler,
+)
+
+from utils.windowing import WindowedSeries
+
+
+class WindowedDataset(Dataset):
+    """
+    Examples (X, y), or (X, y, weights), whose windows are taken from X only when they are
+    requested. X is a WindowedSeries, or an array of windows (n_examples, sequence_len,
+    input_size), e.g., a memory-mapped dataset artifact.
+
+    Indexed with a list of positions, the dataset returns the whole batch, so that each
+    batch is a single gather over the series instead of one per example (see
+    create_windowed_dataloader). With channels_first, the windows are returned as
+    (input_size, sequence_len), the shape nn.Conv1d expects.
+    """
+
+    def __init__(self, X, y, weights=None, channels_first=False, dtype="float64"):
+        assert len(X) == len(y)
+        self.X = X
+        self.y = y
+        self.weights = weights
+        self.channels_first = channels_first
+        self.dtype = dtype
+
+    def __len__(self):
+        return len(self.X)
+
+    def __getitem__(self, idx):
+        if isinstance(self.X, WindowedSeries):
+            X = self.X.take(idx)
+        else:
+            X = self.X[idx]
+        X = torch.from_numpy(np.asarray(X, dtype=self.dtype))
+        if self.channels_first:
+            X = X.transpose(-1, -2).contiguous()
+        y = torch.from_numpy(np.asarray(self.y[idx], dtype=self.dtype))
+
+        if self.weights is None:
+            return X, y
+        return X, y, self.weights[idx]
+
+
+def create_windowed_dataloader(
+    X, y, batch_size, weights=None, channels_first=False, shuffle=True
+):
+    """
+    DataLoader over a WindowedDataset that yields batches of batch_size examples, built
+    when each batch is requested.
+    """
+    ds = WindowedDataset(X, y, weights, channels_first=channels_first)
+    sampler = RandomSampler(ds) if shuffle else SequentialSampler(ds)
+    # batch_size=None turns off the collation of single examples, the dataset receives the
+    # list of positions of each batch from the BatchSampler
+    return DataLoader(
+        ds,
+        sampler=BatchSampler(sampler, batch_size=batch_size, drop_last=False),
+        batch_size=None,
+    )
@@ -5,6 +5,8 @@ import seaborn as sns
 from sklearn.ensemble import GradientBoostingClassifier
 from sklearn.metrics import classification_report, confusion_matrix
 
+from utils import dataset_artifacts
+
 
 def _train_and_test_classifier(X_train, y_train, X_test, y_test):
     print("Shapes before reshaping: ", X_train.shape, X_test.shape)
@@ -68,10 +70,20 @@ def report_results(cm, y_true, y_pred, title=None):
 
 
 def train_and_test_classifier(pipeline_id):
-    filename = f"../data/datasets/{pipeline_id}.pickle"
-    print(f"Loading train/val/test datasets from {filename}.")
-    file = open(filename, "rb")
-    (X_train, y_train, X_val, y_val, X_test, y_test) = pickle.load(file)
+    datasets_dir = "../data/datasets/"
+    if dataset_artifacts.artifact_exists(datasets_dir, pipeline_id):
+        print(
+            f"Loading train/val/test datasets from {dataset_artifacts.get_artifact_dir(datasets_dir, pipeline_id)}."
+        )
+        # copy-on-write, the targets are binarized in place
+        (X_train, y_train, X_val, y_val, X_test, y_test) = (
+            dataset_artifacts.load_datasets(datasets_dir, pipeline_id, mmap_mode="c")
+        )
+    else:
+        filename = f"{datasets_dir}{pipeline_id}.pickle"
+        print(f"Loading train/val/test datasets from {filename}.")
+        file = open(filename, "rb")
+        (X_train, y_train, X_val, y_val, X_test, y_test) = pickle.load(file)
     print(
         f"Shapes of train/val/test data matrices: {X_train.shape}/{X_val.shape}/{X_test.shape}"
     )
@@ -0,0 +1,178 @@
+"""
+Train/val/test dataset artifacts.
+
+An artifact is a folder with one .npy file per array (X_train.npy, y_train.npy, ...) and a
+metadata.json file with the shapes, dtypes, feature names, window size and the statistics of
+each split. The arrays are opened as read-only memory maps, so several trainings and
+evaluations can share the same dataset without each one copying it into RAM.
+
+An X given as a WindowedSeries is stored as its series and window starts
+(series_train.npy, window_starts_train.npy, ...) instead of X_train.npy, so the artifact
+doesn't grow with the window size. It is loaded back as an array of windows, or as a
+WindowedSeries over the memory-mapped series with lazy=True.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+
+from utils.windowing import WindowedSeries
+
+SPLITS = ("train", "val", "test")
+METADATA_FILENAME = "metadata.json"
+
+
+def get_artifact_dir(datasets_dir, pipeline_id):
+    return os.path.join(datasets_dir, pipeline_id)
+
+
+def artifact_exists(datasets_dir, pipeline_id):
+    artifact_dir = get_artifact_dir(datasets_dir, pipeline_id)
+    return os.path.exists(os.path.join(artifact_dir, METADATA_FILENAME))
+
+
+def _get_target_stats(y):
+    if len(y) == 0:
+        return {"count": 0}
+    return {
+        "count": int(len(y)),
+        "min": float(np.min(y)),
+        "max": float(np.max(y)),
+        "mean": float(np.mean(y)),
+        "std": float(np.std(y)),
+        "positives": int(np.count_nonzero(y > 0)),
+    }
+
+
+def _get_features_stats(X):
+    if len(X) == 0:
+        return {}
+    if isinstance(X, WindowedSeries):
+        X = X.series[X.get_rows_in_windows()]
+    return {"min": float(np.min(X)), "max": float(np.max(X))}
+
+
+def save_datasets(
+    datasets_dir,
+    pipeline_id,
+    X_train,
+    y_train,
+    X_val,
+    y_val,
+    X_test,
+    y_test,
+    feature_names=None,
+    window_size=None,
+):
+    """
+    Saves the train/val/test arrays as a dataset artifact. The metadata file is written last,
+    so an artifact without it is an interrupted write and is never loaded.
+    """
+    artifact_dir = get_artifact_dir(datasets_dir, pipeline_id)
+    os.makedirs(artifact_dir, exist_ok=True)
+    metadata_path = os.path.join(artifact_dir, METADATA_FILENAME)
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+
+    arrays = {
+        "train": (X_train, y_train),
+        "val": (X_val, y_val),
+        "test": (X_test, y_test),
+    }
+    metadata = {
+        "pipeline_id": pipeline_id,
+        "feature_names": list(feature_names) if feature_names is not None else None,
+        "window_size": window_size,
+        "splits": {},
+    }
+    for split, (X, y) in arrays.items():
+        for name in ("X", "series", "window_starts"):
+            # an artifact saved again with the other layout of X
+            path = os.path.join(artifact_dir, f"{name}_{split}.npy")
+            if os.path.exists(path):
+                os.remove(path)
+        if isinstance(X, WindowedSeries):
+            X_layout = "windows"
+            np.save(
+                os.path.join(artifact_dir, f"series_{split}.npy"),
+                np.ascontiguousarray(X.series),
+            )
+            np.save(
+                os.path.join(artifact_dir, f"window_starts_{split}.npy"),
+                X.window_starts,
+            )
+        else:
+            X_layout = "array"
+            X = np.ascontiguousarray(X)
+            np.save(os.path.join(artifact_dir, f"X_{split}.npy"), X)
+        y = np.ascontiguousarray(y)
+        np.save(os.path.join(artifact_dir, f"y_{split}.npy"), y)
+        metadata["splits"][split] = {
+            "X_layout": X_layout,
+            "X_shape": list(X.shape),
+            "X_dtype": X.dtype.name,
+            "y_shape": list(y.shape),
+            "y_dtype": y.dtype.name,
+            "features": _get_features_stats(X),
+            "target": _get_target_stats(y),
+        }
+
+    with open(metadata_path, "w") as f:
+        json.dump(metadata, f, indent=4)
+
+    logging.info(
+        f"Dataset artifact for pipeline {pipeline_id} saved in {artifact_dir}."
+    )
+    return artifact_dir
+
+
+def load_metadata(datasets_dir, pipeline_id):
+    artifact_dir = get_artifact_dir(datasets_dir, pipeline_id)
+    with open(os.path.join(artifact_dir, METADATA_FILENAME)) as f:
+        return json.load(f)
+
+
+def _load_X(artifact_dir, split, metadata, mmap_mode, lazy):
+    if metadata["splits"][split].get("X_layout", "array") == "array":
+        return np.load(
+            os.path.join(artifact_dir, f"X_{split}.npy"), mmap_mode=mmap_mode
+        )
+    X = WindowedSeries(
+        np.load(os.path.join(artifact_dir, f"series_{split}.npy"), mmap_mode=mmap_mode),
+        np.load(os.path.join(artifact_dir, f"window_starts_{split}.npy")),
+        metadata["window_size"],
+    )
+    return X if lazy else X.to_array()
+
+
+def load_datasets(datasets_dir, pipeline_id, mmap_mode="r", lazy=False):
+    """
+    Opens the arrays of a dataset artifact, memory-mapped unless mmap_mode is None. With
+    lazy=True, an X stored as its series is returned as a WindowedSeries, whose windows
+    are built when they are used.
+
+    Returns (X_train, y_train, X_val, y_val, X_test, y_test), in the same order as the
+    pickle files written by previous versions of build_datasets.
+    """
+    artifact_dir = get_artifact_dir(datasets_dir, pipeline_id)
+    metadata = load_metadata(datasets_dir, pipeline_id)
+
+    arrays = []
+    for split in SPLITS:
+        for name in ("X", "y"):
+            if name == "X":
+                array = _load_X(artifact_dir, split, metadata, mmap_mode, lazy)
+            else:
+                array = np.load(
+                    os.path.join(artifact_dir, f"y_{split}.npy"), mmap_mode=mmap_mode
+                )
+            expected_shape = tuple(metadata["splits"][split][f"{name}_shape"])
+            if array.shape != expected_shape:
+                raise ValueError(
+                    f"{name}_{split} in {artifact_dir} has shape {array.shape}, expected {expected_shape}."
+                )
+            arrays.append(array)
+
+    return tuple(arrays)
@@ -0,0 +1,19 @@
+"""
+Fingerprint of the files the caches and build manifests are derived from: the size and
+modification time of a file, which tell it changed without reading its contents.
+"""
+
+import os
+from pathlib import Path
+from typing import Optional
+
+
+def get_file_fingerprint(path: Path) -> Optional[list[int]]:
+    """
+    Size and modification time of a file, None when it doesn't exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
@@ -0,0 +1,243 @@
+"""
+Imputation of missing values of station series, configured by a dict like the "imputation"
+entries of the station-system JSON files:
+
+    {
+        "strategy": "interpolate",
+        "params": {"max_gap": 4},
+        "fallback": {"strategy": "knn_window", "params": {"window": 96}}
+    }
+
+The time-local strategies ("interpolate" and "knn_window") only look at the neighborhood in
+time of each missing value, so their cost grows linearly with the length of the series.
+"knn" runs KNNImputer over the whole series instead, comparing each row with missing values
+to every other row, which is quadratic on multi-year series.
+
+The values a strategy can't fill (e.g. gaps longer than max_gap) are handed to its
+"fallback", which is itself an imputation config.
+"""
+
+import logging
+from math import asin, cos, radians, sin, sqrt
+
+import numpy as np
+import pandas as pd
+from sklearn.impute import KNNImputer
+
+DEFAULT_STRATEGY = "knn_window"
+
+# Imputation of the configs without a strategy. The mean fills what knn_window can't, e.g.
+# gaps longer than its window, so every missing value is filled.
+DEFAULT_IMPUTATION = {"strategy": DEFAULT_STRATEGY, "fallback": {"strategy": "mean"}}
+
+
+def get_gap_lengths(mask) -> np.ndarray:
+    """
+    Length of the run of consecutive True values each position of mask belongs to, 0 at the
+    False positions, e.g. [0, 1, 1, 0, 1] -> [0, 2, 2, 0, 1].
+    """
+    mask = np.asarray(mask, dtype=bool)
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = np.zeros(len(mask), dtype=np.int64)
+    lengths[mask] = np.repeat(ends - starts, ends - starts)
+    return lengths
+
+
+def interpolate_gaps(
+    df: pd.DataFrame, max_gap: int = 4, method: str = "linear"
+) -> pd.DataFrame:
+    """
+    Interpolates the runs of at most max_gap consecutive missing values of each column.
+
+    Longer gaps, and the ones at the start or at the end of a column, are left missing, as
+    interpolating them would make up values far from any observation. method is passed to
+    DataFrame.interpolate, "time" weights the values by the timestamps of the index.
+    """
+    result = df.copy()
+    for column in df.columns:
+        series = df[column]
+        mask = series.isna().to_numpy()
+        if not mask.any():
+            continue
+        fillable = mask & (get_gap_lengths(mask) <= max_gap)
+        if not fillable.any():
+            continue
+        interpolated = series.interpolate(method=method, limit_area="inside")
+        result[column] = series.where(~fillable, interpolated)
+    return result
+
+
+def impute_windowed_knn(
+    df: pd.DataFrame,
+    window: int = 96,
+    n_neighbors: int = 2,
+    weights: str = "uniform",
+) -> pd.DataFrame:
+    """
+    KNNImputer restricted to the neighboring rows of each missing value.
+
+    The rows are split in blocks of window rows, and the missing values of each block are
+    imputed by a KNNImputer fitted on the block and on the window rows before and after it,
+    so each row is compared to at most 3 * window rows. Only observed values are used as
+    donors. The columns without any value in the neighborhood of a block are left missing.
+    """
+    values = df.to_numpy(dtype=np.float64)
+    missing = np.isnan(values)
+    if not missing.any():
+        return df
+
+    # the imputed values go to a copy, so the blocks after them only see observed values
+    result = values.copy()
+
+    block_size = max(int(window), 1)
+    missing_rows = np.flatnonzero(missing.any(axis=1))
+    for block_start in np.unique(missing_rows // block_size) * block_size:
+        block_end = min(block_start + block_size, len(values))
+        context_start = max(block_start - block_size, 0)
+        context_end = min(block_end + block_size, len(values))
+        context = values[context_start:context_end]
+        # KNNImputer drops the columns without observed values
+        columns = np.flatnonzero(~np.isnan(context).all(axis=0))
+        if len(columns) == 0:
+            continue
+        imputer = KNNImputer(n_neighbors=n_neighbors, weights=weights)
+        imputed = imputer.fit_transform(context[:, columns])
+        offset = block_start - context_start
+        result[block_start:block_end, columns] = imputed[
+            offset : offset + block_end - block_start
+        ]
+    return pd.DataFrame(result, columns=df.columns, index=df.index)
+
+
+def fill_from_donors(
+    df: pd.DataFrame, donors: list[pd.DataFrame], adjust_bias: bool = False
+) -> pd.DataFrame:
+    """
+    Fills the missing values of each column with the values of the same column of the donor
+    stations at the same timestamps. The donors are tried in order, so the nearest should
+    come first.
+
+    With adjust_bias, the mean difference between the station and the donor, over the
+    timestamps both observed, is added to the values of the donor.
+    """
+    result = df.copy()
+    for donor in donors:
+        donor = donor[~donor.index.duplicated()].reindex(result.index)
+        for column in result.columns.intersection(donor.columns):
+            missing = result[column].isna()
+            if not missing.any():
+                continue
+            donor_values = donor[column]
+            if adjust_bias:
+                both = ~missing & donor_values.notna()
+                if both.any():
+                    donor_values = (
+                        donor_values + (result[column] - donor_values)[both].mean()
+                    )
+            result[column] = result[column].fillna(donor_values)
+    return result
+
+
+def _get_distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    hav = (
+        sin(radians(lat2 - lat1) / 2) ** 2
+        + cos(radians(lat1)) * cos(radians(lat2)) * sin(radians(lon2 - lon1) / 2) ** 2
+    )
+    return 12742 * asin(sqrt(hav))
+
+
+def get_donor_station_ids(
+    station_id: str,
+    stations: dict,
+    candidates,
+    n_donors: int = 3,
+    max_distance_km: float = 30.0,
+) -> list[str]:
+    """
+    The n_donors candidates nearest to the station, at most max_distance_km away, nearest
+    first. stations is the "stations" entry of a station-system JSON, with the latitude and
+    longitude of each station.
+    """
+    station = stations.get(station_id) or {}
+    if station.get("latitude") is None or station.get("longitude") is None:
+        logging.warning(f"No coordinates for station '{station_id}', no donors.")
+        return []
+
+    distances = []
+    for candidate in candidates:
+        candidate_station = stations.get(candidate) or {}
+        if candidate == station_id or candidate_station.get("latitude") is None:
+            continue
+        distance = _get_distance_km(
+            station["latitude"],
+            station["longitude"],
+            candidate_station["latitude"],
+            candidate_station["longitude"],
+        )
+        if distance <= max_distance_km:
+            distances.append((distance, candidate))
+    return [candidate for _, candidate in sorted(distances)[:n_donors]]
+
+
+def apply_imputation(df: pd.DataFrame, imputation_config: dict) -> pd.DataFrame:
+    if df.empty:
+        return df
+    imputation_config = imputation_config or {}
+    if not imputation_config.get("strategy"):
+        imputation_config = {
+            **DEFAULT_IMPUTATION,
+            **imputation_config,
+            "strategy": DEFAULT_STRATEGY,
+        }
+    strategy = imputation_config["strategy"]
+    if not isinstance(strategy, str):
+        logging.warning(
+            f"Invalid imputation strategy '{strategy}'. Skipping imputation."
+        )
+        return df
+    strategy = strategy.lower()
+    params = imputation_config.get("params", {}) or {}
+
+    if strategy == "knn":
+        n_neighbors = params.get("n_neighbors", 2)
+        weights = params.get("weights", "uniform")
+        imputer = KNNImputer(n_neighbors=n_neighbors, weights=weights)
+        imputed = imputer.fit_transform(df)
+        df = pd.DataFrame(imputed, columns=df.columns, index=df.index)
+    elif strategy == "knn_window":
+        df = impute_windowed_knn(
+            df,
+            window=params.get("window", 96),
+            n_neighbors=params.get("n_neighbors", 2),
+            weights=params.get("weights", "uniform"),
+        )
+    elif strategy == "interpolate":
+        df = interpolate_gaps(
+            df,
+            max_gap=params.get("max_gap", 4),
+            method=params.get("method", "linear"),
+        )
+    elif strategy in {"ffill_then_zero", "forward_then_zero"}:
+        df = df.ffill().fillna(0.0)
+    elif strategy in {"ffill", "forward"}:
+        df = df.ffill()
+    elif strategy in {"bfill", "backward"}:
+        df = df.bfill()
+    elif strategy in {"zero", "zeros"}:
+        df = df.fillna(0.0)
+    elif strategy == "mean":
+        df = df.fillna(df.mean())
+    elif strategy in {"none", "skip"}:
+        return df
+    else:
+        logging.warning(
+            f"Unknown imputation strategy '{strategy}'. Skipping imputation."
+        )
+        return df
+
+    fallback = imputation_config.get("fallback")
+    if fallback and df.isna().values.any():
+        df = apply_imputation(df, fallback)
+    return df
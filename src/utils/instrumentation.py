@@ -0,0 +1,200 @@
+"""
+Opt-in timing and resource instrumentation of the stages of a pipeline run.
+
+It's enabled by setting the TRACE_DIR environment variable to a folder. Each run of an
+instrumented entry point then writes a JSON Lines trace file to that folder, with a header
+record and one record per stage:
+
+    {"type": "stage", "name": "windowing", "path": "build_datasets/windowing",
+     "wall_time_s": ..., "cpu_time_s": ..., "max_rss_bytes": ..., "bytes_read": ...,
+     "bytes_written": ..., "rows": ..., "files": ..., "status": "ok", ...}
+
+CPU time includes the child processes that finished during the stage, the RSS is the
+process high-water mark at the end of the stage and the bytes read/written are the I/O of
+the process (from /proc/self/io, so None on other platforms). Rows and files are counted by
+the stage itself, with Stage.add.
+
+Without TRACE_DIR, run() and stage() do nothing, so the entry points can always use them.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+TRACE_DIR_ENV = "TRACE_DIR"
+
+
+class Stage:
+    def __init__(self, name: str, path: str, counters: dict) -> None:
+        self.name = name
+        self.path = path
+        self.counters = dict(counters)
+
+    def add(self, **counters) -> None:
+        """
+        Adds to the counters of the stage, e.g. stage.add(rows=len(df), files=1)
+        """
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+class _NullStage(Stage):
+    def __init__(self) -> None:
+        super().__init__("", "", {})
+
+    def add(self, **counters) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Run:
+    def __init__(self, name: str, trace_path: str) -> None:
+        self.name = name
+        self.trace_path = trace_path
+        self.file = open(trace_path, "w")
+        self.stack: list[Stage] = []
+
+    def write(self, record: dict) -> None:
+        self.file.write(json.dumps(record, default=str) + "\n")
+        # a run that crashes keeps the records of the stages that finished
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+_run = None
+
+
+def is_enabled() -> bool:
+    return _run is not None
+
+
+def get_trace_path():
+    return _run.trace_path if _run is not None else None
+
+
+def _get_cpu_time() -> float:
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _get_max_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    factor = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * factor,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * factor,
+    }
+
+
+def _get_io_bytes():
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+@contextmanager
+def stage(name: str, **counters):
+    """
+    Measures the block as a stage of the current run:
+
+        with instrumentation.stage("load_station", files=1) as s:
+            df = pd.read_parquet(filename)
+            s.add(rows=len(df))
+
+    Stages can be nested, the path of a stage has the names of the enclosing ones.
+    """
+    if _run is None:
+        yield _NULL_STAGE
+        return
+
+    path = "/".join([s.name for s in _run.stack] + [name])
+    current = Stage(name, path, counters)
+    started_at = datetime.now().isoformat()
+    start_wall = time.perf_counter()
+    start_cpu = _get_cpu_time()
+    start_io = _get_io_bytes()
+    status = "ok"
+    _run.stack.append(current)
+    try:
+        yield current
+    except BaseException as e:
+        status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        _run.stack.pop()
+        end_io = _get_io_bytes()
+        io = (
+            {
+                "bytes_read": end_io[0] - start_io[0],
+                "bytes_written": end_io[1] - start_io[1],
+            }
+            if start_io is not None and end_io is not None
+            else {"bytes_read": None, "bytes_written": None}
+        )
+        _run.write(
+            {
+                "type": "stage",
+                "run": _run.name,
+                "name": name,
+                "path": path,
+                "depth": len(_run.stack),
+                "started_at": started_at,
+                "wall_time_s": time.perf_counter() - start_wall,
+                "cpu_time_s": _get_cpu_time() - start_cpu,
+                "max_rss_bytes": _get_max_rss_bytes(),
+                **io,
+                **current.counters,
+                "status": status,
+            }
+        )
+
+
+@contextmanager
+def run(name: str, **attributes):
+    """
+    Starts the trace file of a run of an entry point when TRACE_DIR is set. The whole run is
+    measured as its root stage. A run inside another run is a stage of the outer one.
+    """
+    global _run
+    trace_dir = os.getenv(TRACE_DIR_ENV)
+    if not trace_dir or _run is not None:
+        with stage(name) as root:
+            yield root
+        return
+
+    os.makedirs(trace_dir, exist_ok=True)
+    trace_path = os.path.join(
+        trace_dir,
+        f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{os.getpid()}.jsonl",
+    )
+    _run = _Run(name, trace_path)
+    try:
+        _run.write(
+            {
+                "type": "run",
+                "name": name,
+                "started_at": datetime.now().isoformat(),
+                "pid": os.getpid(),
+                "argv": sys.argv,
+                "attributes": attributes,
+            }
+        )
+        with stage(name) as root:
+            yield root
+    finally:
+        _run.close()
+        _run = None
@@ -9,6 +9,7 @@ from metpy.calc import wind_components
 from metpy.units import units
 
 from config import globals
+from utils.windowing import find_contiguous_block_bounds
 
 
 def split_filename(full_filename):
@@ -223,13 +224,24 @@ def add_datetime_index(station_id, df):
     return df
 
 
-def add_wind_related_features(station_id, df):
-    df["wind_direction_u"] = df.apply(
-        lambda x: transform_wind(x.wind_speed, x.wind_dir, 0), axis=1
-    )
-    df["wind_direction_v"] = df.apply(
-        lambda x: transform_wind(x.wind_speed, x.wind_dir, 1), axis=1
+def get_wind_components(wind_speed, wind_direction):
+    """
+    Computes the U and V wind vector components of whole columns of speeds and directions,
+    with a single call to wind_components (same values as transform_wind for each row).
+    Missing values, including the pd.NA of nullable columns, give NaN components.
+    """
+    wind_speed = pd.Series(wind_speed).to_numpy(dtype=np.float64, na_value=np.nan)
+    wind_direction = pd.Series(wind_direction).to_numpy(
+        dtype=np.float64, na_value=np.nan
     )
+    u, v = wind_components(wind_speed * units("m/s"), wind_direction * units.deg)
+    return u.magnitude, v.magnitude
+
+
+def add_wind_related_features(station_id, df):
+    u, v = get_wind_components(df["wind_speed"], df["wind_dir"])
+    df["wind_direction_u"] = u
+    df["wind_direction_v"] = v
     return df
 
 
@@ -291,15 +303,9 @@ def find_contiguous_observation_blocks(df: pd.DataFrame):
     """
     timestamp_range = df.index
     assert len(timestamp_range) > 1
-    first = last = timestamp_range[0]
-    for n in timestamp_range[1:]:
-        previous = n - timedelta(hours=1, minutes=0)
-        if previous == last:  # Part of the current block, bump the end
-            last = n
-        else:  # Not part of the current block; yield current block and start a new one
-            yield first, last
-            first = last = n
-    yield first, last  # Yield the last block
+    starts, ends = find_contiguous_block_bounds(timestamp_range.values)
+    for start, end in zip(starts, ends):
+        yield timestamp_range[start], timestamp_range[end]
 
 
 def get_relevant_variables(station_id):
@@ -1,4 +1,159 @@
 import numpy as np
+import pandas as pd
+
+ONE_HOUR = np.timedelta64(1, "h")
+
+
+def find_contiguous_block_bounds(timestamps, step=ONE_HOUR):
+    """
+    Positions of the first and last timestamps of each block of timestamps that are
+    exactly `step` apart of each other, found with a single np.diff over the timestamps.
+
+    Returns two int arrays (starts, ends), the bounds are inclusive.
+    """
+    timestamps = np.asarray(timestamps)
+    if len(timestamps) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    gaps = np.flatnonzero(np.diff(timestamps) != step)
+    starts = np.concatenate([[0], gaps + 1])
+    ends = np.concatenate([gaps, [len(timestamps) - 1]])
+    return starts, ends
+
+
+def get_block_windows(arr, block_starts, block_ends, window_size, target_idx):
+    """
+    Yields, for each block with more than window_size rows, the windows of the block as a
+    (n_windows, window_size, n_features) strided view over arr (no copy) and the targets,
+    i.e., the target_idx column of the row right after each window.
+    """
+    for start, end in zip(block_starts, block_ends):
+        block = arr[start : end + 1]
+        n_windows = len(block) - window_size
+        if n_windows <= 0:
+            continue
+        windows = np.lib.stride_tricks.sliding_window_view(block, window_size, axis=0)
+        yield windows[:n_windows].transpose(0, 2, 1), block[window_size:, target_idx]
+
+
+def apply_block_windowing(arr, block_starts, block_ends, window_size, target_idx):
+    """
+    Same windows of apply_windowing applied to each block, copied once into preallocated X and y.
+    """
+    lengths = np.asarray(block_ends) - np.asarray(block_starts) + 1
+    total_windows = int(np.maximum(lengths - window_size, 0).sum())
+
+    X = np.empty((total_windows, window_size, arr.shape[1]), dtype=arr.dtype)
+    y = np.empty((total_windows, 1), dtype=arr.dtype)
+
+    offset = 0
+    for windows, targets in get_block_windows(
+        arr, block_starts, block_ends, window_size, target_idx
+    ):
+        X[offset : offset + len(windows)] = windows
+        y[offset : offset + len(windows), 0] = targets
+        offset += len(windows)
+
+    assert not np.isnan(y).any()
+    return X, y
+
+
+def get_window_starts(block_starts, block_ends, window_size):
+    """
+    Rows of arr where the windows of apply_block_windowing start, in the same order.
+    """
+    lengths = np.asarray(block_ends) - np.asarray(block_starts) + 1
+    n_windows = np.maximum(lengths - window_size, 0)
+    # the position of each window in its block, added to the start of the block
+    block_offsets = np.repeat(np.cumsum(n_windows) - n_windows, n_windows)
+    positions = np.arange(n_windows.sum()) - block_offsets
+    return np.repeat(np.asarray(block_starts, dtype=np.int64), n_windows) + positions
+
+
+class WindowedSeries:
+    """
+    Windows of a time series built on demand, instead of copied into a
+    (n_windows, window_size, n_features) array. The series is kept once, as
+    (n_rows, n_features), along with the row where each window starts, so its size
+    doesn't grow with window_size.
+
+    Indexing with a slice or an array of positions selects windows without copying the
+    series, the way subsampling selects examples of X. take() builds the selected windows
+    as an array, with a single gather over the series.
+    """
+
+    def __init__(self, series, window_starts, window_size):
+        self.series = series
+        self.window_starts = np.asarray(window_starts, dtype=np.int64)
+        self.window_size = window_size
+        self._offsets = np.arange(window_size)
+
+    def __len__(self):
+        return len(self.window_starts)
+
+    @property
+    def shape(self):
+        return (len(self), self.window_size, self.series.shape[1])
+
+    @property
+    def dtype(self):
+        return self.series.dtype
+
+    def __getitem__(self, idx):
+        if np.isscalar(idx):
+            return self.take(idx)
+        return WindowedSeries(self.series, self.window_starts[idx], self.window_size)
+
+    def take(self, idx):
+        rows = self.window_starts[idx][..., np.newaxis] + self._offsets
+        return np.asarray(self.series[rows])
+
+    def to_array(self):
+        return self.take(slice(None))
+
+    def __array__(self, dtype=None, copy=None):
+        X = self.to_array()
+        return X if dtype is None else X.astype(dtype)
+
+    def get_rows_in_windows(self):
+        """
+        Mask of the rows of the series that are in at least one window
+        """
+        changes = np.zeros(len(self.series) + 1, dtype=np.int64)
+        np.add.at(changes, self.window_starts, 1)
+        np.add.at(changes, self.window_starts + self.window_size, -1)
+        return np.cumsum(changes[:-1]) > 0
+
+
+def apply_lazy_block_windowing(arr, block_starts, block_ends, window_size, target_idx):
+    """
+    Same windows and targets of apply_block_windowing, with X as a WindowedSeries over arr.
+    """
+    window_starts = get_window_starts(block_starts, block_ends, window_size)
+    y = arr[window_starts + window_size, target_idx].reshape(-1, 1)
+    assert not np.isnan(y).any()
+    return WindowedSeries(arr, window_starts, window_size), y
+
+
+def apply_sliding_window(df, target_idx: int, window_size: int, lazy: bool = False):
+    """
+    This function applies the sliding window preprocessing technique to generate data and response
+    matrices (that is, X and y) from an input time series represented as a pandas DataFrame. This
+    DataFrame is supposed to have a datetime index that corresponds to the timestamps in the time series.
+
+    @see: https://stackoverflow.com/questions/8269916/what-is-sliding-window-algorithm-examples
+
+    Note that this function takes the eventual existence of gaps in the input time series
+    into account. In particular, the windowing operation is performed in each separate
+    contiguous block of observations.
+
+    With lazy=True, X is a WindowedSeries over the rows of df, whose windows are built when
+    they are used, so its size doesn't grow with window_size.
+    """
+    block_starts, block_ends = find_contiguous_block_bounds(df.index.values)
+    block_windowing = apply_lazy_block_windowing if lazy else apply_block_windowing
+    return block_windowing(
+        df.to_numpy(), block_starts, block_ends, window_size, target_idx
+    )
 
 
 def apply_windowing(X, initial_time_step, max_time_step, window_size, target_idx):
@@ -21,27 +176,6 @@ def apply_windowing(X, initial_time_step, max_time_step, window_size, target_idx
         X[window_size : (max_time_step + window_size + 1) : 1, target_idx],
     )
 
-    idx_y_train_not_nan = np.where(~np.isnan(y_temp))[0]
-    assert len(idx_y_train_not_nan) == len(y_temp)
-
-    np.unique(np.where(np.isnan(X_temp)))
-    # assert len(x_train_is_nan_idx) == len(y_temp)
-
-    # print(f'X.shape: {X.shape}')
-    # print(f'Shapes before filtering: {X_temp.shape}, {y_temp.shape}')
-
-    np.where(y_temp > 0)[0]
-
-    # if only_y_gt_zero:
-    #     y_train_gt_zero_idx = np.where(y_temp > 0)[0]
-    #     idxs = np.intersect1d(y_train_not_nan_idx, y_train_gt_zero_idx)
-    #     idxs = np.setdiff1d(idxs, x_train_is_nan_idx)
-    #     X_temp, y_temp = X_temp[idxs], y_temp[idxs]
-
-    # print(f'y_train_not_nan_idx.shape: {idx_y_train_not_nan.shape}')
-    # print(f'y_train_gt_zero_idx.shape: {idx_y_train_gt_zero.shape}')
-    # print(f'x_train_is_nan_idx.shape: {idx_y_train_not_nan.shape}')
-    # print(f'Shapes after filtering: {X_temp.shape}, {y_temp.shape}')
-    # print()
+    assert not np.isnan(y_temp).any()
 
     return X_temp, y_temp
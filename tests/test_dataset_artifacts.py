@@ -0,0 +1,68 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from utils import dataset_artifacts
+from utils.windowing import WindowedSeries
+
+
+class TestDatasetArtifacts(unittest.TestCase):
+    def test_save_and_load_datasets(self):
+        rng = np.random.default_rng(0)
+        arrays = []
+        for n in (10, 4, 3):
+            arrays.append(rng.random((n, 6, 2)))
+            arrays.append(rng.random((n, 1)))
+
+        with tempfile.TemporaryDirectory() as datasets_dir:
+            self.assertFalse(dataset_artifacts.artifact_exists(datasets_dir, "A652"))
+            dataset_artifacts.save_datasets(
+                datasets_dir, "A652", *arrays, feature_names=["a", "b"], window_size=6
+            )
+            self.assertTrue(dataset_artifacts.artifact_exists(datasets_dir, "A652"))
+
+            loaded = dataset_artifacts.load_datasets(datasets_dir, "A652")
+            for array, loaded_array in zip(arrays, loaded):
+                self.assertIsInstance(loaded_array, np.memmap)
+                self.assertTrue(np.array_equal(array, loaded_array))
+
+            metadata = dataset_artifacts.load_metadata(datasets_dir, "A652")
+            self.assertEqual(metadata["feature_names"], ["a", "b"])
+            self.assertEqual(metadata["window_size"], 6)
+            self.assertEqual(metadata["splits"]["val"]["X_shape"], [4, 6, 2])
+            self.assertAlmostEqual(
+                metadata["splits"]["train"]["target"]["max"], arrays[1].max()
+            )
+
+    def test_windowed_series_is_stored_as_its_series(self):
+        rng = np.random.default_rng(0)
+        series = rng.random((20, 2))
+        windows = WindowedSeries(series, [0, 1, 2, 10, 11], 4)
+        arrays = []
+        for n in (5, 2, 2):
+            arrays.append(windows[:n])
+            arrays.append(rng.random((n, 1)))
+
+        with tempfile.TemporaryDirectory() as datasets_dir:
+            dataset_artifacts.save_datasets(
+                datasets_dir, "A652", *arrays, window_size=4
+            )
+            lazy = dataset_artifacts.load_datasets(datasets_dir, "A652", lazy=True)
+            loaded = dataset_artifacts.load_datasets(datasets_dir, "A652")
+            metadata = dataset_artifacts.load_metadata(datasets_dir, "A652")
+
+            self.assertIsInstance(lazy[0], WindowedSeries)
+            self.assertIsInstance(lazy[0].series, np.memmap)
+            for array, lazy_array, loaded_array in zip(arrays, lazy, loaded):
+                self.assertTrue(np.array_equal(np.asarray(array), loaded_array))
+                self.assertTrue(np.array_equal(np.asarray(lazy_array), loaded_array))
+        self.assertEqual(metadata["splits"]["train"]["X_shape"], [5, 4, 2])
+        self.assertEqual(
+            metadata["splits"]["train"]["features"]["max"],
+            windows.to_array().max(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from era5.era5_station_series import (
+    LEVELS,
+    VARIABLES,
+    Era5StationSeriesCache,
+    get_column_names,
+)
+
+
+def write_era5(path: Path, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2020-01-01", periods=24, freq="h")
+    levels = [100, 200, 500, 700, 850, 1000]
+    lats = np.arange(-22.0, -23.01, -0.25)
+    lons = np.arange(-44.0, -41.99, 0.25)
+    shape = (len(times), len(levels), len(lats), len(lons))
+    data = {
+        variable: (
+            ("time", "level", "latitude", "longitude"),
+            rng.normal(size=shape).astype(np.float32),
+        )
+        for variable in VARIABLES
+    }
+    data["z"][1][3, :, 2, 3] = np.nan
+    xr.Dataset(
+        data,
+        coords={"time": times, "level": levels, "latitude": lats, "longitude": lons},
+    ).to_netcdf(path)
+
+
+class TestEra5StationSeriesCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.era5_path = self.root / "ERA5.nc"
+        write_era5(self.era5_path)
+        self.cache = Era5StationSeriesCache(self.era5_path, self.root / "cache")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_series_matches_selection_per_level(self):
+        latitude, longitude = -22.51, -43.27
+        df = self.cache.get_series("A601", latitude, longitude)
+
+        with xr.open_dataset(self.era5_path) as ds:
+            expected = {}
+            for level in LEVELS:
+                at_level = ds.sel(
+                    level=level,
+                    latitude=latitude,
+                    longitude=longitude,
+                    method="nearest",
+                )
+                for variable, name in VARIABLES.items():
+                    expected[f"{name}_{level}"] = at_level[variable].values
+            expected = pd.DataFrame(expected, index=ds.time.values).dropna(how="any")
+
+        self.assertEqual(list(df.columns), get_column_names())
+        self.assertEqual(len(df), 23)
+        np.testing.assert_array_equal(df.to_numpy(), expected.to_numpy())
+        np.testing.assert_array_equal(df.index.values, expected.index.values)
+
+    def test_cached_series_is_read_without_opening_era5(self):
+        first = self.cache.get_series("A601", -22.51, -43.27)
+        with mock.patch("xarray.open_dataset") as open_dataset:
+            second = self.cache.get_series("A601", -22.51, -43.27)
+        open_dataset.assert_not_called()
+        pd.testing.assert_frame_equal(first, second, check_freq=False)
+
+    def test_changed_era5_file_is_extracted_again(self):
+        first = self.cache.get_series("A601", -22.51, -43.27)
+        write_era5(self.era5_path, seed=1)
+        stat = os.stat(self.era5_path)
+        os.utime(self.era5_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        second = self.cache.get_series("A601", -22.51, -43.27)
+
+        self.assertFalse(np.array_equal(first.to_numpy(), second.to_numpy()))
+        # the series of the previous file was replaced
+        self.assertEqual(len(list((self.root / "cache").glob("A601_*.parquet"))), 1)
+
+    def test_get_many_keeps_stations_with_common_prefixes(self):
+        series = self.cache.get_many(
+            {"sao": (-22.51, -43.27), "sao_cristovao": (-22.9, -43.2)}
+        )
+        self.assertEqual(set(series), {"sao", "sao_cristovao"})
+        self.cache.get_series("sao", -22.26, -43.27)
+        self.assertEqual(
+            len(list((self.root / "cache").glob("sao_cristovao_*.parquet"))), 1
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from surface_stations import fusion_sources
+
+
+class TestAlignment(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.index = pd.date_range("2020-01-01", periods=48, freq="h")[
+            rng.random(48) > 0.2
+        ]
+        self.rng = rng
+
+    def test_sounding_indices_match_the_merged_interpolation(self):
+        times = pd.date_range("2019-12-31 12:00", periods=5, freq="12h")
+        df_as = pd.DataFrame(
+            {
+                column: self.rng.normal(size=len(times))
+                for column in fusion_sources.SOUNDING_INTERPOLATED_COLUMNS
+            },
+            index=times,
+        )
+        df_wsoi = pd.DataFrame({"temperature": 1.0}, index=self.index)
+
+        aligned = fusion_sources.align_sounding_indices(df_as, self.index)
+
+        expected = pd.merge(
+            df_wsoi, df_as, how="left", left_index=True, right_index=True
+        )
+        expected["asi_idx_missing"] = expected.isnull().any(axis=1).astype(np.int64)
+        for column in fusion_sources.SOUNDING_INTERPOLATED_COLUMNS:
+            expected[column] = expected[column].interpolate(method="linear")
+        expected = expected.bfill().drop(columns="temperature")
+        pd.testing.assert_frame_equal(aligned, expected, check_freq=False)
+
+    def test_tpw_keeps_only_the_timestamps_with_tpw_data(self):
+        df_tpw = pd.DataFrame(
+            {"tpw_value": [1.0, np.nan, 3.0]}, index=self.index[[2, 3, 4]]
+        )
+
+        aligned = fusion_sources.align_tpw(df_tpw, self.index)
+
+        self.assertTrue(aligned.index.equals(self.index[[2, 3, 4]]))
+        np.testing.assert_array_equal(aligned["tpw_value"], [1.0, 2.0, 3.0])
+        np.testing.assert_array_equal(aligned["tpw_idx_missing"], [0, 1, 0])
+
+
+class TestReadParquetRange(unittest.TestCase):
+    def test_reads_the_columns_in_the_time_range(self):
+        index = pd.date_range("2020-01-01", periods=5000, freq="h", name="timestamp")
+        df = pd.DataFrame(
+            {"a": np.arange(5000.0), "b": -np.arange(5000.0)}, index=index
+        )
+        start, end = index[1200], index[3100]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "dsi.parquet")
+            df.to_parquet(path, row_group_size=1000)
+
+            result = fusion_sources.read_parquet_range(path, ["b"], start, end)
+            # the bounds of alertario stations are in UTC
+            utc = fusion_sources.read_parquet_range(
+                path, ["b"], start.tz_localize("UTC"), end.tz_localize("UTC")
+            )
+
+        pd.testing.assert_frame_equal(
+            result, df.loc[start:end, ["b"]], check_freq=False
+        )
+        pd.testing.assert_frame_equal(utc, result)
+
+
+class TestAlignedSourceStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.source_path = self.root / "source.parquet"
+        self.source_path.write_bytes(b"1")
+        self.store = fusion_sources.AlignedSourceStore(self.root / "aligned")
+        self.index = pd.date_range("2020-01-01", periods=4, freq="h")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _get(self, index, value):
+        return self.store.get(
+            "A652",
+            "R",
+            index,
+            [self.source_path],
+            lambda: pd.DataFrame({"cape": value}, index=index),
+        )
+
+    def test_aligned_source_is_stored(self):
+        first = self._get(self.index, 1.0)
+        align = mock.Mock()
+        second = self.store.get("A652", "R", self.index, [self.source_path], align)
+        align.assert_not_called()
+        pd.testing.assert_frame_equal(first, second, check_freq=False)
+
+    def test_changed_source_file_is_aligned_again(self):
+        self._get(self.index, 1.0)
+        self._get(self.index[:2], 1.0)
+        self.source_path.write_bytes(b"22")
+
+        result = self._get(self.index, 2.0)
+
+        np.testing.assert_array_equal(result["cape"], 2.0)
+        # the entry of the previous file was replaced, the one of the other time axis kept
+        self.assertEqual(len(list((self.root / "aligned" / "A652").iterdir())), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.impute import KNNImputer
+
+from utils import imputation
+
+
+class TestImputation(unittest.TestCase):
+    def setUp(self):
+        self.index = pd.date_range("2020-01-01", periods=12, freq="15min")
+
+    def test_get_gap_lengths(self):
+        mask = [False, True, True, False, True, False, True, True, True]
+        lengths = imputation.get_gap_lengths(mask)
+        self.assertTrue(np.array_equal(lengths, [0, 2, 2, 0, 1, 0, 3, 3, 3]))
+
+    def test_interpolate_gaps_fills_only_short_inner_gaps(self):
+        values = [np.nan, 1.0, np.nan, 3.0, np.nan, np.nan, np.nan, 7.0]
+        df = pd.DataFrame({"m15": values}, index=self.index[: len(values)])
+
+        result = imputation.interpolate_gaps(df, max_gap=2)
+
+        expected = [np.nan, 1.0, 2.0, 3.0, np.nan, np.nan, np.nan, 7.0]
+        np.testing.assert_array_equal(result["m15"].to_numpy(), expected)
+        # the input is left as it was
+        self.assertEqual(df["m15"].isna().sum(), 5)
+
+    def test_windowed_knn_matches_knn_imputer_within_the_window(self):
+        rng = np.random.default_rng(0)
+        values = rng.normal(size=(12, 3))
+        values[[1, 5, 10], [0, 2, 1]] = np.nan
+        df = pd.DataFrame(values, index=self.index, columns=["a", "b", "c"])
+
+        result = imputation.impute_windowed_knn(df, window=len(df))
+
+        expected = KNNImputer(n_neighbors=2).fit_transform(values)
+        np.testing.assert_allclose(result.to_numpy(), expected)
+
+    def test_windowed_knn_uses_only_neighboring_rows(self):
+        values = np.array([100.0] * 4 + [1.0] * 4 + [np.nan] + [1.0] * 3)
+        df = pd.DataFrame({"m15": values}, index=self.index)
+
+        # blocks of 2 rows, the missing value only sees the rows 4 to 11
+        result = imputation.impute_windowed_knn(df, window=2)
+
+        self.assertEqual(result["m15"].iloc[8], 1.0)
+        self.assertFalse(result["m15"].isna().any())
+
+    def test_windowed_knn_leaves_values_without_neighbors_missing(self):
+        values = np.array([1.0] + [np.nan] * 10 + [1.0])
+        df = pd.DataFrame({"m15": values}, index=self.index)
+
+        result = imputation.impute_windowed_knn(df, window=2)
+
+        self.assertTrue(result["m15"].iloc[5:7].isna().all())
+        self.assertEqual(result["m15"].iloc[1], 1.0)
+
+    def test_fill_from_donors_in_order(self):
+        df = pd.DataFrame(
+            {"temperature": [20.0, np.nan, np.nan, 23.0]}, index=self.index[:4]
+        )
+        nearest = pd.DataFrame(
+            {"temperature": [21.0, np.nan, 11.0]}, index=self.index[:3]
+        )
+        farthest = pd.DataFrame(
+            {"temperature": [0.0, 5.0, 6.0, 7.0]}, index=self.index[:4]
+        )
+
+        result = imputation.fill_from_donors(df, [nearest, farthest])
+        np.testing.assert_array_equal(result["temperature"], [20.0, 5.0, 11.0, 23.0])
+
+        result = imputation.fill_from_donors(df, [nearest], adjust_bias=True)
+        # the station is 1 degree colder than the donor when both observed
+        np.testing.assert_array_equal(result["temperature"], [20.0, np.nan, 10.0, 23.0])
+
+    def test_get_donor_station_ids_nearest_first(self):
+        stations = {
+            "a": {"latitude": -22.90, "longitude": -43.20},
+            "b": {"latitude": -22.95, "longitude": -43.20},
+            "c": {"latitude": -22.91, "longitude": -43.20},
+            "d": {"latitude": -23.90, "longitude": -43.20},
+            "e": {"latitude": None, "longitude": None},
+        }
+        donors = imputation.get_donor_station_ids(
+            "a", stations, sorted(stations), n_donors=3, max_distance_km=30.0
+        )
+        self.assertEqual(donors, ["c", "b"])
+
+    def test_apply_imputation_hands_what_is_left_to_the_fallback(self):
+        values = [np.nan, 1.0, np.nan, 3.0, np.nan, np.nan, np.nan, 7.0]
+        df = pd.DataFrame({"m15": values}, index=self.index[: len(values)])
+        config = {
+            "strategy": "interpolate",
+            "params": {"max_gap": 1},
+            "fallback": {"strategy": "zero"},
+        }
+
+        result = imputation.apply_imputation(df, config)
+
+        expected = [0.0, 1.0, 2.0, 3.0, 0.0, 0.0, 0.0, 7.0]
+        np.testing.assert_array_equal(result["m15"].to_numpy(), expected)
+
+    def test_default_imputation_fills_gaps_without_neighbors(self):
+        index = pd.date_range("2020-01-01", periods=1000, freq="15min")
+        values = np.concatenate([[1.0, 2.0], [np.nan] * 800, np.arange(198.0)])
+        df = pd.DataFrame({"m15": values, "m30": 1.0}, index=index)
+
+        for config in (None, {}, {"strategy": None}):
+            result = imputation.apply_imputation(df, config)
+            self.assertFalse(result.isna().values.any())
+        # the middle of the gap has no neighbors in the window of knn_window
+        windowed = imputation.impute_windowed_knn(df)
+        self.assertTrue(np.isnan(windowed["m15"].iloc[400]))
+        self.assertEqual(result["m15"].iloc[400], windowed["m15"].mean())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import instrumentation
+
+
+def read_trace(trace_dir):
+    (filename,) = os.listdir(trace_dir)
+    with open(os.path.join(trace_dir, filename)) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_disabled_without_trace_dir(self):
+        with mock.patch.dict(os.environ, {}, clear=False):
+            os.environ.pop(instrumentation.TRACE_DIR_ENV, None)
+            with instrumentation.run("pipeline"):
+                self.assertFalse(instrumentation.is_enabled())
+                with instrumentation.stage("load", files=1) as stage:
+                    stage.add(rows=10)
+                self.assertIsNone(instrumentation.get_trace_path())
+
+    def test_run_writes_stage_records(self):
+        with tempfile.TemporaryDirectory() as trace_dir:
+            with mock.patch.dict(
+                os.environ, {instrumentation.TRACE_DIR_ENV: trace_dir}
+            ):
+                with instrumentation.run("pipeline", station_id="A652"):
+                    with instrumentation.stage("load", files=1) as stage:
+                        stage.add(rows=10)
+                        stage.add(rows=5)
+                        with instrumentation.stage("parse"):
+                            pass
+                    with self.assertRaises(ValueError):
+                        with instrumentation.stage("save"):
+                            raise ValueError()
+            self.assertFalse(instrumentation.is_enabled())
+
+            header, parse, load, save, root = read_trace(trace_dir)
+
+        self.assertEqual(header["type"], "run")
+        self.assertEqual(header["attributes"], {"station_id": "A652"})
+
+        self.assertEqual(parse["path"], "pipeline/load/parse")
+        self.assertEqual(parse["depth"], 2)
+        self.assertEqual(load["path"], "pipeline/load")
+        self.assertEqual((load["files"], load["rows"]), (1, 15))
+        self.assertEqual(load["status"], "ok")
+        self.assertGreaterEqual(load["wall_time_s"], parse["wall_time_s"])
+        self.assertEqual(save["status"], "error: ValueError")
+        self.assertEqual(root["path"], "pipeline")
+        self.assertEqual(root["depth"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
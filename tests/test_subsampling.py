@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from surface_stations import subsampling
+from utils import windowing
+
+
+class TestNegativeSubsampling(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        arr = rng.normal(size=(1200, 3))
+        # precipitation in a tenth of the rows, more likely with high values of feature 1
+        rains = rng.random(1200) < 0.05 + 0.1 * (arr[:, 1] > 0.5)
+        arr[:, 0] = np.where(rains, rng.random(1200), 0.0)
+        self.X, self.y = windowing.apply_lazy_block_windowing(
+            arr, np.array([0, 700]), np.array([650, 1199]), 3, 0
+        )
+
+    def test_windowed_series_and_array_sample_the_same_examples(self):
+        X_lazy, y_lazy = subsampling.apply_negative_subsampling(
+            self.X, self.y, chunk_size=100
+        )
+        X, y = subsampling.apply_negative_subsampling(
+            self.X.to_array(), self.y, chunk_size=None
+        )
+
+        self.assertIsInstance(X_lazy, windowing.WindowedSeries)
+        self.assertTrue(np.array_equal(X_lazy.to_array(), X))
+        self.assertTrue(np.array_equal(y_lazy, y))
+        self.assertEqual(np.count_nonzero(y > 0), np.count_nonzero(y == 0))
+
+    def test_scores_are_read_from_the_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = subsampling.apply_negative_subsampling(
+                self.X, self.y, cache_dir=cache_dir
+            )
+            with mock.patch.object(subsampling, "train_pilot_model") as train:
+                second = subsampling.apply_negative_subsampling(
+                    self.X, self.y, cache_dir=cache_dir
+                )
+            train.assert_not_called()
+
+        self.assertTrue(np.array_equal(first[0].window_starts, second[0].window_starts))
+        self.assertTrue(np.array_equal(first[1], second[1]))
+
+    def test_fingerprint_changes_with_the_dataset(self):
+        fingerprint = subsampling.get_dataset_fingerprint(self.X, self.y)
+        self.assertEqual(
+            fingerprint, subsampling.get_dataset_fingerprint(self.X[:], self.y)
+        )
+        self.assertNotEqual(
+            fingerprint, subsampling.get_dataset_fingerprint(self.X[1:], self.y[1:])
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from goes16 import warp_geometry
+
+
+def build_lon_lat_geometry(pixel_size, spatial_resolution, extent):
+    """
+    Geometry of a source grid of pixel_size degrees, in longitude and latitude, with its
+    north-west corner at the one of extent, as build_warp_geometry builds it
+    """
+    xsize = round((extent[2] - extent[0]) / pixel_size)
+    ysize = round((extent[3] - extent[1]) / pixel_size)
+    cols, rows = np.meshgrid(np.arange(xsize) + 0.5, np.arange(ysize) + 0.5)
+    pixel_lon_lat = np.column_stack(
+        [extent[0] + cols.ravel() * pixel_size, extent[3] - rows.ravel() * pixel_size]
+    )
+
+    center_lon, center_lat = warp_geometry.get_cell_centers(spatial_resolution, extent)
+    center_cols = np.floor((center_lon - extent[0]) / pixel_size).astype(np.int64)
+    center_rows = np.floor((extent[3] - center_lat) / pixel_size).astype(np.int64)
+    center_pixels = center_rows * xsize + center_cols
+
+    geometry = warp_geometry.map_pixels_to_cells(
+        pixel_lon_lat, center_pixels, spatial_resolution, extent
+    )
+    return geometry, (ysize, xsize), center_pixels
+
+
+class TestWarpGeometry(unittest.TestCase):
+    def setUp(self):
+        self.extent = [-44.0, -23.0, -43.7, -22.7]
+        self.rng = np.random.default_rng(0)
+
+    def test_finer_grid_than_the_pixels_fills_every_cell(self):
+        geometry, shape, center_pixels = build_lon_lat_geometry(0.03, 0.01, self.extent)
+        values = self.rng.normal(size=shape)
+
+        cropped = warp_geometry.apply_warp_geometry(values, geometry)
+
+        self.assertEqual(cropped.shape, (30, 30))
+        self.assertFalse(np.isnan(cropped).any())
+        # a cell gets the pixel whose center it contains or, if none, that covers its center
+        np.testing.assert_array_equal(
+            cropped.ravel(), values.ravel()[center_pixels].astype(np.float32)
+        )
+
+    def test_coarser_grid_takes_the_max_of_the_pixels(self):
+        geometry, shape, _ = build_lon_lat_geometry(0.01, 0.05, self.extent)
+        values = self.rng.normal(size=shape)
+
+        cropped = warp_geometry.apply_warp_geometry(values, geometry)
+
+        expected = values.reshape(6, 5, 6, 5).max(axis=(1, 3))
+        np.testing.assert_allclose(cropped, expected.astype(np.float32))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils import windowing
+
+
+class TestWindowingFunctions(unittest.TestCase):
+    def setUp(self):
+        timestamps = pd.date_range("2020-01-01", periods=20, freq="h")
+        # gaps after positions 5 and 7, so blocks of 6, 2 and 10 rows
+        self.timestamps = timestamps.delete([6, 9]).values
+        self.arr = np.arange(18 * 3, dtype=np.float64).reshape(18, 3)
+
+    def test_find_contiguous_block_bounds(self):
+        starts, ends = windowing.find_contiguous_block_bounds(self.timestamps)
+        self.assertTrue(np.array_equal(starts, [0, 6, 8]))
+        self.assertTrue(np.array_equal(ends, [5, 7, 17]))
+
+    def test_find_contiguous_block_bounds_without_gaps(self):
+        timestamps = pd.date_range("2020-01-01", periods=5, freq="h").values
+        starts, ends = windowing.find_contiguous_block_bounds(timestamps)
+        self.assertTrue(np.array_equal(starts, [0]))
+        self.assertTrue(np.array_equal(ends, [4]))
+
+    def test_apply_block_windowing_matches_apply_windowing(self):
+        window_size = 3
+        target_idx = 1
+        starts, ends = windowing.find_contiguous_block_bounds(self.timestamps)
+        X, y = windowing.apply_block_windowing(
+            self.arr, starts, ends, window_size, target_idx
+        )
+
+        expected_X = []
+        expected_y = []
+        for start, end in zip(starts, ends):
+            block = self.arr[start : end + 1]
+            if len(block) < window_size + 1:
+                continue
+            X_block, y_block = windowing.apply_windowing(
+                block,
+                initial_time_step=0,
+                max_time_step=len(block) - window_size - 1,
+                window_size=window_size,
+                target_idx=target_idx,
+            )
+            expected_X.append(X_block)
+            expected_y.append(y_block.reshape(-1, 1))
+
+        self.assertTrue(np.array_equal(X, np.concatenate(expected_X)))
+        self.assertTrue(np.array_equal(y, np.concatenate(expected_y)))
+        self.assertEqual(X.shape, (3 + 7, window_size, 3))
+
+    def test_lazy_block_windowing_matches_apply_block_windowing(self):
+        starts, ends = windowing.find_contiguous_block_bounds(self.timestamps)
+        for window_size in (1, 3, 6, 10):
+            X, y = windowing.apply_block_windowing(
+                self.arr, starts, ends, window_size, 1
+            )
+            lazy_X, lazy_y = windowing.apply_lazy_block_windowing(
+                self.arr, starts, ends, window_size, 1
+            )
+            self.assertEqual(lazy_X.shape, X.shape)
+            self.assertTrue(np.array_equal(lazy_X.to_array(), X))
+            self.assertTrue(np.array_equal(lazy_y, y))
+
+    def test_windowed_series_selects_windows_without_copying(self):
+        starts, ends = windowing.find_contiguous_block_bounds(self.timestamps)
+        X, _ = windowing.apply_block_windowing(self.arr, starts, ends, 3, 0)
+        lazy_X, _ = windowing.apply_lazy_block_windowing(self.arr, starts, ends, 3, 0)
+
+        subset = lazy_X[[7, 0, 4]]
+        self.assertIs(subset.series, self.arr)
+        self.assertTrue(np.array_equal(subset.take([1, 2]), X[[0, 4]]))
+        self.assertTrue(np.array_equal(np.asarray(lazy_X[2:5]), X[2:5]))
+        self.assertTrue(np.array_equal(lazy_X[9], X[9]))
+        # the last row of a block is only a target, and rows 6-7 are a block too short
+        self.assertTrue(
+            np.array_equal(np.flatnonzero(~lazy_X.get_rows_in_windows()), [5, 6, 7, 17])
+        )
+
+    def test_apply_sliding_window_windows_each_block_of_the_index(self):
+        df = pd.DataFrame(self.arr, index=self.timestamps, columns=["a", "b", "c"])
+        starts, ends = windowing.find_contiguous_block_bounds(self.timestamps)
+        expected_X, expected_y = windowing.apply_block_windowing(
+            self.arr, starts, ends, 3, 2
+        )
+
+        X, y = windowing.apply_sliding_window(df, 2, 3)
+        lazy_X, lazy_y = windowing.apply_sliding_window(df, 2, 3, lazy=True)
+
+        self.assertTrue(np.array_equal(X, expected_X))
+        self.assertTrue(np.array_equal(y, expected_y))
+        self.assertTrue(np.array_equal(lazy_X.to_array(), expected_X))
+        self.assertTrue(np.array_equal(lazy_y, expected_y))
+
+    def test_get_block_windows_are_views(self):
+        starts, ends = windowing.find_contiguous_block_bounds(self.timestamps)
+        for windows, _ in windowing.get_block_windows(self.arr, starts, ends, 3, 0):
+            self.assertTrue(np.shares_memory(windows, self.arr))
+
+
+if __name__ == "__main__":
+    unittest.main()